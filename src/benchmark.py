@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Offline benchmark of index parsing, cleaning and section extraction on a synthetic EDGAR corpus.
+
+Usage:
+    edgar_bench.py run [--filings=INT] [--index-lines=INT] [--scale=FLOAT] [--seed=INT] [--workers=INT] [--repeat=INT] [--output=PATH]
+    edgar_bench.py compare <baseline> <current> [--threshold=FLOAT]
+
+Options:
+    -h, --help
+    --filings=INT                   Number of synthetic 10-K filings [default: 40].
+    --index-lines=INT               Number of synthetic index lines (spread over four quarters) [default: 100000].
+    --scale=FLOAT                   Scale factor of filing sizes [default: 1.0].
+    --seed=INT                      Random seed of the corpus generator [default: 2020].
+    --workers=INT                   Number of worker processes [default: 1].
+    --repeat=INT                    Number of runs per stage (the fastest run is reported) [default: 3].
+    --output=PATH                   Path to JSON results (defaults to `output/benchmark/bench_{timestamp}.json`).
+    --threshold=FLOAT               Relative throughput loss reported as regression [default: 0.1].
+
+Each run generates the corpus in a temporary directory and times the stages `index`
+(`indexing.ingest_quarter`), `clean_tok` (`parsing.clean_filings` with the tokenizer engine, after which the
+raw filings are generated again), `clean` (`parsing.clean_filings`), `mda` (`parsing.extract_mda`),
+`mda_mmap` (the same extraction over memory-mapped bytes) and `item1` (`parsing.extract_item1`) in a fresh process each, so that the reported peak memory
+(maximum resident set size of the stage and its workers) belongs to a single stage.
+"""
+
+
+import base64
+import contextlib
+import datetime as dt
+import io
+import json
+import math
+import multiprocessing as mp
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from docopt import docopt
+
+import indexing
+import manifest
+import parsing
+import section_index
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak memory is not reported there
+    resource = None
+
+
+STAGES = ['index', 'clean_tok', 'clean', 'mda', 'mda_mmap', 'item1']
+YEAR = 2020
+
+WORDS = ('the company our net sales revenue increased decreased compared to prior fiscal year primarily due higher lower '
+         'operating expenses cost of products services customers market demand growth segment results income tax rate '
+         'cash flows liquidity capital resources investments debt interest foreign currency exchange risk factors may '
+         'could adversely affect business financial condition competition suppliers manufacturing distribution '
+         'research development new product introductions acquisitions goodwill impairment share repurchases dividends '
+         'management believes estimates assumptions accounting policies critical judgments employees regulatory').split()
+
+ITEMS = [
+    # (heading, title, relative share of the paragraphs, relative share of the tables)
+    ('PART I', None, 0, 0),
+    ('Item 1.', 'Business', 20, 4),
+    ('Item 1A.', 'Risk Factors', 20, 0),
+    ('Item 1B.', 'Unresolved Staff Comments', 1, 0),
+    ('Item 2.', 'Properties', 2, 1),
+    ('Item 3.', 'Legal Proceedings', 2, 0),
+    ('Item 4.', 'Mine Safety Disclosures', 1, 0),
+    ('PART II', None, 0, 0),
+    ('Item 5.', 'Market for Registrant&#8217;s Common Equity, Related Stockholder Matters and Issuer Purchases of '
+                'Equity Securities', 3, 3),
+    ('Item 6.', 'Selected Financial Data', 1, 2),
+    ('Item 7.', 'Management&#8217;s Discussion and Analysis of Financial Condition and Results of Operations', 25, 20),
+    ('Item 7A.', 'Quantitative and Qualitative Disclosures About Market Risk', 3, 3),
+    ('Item 8.', 'Financial Statements and Supplementary Data', 12, 60),
+    ('Item 9.', 'Changes in and Disagreements with Accountants on Accounting and Financial Disclosure', 1, 0),
+    ('Item 9A.', 'Controls and Procedures', 3, 0),
+    ('PART III', None, 0, 0),
+    ('Item 10.', 'Directors, Executive Officers and Corporate Governance', 1, 0),
+    ('Item 11.', 'Executive Compensation', 1, 2),
+    ('PART IV', None, 0, 0),
+    ('Item 15.', 'Exhibits and Financial Statement Schedules', 2, 2),
+]
+
+EXHIBITS = ['EX-4.1', 'EX-10.1', 'EX-21.1', 'EX-23.1', 'EX-31.1', 'EX-31.2', 'EX-32.1', 'EX-101.INS', 'EX-101.SCH',
+            'EX-101.CAL', 'EX-101.LAB', 'EX-101.PRE', 'GRAPHIC', 'GRAPHIC', 'ZIP', 'EXCEL', 'XML', 'JSON']
+
+FORM_TYPES = [('4', 40), ('8-K', 20), ('SC 13G/A', 8), ('10-Q', 8), ('424B2', 8), ('D', 5), ('10-K', 3),
+              ('S-8', 2), ('10-K/A', 1), ('10-Q/A', 1), ('DEF 14A', 2), ('13F-HR', 2)]
+
+
+def sentence(rng: random.Random):
+    """ Random sentence of financial vocabulary (with the occasional HTML entity) """
+    words = rng.choices(WORDS, k=rng.randint(8, 28))
+    if rng.random() < 0.2:
+        words[rng.randrange(len(words))] += '&#8217;s'
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), '&amp;')
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(rng: random.Random, sentences: list):
+    return (f'<p style="margin-top:6pt;margin-bottom:0pt;text-align:justify"><font style="font-family:Times New Roman;'
+            f'font-size:10pt">{" ".join(rng.choices(sentences, k=rng.randint(2, 8)))}</font></p>\n')
+
+
+def heading(txt: str):
+    return f'<div style="margin-top:12pt"><font style="font-family:Times New Roman;font-weight:bold">{txt}</font></div>\n'
+
+
+def number_table(rng: random.Random):
+    """ Number-heavy financial statement table (dropped during cleaning) """
+    n_cols = rng.randint(2, 4)
+    rows = []
+    for _ in range(rng.randint(8, 40)):
+        label = ' '.join(rng.choices(WORDS, k=rng.randint(1, 4))).capitalize()
+        cells = ''.join(f'<td style="text-align:right">$</td><td style="text-align:right">{rng.randint(0, 999_999):,}</td>'
+                        for _ in range(n_cols))
+        rows.append(f'<tr><td style="padding-left:10pt">{label}</td><td>&nbsp;</td>{cells}</tr>\n')
+    years = ''.join(f'<td colspan="2" style="text-align:center">{YEAR - i}</td>' for i in range(n_cols))
+    return f'<table style="border-collapse:collapse;width:100%">\n<tr><td>&nbsp;</td><td>&nbsp;</td>{years}</tr>\n{"".join(rows)}</table>\n'
+
+
+def text_table(rng: random.Random, sentences: list):
+    """ Text-heavy table, e.g. a bulleted list laid out as a table (retained during cleaning) """
+    rows = ''.join(f'<tr><td style="width:5%">&#8226;</td><td>{rng.choice(sentences)}</td></tr>\n'
+                   for _ in range(rng.randint(2, 8)))
+    return f'<table style="width:100%">\n{rows}</table>\n'
+
+
+def toc_table():
+    """ Table of contents listing all items with page numbers """
+    rows = ''.join(f'<tr><td>{item}</td><td>{title or ""}</td><td>{3 * i + 1}</td></tr>\n'
+                   for i, (item, title, _, _) in enumerate(ITEMS))
+    return f'<p style="text-align:center">TABLE OF CONTENTS</p>\n<table style="width:100%">\n{rows}</table>\n'
+
+
+def exhibit(rng: random.Random, doc_type: str, seq: int, size: int):
+    """ Embedded non-text document (exhibit, XBRL instance, uuencoded graphic, ...) of about `size` characters """
+    if doc_type.startswith('EX-101') or doc_type in ('XML', 'JSON'):
+        facts, n = [], 0
+        while n < size:
+            tag = f'us-gaap:{rng.choice(WORDS).capitalize()}{rng.choice(WORDS).capitalize()}'
+            facts.append(f'<{tag} contextRef="FY{YEAR}" unitRef="usd" decimals="-6">{rng.randint(0, 10 ** 9)}</{tag}>\n')
+            n += len(facts[-1])
+        body = f'<XBRL>\n<?xml version="1.0" encoding="utf-8"?>\n<xbrli:xbrl>\n{"".join(facts)}</xbrli:xbrl>\n</XBRL>\n'
+    elif doc_type in ('GRAPHIC', 'ZIP', 'EXCEL'):
+        n = size * 3 // 4 + 1
+        data = base64.b64encode(rng.getrandbits(8 * n).to_bytes(n, 'little')).decode()
+        lines = '\n'.join('M' + data[i:i + 60] for i in range(0, len(data), 60))
+        body = f'begin 644 {doc_type.lower()}{seq}.bin\n{lines}\nend\n'
+    else:
+        sentences = [sentence(rng) for _ in range(20)]
+        paras, n = [], 0
+        while n < size:
+            paras.append(paragraph(rng, sentences))
+            n += len(paras[-1])
+        body = f'<html><body>\n{"".join(paras)}</body></html>\n'
+    return (f'<DOCUMENT>\n<TYPE>{doc_type}\n<SEQUENCE>{seq}\n<FILENAME>{doc_type.lower()}{seq}.htm\n<TEXT>\n'
+            f'{body}</TEXT>\n</DOCUMENT>\n')
+
+
+def synthetic_filing(rng: random.Random, accession: str, cik: int, comp_name: str, date_filed: str,
+                     scale: float = 1.0):
+    """ Generate a synthetic raw 10-K filing (SGML header, HTML main document and embedded documents)
+    :param random.Random rng:
+        Random number generator
+    :param str accession:
+        Accession number
+    :param int cik:
+        Central index key
+    :param str comp_name:
+        Company name
+    :param str date_filed:
+        Filing date (YYYYMMDD)
+    :param float scale:
+        Scale factor of the filing size
+    :return str:
+        Raw filing
+    """
+    header = (f'<SEC-DOCUMENT>{accession}.txt : {date_filed}\n<SEC-HEADER>{accession}.hdr.sgml : {date_filed}\n'
+              f'<ACCEPTANCE-DATETIME>{date_filed}160512\nACCESSION NUMBER:\t\t{accession}\n'
+              f'CONFORMED SUBMISSION TYPE:\t10-K\nPUBLIC DOCUMENT COUNT:\t\t{rng.randint(20, 120)}\n'
+              f'CONFORMED PERIOD OF REPORT:\t{YEAR - 1}1231\nFILED AS OF DATE:\t\t{date_filed}\n'
+              f'DATE AS OF CHANGE:\t\t{date_filed}\n\nFILER:\n\n\tCOMPANY DATA:\t\n'
+              f'\t\tCOMPANY CONFORMED NAME:\t\t\t{comp_name}\n\t\tCENTRAL INDEX KEY:\t\t\t{cik:010d}\n'
+              f'\t\tSTANDARD INDUSTRIAL CLASSIFICATION:\tSERVICES-PREPACKAGED SOFTWARE [{rng.randint(1000, 9999)}]\n'
+              f'\t\tFISCAL YEAR END:\t\t\t1231\n\n\tBUSINESS ADDRESS:\t\n\t\tSTREET 1:\t\t{rng.randint(1, 999)} MAIN STREET\n'
+              f'\t\tCITY:\t\t\tSPRINGFIELD\n\t\tSTATE:\t\t\tIL\n\t\tZIP:\t\t\t{rng.randint(10000, 99999)}\n'
+              f'\t\tBUSINESS PHONE:\t\t{rng.randint(200, 999)}-555-{rng.randint(1000, 9999)}\n</SEC-HEADER>\n')
+
+    # main document: size of the text body and number of tables follow log-normal distributions
+    sentences = [sentence(rng) for _ in range(200)]
+    n_paras = max(len(ITEMS), int(rng.lognormvariate(math.log(300), 0.5) * scale))
+    n_tables = int(rng.lognormvariate(math.log(60), 0.6) * scale)
+    para_weights = sum(item[2] for item in ITEMS)
+    table_weights = sum(item[3] for item in ITEMS)
+    body = [toc_table()]
+    for item, title, w_para, w_table in ITEMS:
+        body.append(heading(item if title is None else f'{item} {title}'))
+        blocks = [paragraph(rng, sentences) for _ in range(round(n_paras * w_para / para_weights))]
+        for _ in range(round(n_tables * w_table / table_weights)):
+            table = text_table(rng, sentences) if rng.random() < 0.15 else number_table(rng)
+            blocks.insert(rng.randint(0, len(blocks)), table)
+        body += blocks
+    main = (f'<DOCUMENT>\n<TYPE>10-K\n<SEQUENCE>1\n<FILENAME>form10-k.htm\n<DESCRIPTION>10-K\n<TEXT>\n'
+            f'<html><head><title>10-K</title></head><body>\n{"".join(body)}</body></html>\n</TEXT>\n</DOCUMENT>\n')
+
+    # embedded documents make up most of the raw filing size
+    docs = [exhibit(rng, doc_type, seq, int(rng.lognormvariate(math.log(40_000), 1.0) * scale))
+            for seq, doc_type in enumerate(rng.choices(EXHIBITS, k=rng.randint(4, 16)), start=2)]
+    return header + main + ''.join(docs) + '</SEC-DOCUMENT>\n'
+
+
+def generate_corpus(n_filings: int = 40, n_index_lines: int = 100_000, scale: float = 1.0, seed: int = 2020):
+    """ Write synthetic index files and raw 10-K filings of four quarters to `output` in the current directory
+    :param int n_filings:
+        Number of synthetic 10-K filings
+    :param int n_index_lines:
+        Number of synthetic index lines (spread over four quarters)
+    :param float scale:
+        Scale factor of filing sizes
+    :param int seed:
+        Random seed
+    :return dict:
+        Corpus statistics
+    """
+    rng = random.Random(seed)
+    forms, weights = zip(*FORM_TYPES)
+    stats = {'filings': n_filings, 'index_lines': 0, 'mb_index': 0.0, 'mb_raw': 0.0}
+    path_ind_dir = Path('output', 'index')
+    path_ind_dir.mkdir(parents=True, exist_ok=True)
+
+    for qtr in range(1, 4 + 1):
+        lines = ['Description:           Master Index of EDGAR Dissemination Feed', f'Last Data Received:    {YEAR}',
+                 'Comments:              webmaster@sec.gov', 'Anonymous FTP:         ftp://ftp.sec.gov/edgar/',
+                 '', '', '', 'CIK|Company Name|Form Type|Date Filed|Filename',
+                 '--------------------------------------------------------------------------------']
+        seq = 0
+        for i in range(qtr - 1, n_filings, 4):
+            seq += 1
+            cik, date_filed = 1_000_000 + i, f'{YEAR}-{3 * qtr - 2:02d}-{rng.randint(1, 28):02d}'
+            accession, comp_name = f'{cik:010d}-{YEAR % 100:02d}-{seq:06d}', f'SYNTHETIC COMPANY {i} INC'
+            txt = synthetic_filing(rng, accession, cik, comp_name, date_filed.replace('-', ''), scale)
+            path_file = Path('output', 'filings', '10-k', str(YEAR), f'q{qtr}', f'{accession}.txt')
+            path_file.parent.mkdir(parents=True, exist_ok=True)
+            path_file.write_text(txt, encoding='utf-8')
+            stats['mb_raw'] += path_file.stat().st_size / 2**20
+            lines.append(f'{cik}|{comp_name}|10-K|{date_filed}|edgar/data/{cik}/{accession}.txt')
+        for _ in range(n_index_lines // 4):
+            seq += 1
+            cik = rng.randint(1_000, 1_900_000)
+            lines.append(f'{cik}|{" ".join(rng.choices(WORDS, k=2)).upper()} CORP|{rng.choices(forms, weights)[0]}|'
+                         f'{YEAR}-{3 * qtr - 2:02d}-{rng.randint(1, 28):02d}|edgar/data/{cik}/{cik:010d}-{YEAR % 100:02d}-{seq:06d}.txt')
+        path_ind = Path(path_ind_dir, f'{YEAR}_q{qtr}.idx')
+        path_ind.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        stats['index_lines'] += len(lines) - 9
+        stats['mb_index'] += path_ind.stat().st_size / 2**20
+    return stats
+
+
+def peak_memory():
+    """ Maximum resident set size of the current process and its (finished) children in MB """
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    unit = 2**20 if sys.platform == 'darwin' else 2**10
+    rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    try:
+        # `ru_maxrss` survives exec, i.e. includes the parent process; the high-water mark of /proc does not
+        with open('/proc/self/status', encoding='utf-8') as f:
+            rss_self = next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 2**10
+    except (OSError, StopIteration):
+        pass
+    return max(rss_self, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
+
+def run_stage(stage: str, workers: int):
+    """ Time a single stage on the corpus in the current directory (run in a fresh process)
+    :return tuple:
+        Seconds and peak memory in MB
+    """
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            t0 = time.perf_counter()
+            if stage == 'index':
+                con = indexing.connect()
+                for qtr in range(1, 4 + 1):
+                    indexing.ingest_quarter(con, YEAR, qtr, force=True)
+                con.close()
+            elif stage == 'clean_tok':
+                parsing.clean_filings(YEAR, YEAR, '10-k', workers, engine='tokenizer')
+            elif stage == 'clean':
+                parsing.clean_filings(YEAR, YEAR, '10-k', workers)
+            elif stage == 'mda':
+                parsing.extract_mda(YEAR, YEAR, '10-k', workers)
+            elif stage == 'mda_mmap':
+                parsing.extract_mda(YEAR, YEAR, '10-k', workers, use_mmap=True)
+            elif stage == 'item1':
+                parsing.extract_item1(YEAR, YEAR, '10-k', workers)
+            seconds = time.perf_counter() - t0
+    except Exception as e:
+        # the output of the stage is captured, hence it is passed on with the error
+        raise RuntimeError(f'Stage {stage} failed with output:\n{output.getvalue()}') from e
+    return seconds, peak_memory()
+
+
+def reset_sections(section: str):
+    """ Remove extracted sections of the corpus from the manifest and section index, so that they are extracted
+    again """
+    con = manifest.connect('10-k')
+    with con:
+        con.execute('DELETE FROM manifest WHERE stage = ?', (section,))
+    con.close()
+    con = section_index.connect('10-k')
+    with con:
+        con.execute('DELETE FROM sections WHERE section = ?', (section,))
+    con.close()
+
+
+def corpus_size():
+    """ Number and total size in MB of the filings in the corpus """
+    filings = parsing.list_filings(YEAR, YEAR, '10-k')
+    return len(filings), sum(f.stat().st_size for f in filings) / 2**20
+
+
+def git_commit():
+    """ Current commit of the repository (None if not available) """
+    try:
+        cwd = Path(__file__).resolve().parent
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd, capture_output=True, text=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd,
+                                capture_output=True, text=True)
+        return commit.stdout.strip() + ('-dirty' if status.stdout.strip() else '') or None
+    except OSError:
+        return None
+
+
+def run_benchmark(n_filings: int = 40, n_index_lines: int = 100_000, scale: float = 1.0, seed: int = 2020,
+                  workers: int = 1, repeat: int = 3, path_output: Path = None):
+    """ Benchmark all stages on a freshly generated synthetic corpus and write results to JSON
+    :param int n_filings:
+        Number of synthetic 10-K filings
+    :param int n_index_lines:
+        Number of synthetic index lines (spread over four quarters)
+    :param float scale:
+        Scale factor of filing sizes
+    :param int seed:
+        Random seed of the corpus generator
+    :param int workers:
+        Number of worker processes
+    :param int repeat:
+        Number of runs per stage (the fastest run is reported)
+    :param Path path_output:
+        Path to JSON results
+    :return dict:
+        Benchmark results
+    """
+    created = dt.datetime.now()
+    if path_output is None:
+        path_output = Path('output', 'benchmark', f'bench_{created.strftime("%Y%m%d_%H%M%S")}.json')
+    path_output = path_output.resolve()
+    ctx = mp.get_context('spawn')
+    runs = {stage: [] for stage in STAGES}
+    sizes, found = {}, {}
+    cwd = os.getcwd()
+
+    for i in range(repeat):
+        # cleaning works in place and reruns are skipped via the manifest, hence every run needs a fresh corpus
+        with tempfile.TemporaryDirectory(prefix='edgar_bench_') as tmp:
+            os.chdir(tmp)
+            try:
+                corpus = generate_corpus(n_filings, n_index_lines, scale, seed)
+                sizes['index'] = (corpus['index_lines'], corpus['mb_index'])
+                sizes['clean'] = sizes['clean_tok'] = (n_filings, corpus['mb_raw'])
+                for stage in STAGES:
+                    if stage == 'clean':
+                        # the tokenizer cleaned the filings in place, hence the raw filings are generated again
+                        generate_corpus(n_filings, n_index_lines, scale, seed)
+                    if stage in ('mda', 'mda_mmap', 'item1'):
+                        sizes[stage] = corpus_size()
+                    if stage == 'mda_mmap':
+                        reset_sections('mda')
+                    # errors of the stage are raised here instead of leaving the benchmark waiting for its result
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        runs[stage].append(pool.submit(run_stage, stage, workers).result())
+                    if stage in ('mda', 'mda_mmap', 'item1'):
+                        section = stage.split('_')[0]
+                        con = section_index.connect('10-k')
+                        found[stage] = len(section_index.select(con, section, YEAR, YEAR, min_length=0))
+                        con.close()
+            finally:
+                os.chdir(cwd)
+        print(f'Run {i + 1}/{repeat} completed: ' + ', '.join(f'{s} {runs[s][-1][0]:.2f}s' for s in STAGES))
+
+    results = {
+        'commit': git_commit(),
+        'created': created.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {'filings': n_filings, 'index_lines': n_index_lines, 'scale': scale, 'seed': seed,
+                   'workers': workers, 'repeat': repeat},
+        'corpus': corpus,
+        'stages': {},
+    }
+    print(f'\n{"stage":<10}{"seconds":>10}{"MB":>10}{"MB/s":>10}{"filings/s":>12}{"peak MB":>10}')
+    for stage in STAGES:
+        n, mb = sizes[stage]
+        seconds = min(s for s, _ in runs[stage])
+        peaks = [p for _, p in runs[stage] if p is not None]
+        results['stages'][stage] = {
+            'seconds': seconds,
+            'runs': [s for s, _ in runs[stage]],
+            'mb': mb,
+            'mb_per_s': mb / seconds,
+            'filings_per_s': n / seconds,
+            'peak_rss_mb': max(peaks) if peaks else None,
+        }
+        if stage in found:
+            results['stages'][stage]['sections_found'] = found[stage]
+        r = results['stages'][stage]
+        print(f'{stage:<10}{seconds:>10.2f}{mb:>10.1f}{r["mb_per_s"]:>10.2f}{r["filings_per_s"]:>12.1f}'
+              f'{r["peak_rss_mb"] or float("nan"):>10.1f}')
+
+    path_output.parent.mkdir(parents=True, exist_ok=True)
+    with path_output.open('w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nBenchmark results written to {path_output}')
+    return results
+
+
+def compare_benchmarks(path_baseline: Path, path_current: Path, threshold: float = 0.1):
+    """ Compare throughput of two benchmark results
+    :param Path path_baseline:
+        Path to JSON results of the baseline
+    :param Path path_current:
+        Path to JSON results to be compared against the baseline
+    :param float threshold:
+        Relative throughput loss reported as regression
+    :return bool:
+        True if no stage regressed
+    """
+    baseline = json.loads(path_baseline.read_text(encoding='utf-8'))
+    current = json.loads(path_current.read_text(encoding='utf-8'))
+    if baseline['params'] != current['params']:
+        print(f'Warning: benchmark parameters differ ({baseline["params"]} vs. {current["params"]})!')
+
+    ok = True
+    print(f'{"stage":<10}{baseline["commit"] or "baseline":>18}{current["commit"] or "current":>18}{"change":>10}')
+    for stage, b in baseline['stages'].items():
+        c = current['stages'].get(stage)
+        if c is None:
+            continue
+        change = c['mb_per_s'] / b['mb_per_s'] - 1
+        regression = change < -threshold
+        ok &= not regression
+        print(f'{stage:<10}{b["mb_per_s"]:>13.2f} MB/s{c["mb_per_s"]:>13.2f} MB/s{change:>+10.1%}'
+              f'{"  REGRESSION" if regression else ""}')
+    return ok
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['run']:
+        run_benchmark(int(args['--filings']), int(args['--index-lines']), float(args['--scale']), int(args['--seed']),
+                      int(args['--workers']), int(args['--repeat']), Path(args['--output']) if args['--output'] else None)
+    elif args['compare']:
+        sys.exit(0 if compare_benchmarks(Path(args['<baseline>']), Path(args['<current>']),
+                                         float(args['--threshold'])) else 1)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Near-duplicate detection of extracted sections (or cleaned filings) by MinHash and locality-sensitive hashing.
+
+Usage:
+    edgar_dedup.py dedup-sections [--start=INT] [--end=INT] [--form-types=STR] [--section-type=STR] [--min-sec-length=INT] [--threshold=FLOAT] [--num-perm=INT] [--shingle-size=INT] [--seed=INT] [--workers=INT] [--same-cik]
+
+Options:
+    -h, --help
+    --start=INT                     Start year [default: 1996].
+    --end=INT                       End year [default: 2020].
+    --form-types=STR                Comma-separated form types, e.g. 10-k,10-k/a to detect amendments repeating the original [default: 10-k].
+    --section-type=STR              Section type (one of: mda, item1, filing for whole cleaned filings) [default: mda].
+    --min-sec-length=INT            Minimum length of section in characters (shorter sections are not clustered) [default: 2500].
+    --threshold=FLOAT               Minimum estimated Jaccard similarity of the shingles of near-duplicates [default: 0.8].
+    --num-perm=INT                  Number of hash functions of a MinHash signature [default: 128].
+    --shingle-size=INT              Number of words per shingle [default: 5].
+    --seed=INT                      Random seed of the hash functions [default: 2020].
+    --workers=INT                   Number of worker processes computing signatures [default: 1].
+    --same-cik                      Only cluster documents of the same filer.
+
+Each document (section or cleaned filing) is shingled into overlapping word n-grams, whose MinHash signature
+estimates the Jaccard similarity of two documents. The signature is split into bands; documents sharing a band
+are candidates, and a document joins the cluster of its most similar candidate if their estimated similarity
+reaches the threshold (otherwise it starts a cluster of its own and represents it). Documents are processed in
+a single streaming pass in path order (i.e. the earliest new filing represents a new cluster), and signatures and band
+hashes are kept in `output/filings/dedup.sqlite` rather than in memory, so memory is bounded regardless of the
+number of documents. Reruns only process documents that are new or were re-extracted since the last run (documents
+without words are stored with an empty signature, so they are not re-read either) and remove documents of the
+form types and years that are no longer indexed.
+"""
+
+
+import datetime as dt
+import functools
+import hashlib
+import sqlite3
+import zlib
+from pathlib import Path
+
+import numpy as np
+from docopt import docopt
+from tqdm import tqdm
+
+import indexing
+import parsing
+import search
+import section_index
+import storage
+
+
+BATCH_SIZE = 10_000
+FILING = 'filing'
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS params (
+    section TEXT PRIMARY KEY,
+    num_perm INTEGER NOT NULL,
+    shingle_size INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    bands INTEGER NOT NULL,
+    threshold REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    section TEXT NOT NULL,
+    form_type TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    cik INTEGER,
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    signature BLOB NOT NULL, -- empty if the document has no words (never clustered with other documents)
+    cluster INTEGER NOT NULL, -- doc id of the representative of the cluster
+    similarity REAL, -- estimated Jaccard similarity with the matching document (NULL for representatives)
+    updated TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_docs_path ON docs (path, section);
+CREATE INDEX IF NOT EXISTS ix_docs_cluster ON docs (section, cluster);
+CREATE TABLE IF NOT EXISTS bands (
+    section TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (section, band, hash, doc_id)
+) WITHOUT ROWID;
+"""
+
+
+def connect():
+    """ Open (and if necessary create) the deduplication store
+    :return sqlite3.Connection:
+        Connection to deduplication store (write to `output/filings/dedup.sqlite`)
+    """
+    path_db = Path('output', 'filings', 'dedup.sqlite')
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def lsh_bands(threshold: float, num_perm: int):
+    """ Number of bands (of `num_perm // bands` rows each) whose S-curve threshold `(1 / bands) ** (1 / rows)` is
+    closest to `threshold` without exceeding it (candidates are verified, hence recall is favored) """
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1)]
+    return max(((b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold),
+               key=lambda o: (1 / o[0]) ** (1 / o[1]), default=(num_perm, 1))[0]
+
+
+@functools.lru_cache(maxsize=None)
+def hash_params(num_perm: int, seed: int):
+    """ Multipliers (odd) and increments of the multiply-add-shift hash functions of a signature """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 64, num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+    b = rng.integers(0, 2 ** 64, num_perm, dtype=np.uint64, endpoint=False)
+    return a[:, None], b[:, None]
+
+
+def minhash(txt: str, num_perm: int = 128, shingle_size: int = 5, seed: int = 2020, chunk_size: int = 4096):
+    """ MinHash signature of the word shingles of a text
+    :param str txt:
+        Text
+    :param int num_perm:
+        Number of hash functions
+    :param int shingle_size:
+        Number of words per shingle
+    :param int seed:
+        Random seed of the hash functions
+    :param int chunk_size:
+        Number of shingles hashed at once (bounds memory for long documents)
+    :return np.ndarray:
+        Signature (`num_perm` 32-bit minimum hash values; None if the text has no words)
+    """
+    words = search.tokenize(txt)
+    if not words:
+        return None
+    n = max(1, len(words) - shingle_size + 1)
+    shingles = np.fromiter((zlib.crc32(' '.join(words[i:i + shingle_size]).encode('utf-8')) for i in range(n)),
+                           dtype=np.uint64, count=n)
+    a, b = hash_params(num_perm, seed)
+    signature = np.full(num_perm, 2 ** 32 - 1, dtype=np.uint64)
+    for i in range(0, n, chunk_size):
+        # multiply-add-shift hashing: the upper 32 bits of (a * x + b) mod 2^64
+        hashes = (a * shingles[None, i:i + chunk_size] + b) >> np.uint64(32)
+        signature = np.minimum(signature, hashes.min(axis=1))
+    return signature.astype(np.uint32)
+
+
+def band_hashes(signature: np.ndarray, bands: int):
+    """ Hash of each band of a signature (as signed 64-bit integers for SQLite) """
+    rows = len(signature) // bands
+    return [int.from_bytes(hashlib.blake2b(signature[i * rows:(i + 1) * rows].tobytes(), digest_size=8).digest(),
+                           'little', signed=True) for i in range(bands)]
+
+
+def signature_task(task: tuple, num_perm: int = 128, shingle_size: int = 5, seed: int = 2020):
+    """ Worker function computing the signature of a section (given by its offsets) or a cleaned filing
+    :param tuple task:
+        Path to cleaned filing, start and end offset of the section (None for the whole filing) and path to the
+        materialized section (None if the section is read from the cleaned filing)
+    :return bytes:
+        Signature (empty if the document has no words)
+    """
+    path, start, end, section_path = task
+    if start is None:
+        txt = storage.store_for(Path(path)).read_text(Path(path))
+    else:
+        txt = section_index.read_section({'path': path, 'start': start, 'end': end, 'section_path': section_path})
+    signature = minhash(txt, num_perm, shingle_size, seed)
+    return b'' if signature is None else signature.tobytes()
+
+
+def documents(form_types: tuple, section_type: str, start: int, end: int, min_sec_length: int):
+    """ Documents to be deduplicated in path order (per form type)
+    :return list:
+        Dicts with path, form type, accession, year, quarter, fingerprint and task (see `signature_task`)
+    """
+    docs = []
+    for form_type in form_types:
+        if section_type == FILING:
+            store = storage.get_store(Path('output', 'filings', form_type))
+            for f in parsing.list_filings(start, end, form_type):
+                year, qtr = section_index.quarter_of(f)
+                size, mtime_ns = store.fingerprint(f)
+                docs.append({'path': str(f), 'form_type': form_type, 'accession': f.stem, 'year': year, 'qtr': qtr,
+                             'fingerprint': f'{size}:{mtime_ns}', 'task': (str(f), None, None, None)})
+        else:
+            scon = section_index.connect(form_type)
+            for r in section_index.select(scon, section_type, start, end, min_length=min_sec_length):
+                docs.append({'path': r['path'], 'form_type': form_type, 'accession': r['accession'],
+                             'year': r['year'], 'qtr': r['qtr'],
+                             'fingerprint': f'{r["start"]}:{r["end"]}:{r["updated"]}',
+                             'task': (r['path'], r['start'], r['end'], r['section_path'])})
+            scon.close()
+    return docs
+
+
+def add_document(con: sqlite3.Connection, doc: dict, section_type: str, signature: bytes, bands: int,
+                 threshold: float, same_cik: bool = False):
+    """ Assign a document to the cluster of its most similar candidate (or a cluster of its own) and add its
+    signature and band hashes to the store (committed by the caller)
+    :return float:
+        Estimated Jaccard similarity with the matching document (None if the document represents a new cluster)
+    """
+    # documents without words are stored (so that reruns skip them) but have no bands, i.e. are never candidates
+    sig = np.frombuffer(signature, dtype=np.uint32)
+    hashes = band_hashes(sig, bands) if signature else []
+    candidates = set()
+    for band, h in enumerate(hashes):
+        candidates.update(r[0] for r in con.execute('SELECT doc_id FROM bands WHERE section = ? AND band = ? AND '
+                                                    'hash = ?', (section_type, band, h)))
+    best, similarity = None, None
+    for c in sorted(candidates):
+        row = con.execute('SELECT cik, signature, cluster FROM docs WHERE doc_id = ?', (c,)).fetchone()
+        if same_cik and row['cik'] != doc['cik']:
+            continue
+        s = float(np.mean(np.frombuffer(row['signature'], dtype=np.uint32) == sig))
+        if s >= threshold and (similarity is None or s > similarity):
+            best, similarity = row['cluster'], s
+    doc_id = con.execute('INSERT INTO docs (path, section, form_type, accession, cik, year, qtr, fingerprint, '
+                         'signature, cluster, similarity, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)',
+                         (doc['path'], section_type, doc['form_type'], doc['accession'], doc['cik'], doc['year'],
+                          doc['qtr'], doc['fingerprint'], signature, similarity,
+                          dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+    con.execute('UPDATE docs SET cluster = ? WHERE doc_id = ?', (doc_id if best is None else best, doc_id))
+    con.executemany('INSERT OR IGNORE INTO bands VALUES (?, ?, ?, ?)',
+                    ((section_type, band, h, doc_id) for band, h in enumerate(hashes)))
+    return similarity
+
+
+def remove_document(con: sqlite3.Connection, doc_id: int):
+    """ Remove a document that changed since it was deduplicated (members of its cluster are reassigned to the
+    earliest remaining member, committed by the caller) """
+    row = con.execute('SELECT section, cluster FROM docs WHERE doc_id = ?', (doc_id,)).fetchone()
+    con.execute('DELETE FROM bands WHERE doc_id = ? AND section = ?', (doc_id, row['section']))
+    con.execute('DELETE FROM docs WHERE doc_id = ?', (doc_id,))
+    if row['cluster'] == doc_id:
+        successor = con.execute('SELECT MIN(doc_id) FROM docs WHERE section = ? AND cluster = ?',
+                                (row['section'], doc_id)).fetchone()[0]
+        if successor is not None:
+            con.execute('UPDATE docs SET cluster = ? WHERE section = ? AND cluster = ?',
+                        (successor, row['section'], doc_id))
+            con.execute('UPDATE docs SET similarity = NULL WHERE doc_id = ?', (successor,))
+
+
+def duplicate_paths(con: sqlite3.Connection, section_type: str, form_type: str = None, year: int = None,
+                    qtr: int = None):
+    """ Paths of documents that are near-duplicates of an earlier document (i.e. do not represent their cluster)
+    :param sqlite3.Connection con:
+        Connection to deduplication store
+    :param str section_type:
+        Section type (one of: mda, item1, filing)
+    :param str form_type:
+        Optional form type
+    :param int year:
+        Optional year
+    :param int qtr:
+        Optional quarter
+    :return set:
+        Paths to cleaned filings
+    """
+    query, params = 'SELECT path FROM docs WHERE section = ? AND cluster != doc_id', [section_type]
+    for clause, value in (('form_type = ?', form_type), ('year = ?', year), ('qtr = ?', qtr)):
+        if value is not None:
+            query += f' AND {clause}'
+            params.append(value)
+    return {r[0] for r in con.execute(query, params)}
+
+
+def dedup_sections(start: int, end: int, form_types: tuple = ('10-k',), section_type: str = 'mda',
+                   min_sec_length: int = 2_500, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5,
+                   seed: int = 2020, workers: int = 1, same_cik: bool = False):
+    """ Cluster near-duplicate sections (or cleaned filings) in a single streaming pass (see module docstring)
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :param tuple form_types:
+        Form types (any of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param str section_type:
+        Section type (one of: mda, item1, filing for whole cleaned filings)
+    :param int min_sec_length:
+        Minimum length of section in characters (shorter sections are not clustered)
+    :param float threshold:
+        Minimum estimated Jaccard similarity of near-duplicates
+    :param int num_perm:
+        Number of hash functions of a MinHash signature
+    :param int shingle_size:
+        Number of words per shingle
+    :param int seed:
+        Random seed of the hash functions
+    :param int workers:
+        Number of worker processes computing signatures
+    :param bool same_cik:
+        Only cluster documents of the same filer
+    """
+    if section_type != FILING and section_type not in parsing.SECTION_NAMES:
+        print(f'Section not implemented! Choose from: {", ".join([*parsing.SECTION_NAMES, FILING])}.')
+        return
+    con = connect()
+    bands = lsh_bands(threshold, num_perm)
+    params = con.execute('SELECT num_perm, shingle_size, seed, bands, threshold FROM params WHERE section = ?',
+                         (section_type,)).fetchone()
+    if params is None:
+        with con:
+            con.execute('INSERT INTO params VALUES (?, ?, ?, ?, ?, ?)',
+                        (section_type, num_perm, shingle_size, seed, bands, threshold))
+    elif tuple(params) != (num_perm, shingle_size, seed, bands, threshold):
+        print(f'Signatures of {section_type} were computed with other parameters '
+              f'(num_perm={params[0]}, shingle_size={params[1]}, seed={params[2]}, threshold={params[4]})! '
+              f'Use these parameters or remove the {section_type} documents from the store.')
+        con.close()
+        return
+
+    # a document is (re-)processed if it is not in the store with its current fingerprint, documents of the form
+    # types and years that are no longer indexed (or fell below the minimum length) are removed
+    known = {r['path']: (r['doc_id'], r['fingerprint'])
+             for r in con.execute(f'SELECT doc_id, path, fingerprint FROM docs WHERE section = ? AND year BETWEEN ? '
+                                  f'AND ? AND form_type IN ({",".join("?" * len(form_types))})',
+                                  (section_type, start, end, *form_types))}
+    docs, changed = [], 0
+    for doc in documents(form_types, section_type, start, end, min_sec_length):
+        doc_id, fingerprint = known.pop(doc['path'], (None, None))
+        if fingerprint == doc['fingerprint']:
+            continue
+        if doc_id is not None:
+            remove_document(con, doc_id)
+            changed += 1
+        docs.append(doc)
+    for doc_id, _ in known.values():
+        remove_document(con, doc_id)
+    con.commit()
+
+    icon = indexing.connect()
+    func = functools.partial(signature_task, num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+    duplicates = 0
+    with tqdm(total=len(docs)) as progress:
+        # signatures are computed in batches, so that pending results are bounded
+        for i in range(0, len(docs), BATCH_SIZE):
+            batch = docs[i:i + BATCH_SIZE]
+            for (_, signature), doc in zip(parsing.map_filings(func, [d['task'] for d in batch], workers), batch):
+                progress.update()
+                doc['cik'] = search.filing_metadata(icon, doc['accession'])[0]
+                duplicates += add_document(con, doc, section_type, signature, bands, threshold, same_cik) is not None
+            con.commit()
+    icon.close()
+
+    n_docs, n_clusters = con.execute('SELECT COUNT(*), COUNT(DISTINCT cluster) FROM docs WHERE section = ?',
+                                     (section_type,)).fetchone()
+    n_dup_clusters = con.execute('SELECT COUNT(*) FROM (SELECT cluster FROM docs WHERE section = ? GROUP BY cluster '
+                                 'HAVING COUNT(*) > 1)', (section_type,)).fetchone()[0]
+    con.close()
+    print(f'\n{len(docs)} documents processed ({changed} changed and {len(known)} removed since the last run), '
+          f'{duplicates} near-duplicates found.\nThe store holds {n_docs} {section_type} documents in {n_clusters} clusters, '
+          f'{n_dup_clusters} of which have near-duplicates ({n_docs - n_clusters} documents).')
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['dedup-sections']:
+        dedup_sections(int(args['--start']), int(args['--end']), tuple(args['--form-types'].split(',')),
+                       args['--section-type'], int(args['--min-sec-length']), float(args['--threshold']),
+                       int(args['--num-perm']), int(args['--shingle-size']), int(args['--seed']),
+                       int(args['--workers']), args['--same-cik'])
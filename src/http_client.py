@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Rate-limited HTTP client with keep-alive connection reuse for SEC EDGAR. """
+
+
+import email.utils
+import gzip
+import http.client
+import random
+import threading
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+# SEC fair access policy allows at most 10 requests per second per user agent
+SEC_MAX_RATE = 10
+DEFAULT_RATE = 9.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 1 << 16
+
+
+class HTTPStatusError(Exception):
+    """ Raised for non-retryable (or exhausted) HTTP error responses """
+
+    def __init__(self, url: str, status: int, reason: str = ''):
+        super().__init__(f'HTTP {status} {reason}: {url}')
+        self.url = url
+        self.status = status
+
+
+class RateLimiter:
+    """ Thread-safe token bucket shared by all download workers """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = 1):
+        if rate > SEC_MAX_RATE:
+            raise ValueError(f'Rate must not exceed SEC limit of {SEC_MAX_RATE} requests/s')
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Block until a request token is available """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after(value: str):
+    """ Parse `Retry-After` header (delta-seconds or HTTP-date) into seconds
+    :param str value:
+        Raw header value
+    :return float:
+        Seconds to wait or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class EdgarClient:
+    """ HTTP client that reuses one keep-alive connection per thread and host,
+    throttles all requests through a shared token bucket and retries transient
+    errors with exponential backoff and full jitter (honoring `Retry-After`) """
+
+    def __init__(self, user_agent: str,
+                 rate: float = DEFAULT_RATE,
+                 timeout: float = 20,
+                 max_retries: int = 10,
+                 backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.headers = {'User-Agent': user_agent,
+                        'Accept-Encoding': 'gzip',
+                        'Connection': 'keep-alive'}
+        self.limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.local = threading.local()
+
+    def _connection(self, scheme: str, netloc: str):
+        """ Get (or open) the calling thread's connection to `netloc` """
+        conns = self.local.__dict__.setdefault('conns', {})
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = cls(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str):
+        conn = self.local.__dict__.get('conns', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _delay(self, attempt: int, hint: float = None):
+        """ Exponential backoff with full jitter, floored by server hint """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if hint is not None:
+            delay = max(delay, min(hint, self.max_backoff))
+        return delay
+
+    def get(self, url: str, on_retry=None):
+        """ Fetch `url` and return the (decoded) response body
+        :param str url:
+            Absolute http(s) URL
+        :param callable on_retry:
+            Optional callback `on_retry(attempt, error, delay)` invoked before each retry
+        :return bytes:
+            Response body
+        """
+        return self.request(url, on_retry=on_retry)[2]
+
+    def request(self, url: str, headers: dict = None, on_retry=None):
+        """ Fetch `url`, e.g. conditionally via `If-None-Match`/`If-Modified-Since` headers
+        :param str url:
+            Absolute http(s) URL
+        :param dict headers:
+            Optional additional request headers
+        :param callable on_retry:
+            Optional callback `on_retry(attempt, error, delay)` invoked before each retry
+        :return tuple:
+            Status (200 or 304 Not Modified), response headers and (decoded) body
+        """
+        def read(resp):
+            body = resp.read()
+            if resp.getheader('Content-Encoding', '').lower() == 'gzip':
+                body = gzip.decompress(body)
+            return resp.status, resp.headers, body
+
+        return self._fetch(url, headers, on_retry, read)
+
+    def download(self, url: str, path: Path, on_retry=None, on_chunk=None, chunk_size: int = CHUNK_SIZE):
+        """ Stream the body of `url` to a file in chunks (decoding gzip transfer encoding on the fly), so that
+        the response never has to fit into memory
+        :param str url:
+            Absolute http(s) URL
+        :param Path path:
+            Target file (truncated by every attempt)
+        :param callable on_retry:
+            Optional callback `on_retry(attempt, error, delay)` invoked before each retry
+        :param callable on_chunk:
+            Optional callback `on_chunk(data)` invoked with each decoded chunk before it is written
+        :param int chunk_size:
+            Number of bytes read from the connection at once
+        :return tuple:
+            Response headers, number of bytes received and number of (decoded) bytes written
+        """
+        def read(resp):
+            decoder = None
+            if resp.getheader('Content-Encoding', '').lower() == 'gzip':
+                decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            received = written = 0
+            with open(path, 'wb') as f:
+                def write(data):
+                    if on_chunk is not None:
+                        on_chunk(data)
+                    return f.write(data)
+
+                for chunk in iter(lambda: resp.read(chunk_size), b''):
+                    received += len(chunk)
+                    if decoder is None:
+                        written += write(chunk)
+                        continue
+                    # decoded chunks are bounded as well, however well the body compresses
+                    while chunk:
+                        data = decoder.decompress(chunk, chunk_size)
+                        chunk = decoder.unconsumed_tail
+                        if data:
+                            written += write(data)
+                if decoder is not None and received:
+                    data = decoder.flush()
+                    if not decoder.eof:
+                        raise http.client.IncompleteRead(data)
+                    if data:
+                        written += write(data)
+            return resp.headers, received, written
+
+        return self._fetch(url, None, on_retry, read)
+
+    def _fetch(self, url: str, headers: dict, on_retry, read):
+        """ Send a GET request and pass a successful response (200 or 304) to `read`, retrying transient errors
+        (also while the body is read) """
+        parts = urlsplit(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        headers = {**self.headers, **(headers or {})}
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            hint = None
+            try:
+                conn = self._connection(parts.scheme, parts.netloc)
+                conn.request('GET', target, headers=headers)
+                resp = conn.getresponse()
+                if resp.status in (200, 304):
+                    result = read(resp)
+                else:
+                    resp.read()
+                if resp.will_close:
+                    self._drop_connection(parts.scheme, parts.netloc)
+                if resp.status in (200, 304):
+                    return result
+                error = HTTPStatusError(url, resp.status, resp.reason)
+                if resp.status not in RETRY_STATUS:
+                    raise error
+                hint = retry_after(resp.getheader('Retry-After'))
+            except HTTPStatusError:
+                raise
+            except (http.client.HTTPException, OSError, zlib.error) as e:
+                self._drop_connection(parts.scheme, parts.netloc)
+                error = e
+            if attempt >= self.max_retries:
+                raise error
+            delay = self._delay(attempt, hint)
+            if on_retry is not None:
+                on_retry(attempt, error, delay)
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Columnar store for parsed SEC EDGAR quarterly index files and filing metadata.
+
+Each `output/index/{year}_q{qtr}.idx.gz` file (or uncompressed `.idx` file of earlier
+downloads) is parsed once into an indexed SQLite table, so that counting and selecting
+filings become queries instead of regex scans over every index line. HTTP validators of
+downloaded index files are kept alongside, so that unchanged quarters are not fetched again. Metadata parsed from the SEC headers of downloaded filings is kept
+in the same store (keyed by accession number).
+"""
+
+
+import datetime as dt
+import gzip
+import sqlite3
+from pathlib import Path
+
+
+PATH_INDEX_DB = Path('output', 'index', 'index.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    cik INTEGER NOT NULL,
+    comp_name TEXT,
+    form_type TEXT NOT NULL,
+    date_filed TEXT NOT NULL,
+    fname TEXT NOT NULL UNIQUE,
+    accession TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_filings_form ON filings (form_type, year, qtr);
+CREATE INDEX IF NOT EXISTS ix_filings_cik ON filings (cik);
+CREATE INDEX IF NOT EXISTS ix_filings_date ON filings (date_filed);
+CREATE INDEX IF NOT EXISTS ix_filings_accession ON filings (accession);
+CREATE TABLE IF NOT EXISTS ingested (
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    n_rows INTEGER NOT NULL,
+    PRIMARY KEY (year, qtr)
+);
+CREATE TABLE IF NOT EXISTS index_files (
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched TEXT NOT NULL,
+    PRIMARY KEY (year, qtr)
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    accession TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    fname TEXT,
+    cik TEXT,
+    comp_name TEXT,
+    sic TEXT,
+    form_type TEXT,
+    street TEXT,
+    city TEXT,
+    state TEXT,
+    zip TEXT,
+    phone TEXT,
+    date_report TEXT,
+    date_filing TEXT,
+    hlink TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_metadata_cik ON metadata (cik);
+CREATE INDEX IF NOT EXISTS ix_metadata_sic ON metadata (sic);
+"""
+METADATA_COLUMNS = ['accession', 'path', 'fname', 'cik', 'comp_name', 'sic', 'form_type', 'street', 'city', 'state',
+                    'zip', 'phone', 'date_report', 'date_filing', 'hlink']
+
+
+def connect(path_db: Path = PATH_INDEX_DB):
+    """ Open (and if necessary create) the index store
+    :param Path path_db:
+        Path to SQLite database
+    :return sqlite3.Connection:
+        Connection to index store
+    """
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.executescript(SCHEMA)
+    return con
+
+
+def parse_index_line(line: str):
+    """ Split one `master.idx` data line into its fields
+    :param str line:
+        Line of the form 'CIK|Company Name|Form Type|Date Filed|Filename' (of a full or daily index file)
+    :return tuple:
+        (cik, comp_name, form_type, date_filed, fname, accession) or None for non-data lines
+    """
+    fields = line.rstrip('\n').split('|')
+    if len(fields) != 5 or not fields[0].isdigit():
+        return None
+    cik, comp_name, form_type, date_filed, fname = fields
+    if len(date_filed) == 8 and date_filed.isdigit():
+        # daily index files list dates as YYYYMMDD
+        date_filed = f'{date_filed[:4]}-{date_filed[4:6]}-{date_filed[6:]}'
+    return int(cik), comp_name, form_type, date_filed, fname, Path(fname).stem
+
+
+def index_path(year: int, qtr: int):
+    """ Path to the index file of a quarter (gzip-compressed, or uncompressed if downloaded as such before) """
+    path_ind = Path('output', 'index', f'{year}_q{qtr}.idx.gz')
+    path_legacy = path_ind.with_suffix('')
+    return path_legacy if path_legacy.exists() and not path_ind.exists() else path_ind
+
+
+def open_index(path_ind: Path):
+    """ Open (possibly gzip-compressed) index file for reading in text mode """
+    if path_ind.suffix == '.gz':
+        return gzip.open(path_ind, 'rt', encoding='utf-8', errors='ignore')
+    return path_ind.open('r', encoding='utf-8', errors='ignore')
+
+
+def n_rows(con: sqlite3.Connection, year: int, qtr: int):
+    """ Number of filings of an ingested quarter (None if the quarter was not ingested) """
+    row = con.execute('SELECT n_rows FROM ingested WHERE year = ? AND qtr = ?', (year, qtr)).fetchone()
+    return row[0] if row else None
+
+
+def ingest_quarter(con: sqlite3.Connection, year: int, qtr: int, force: bool = False, append: bool = False):
+    """ Parse index file of a single quarter into the store
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param int year:
+        Year of index file
+    :param int qtr:
+        Quarter of index file
+    :param bool force:
+        Re-ingest quarter even if it was ingested before
+    :param bool append:
+        Only add filings that are not in the store yet (e.g. to update a quarter that is still open), so that
+        previously ingested filings keep their position in index file order
+    :return bool:
+        True if the quarter is available in the store
+    """
+    if not force and not append and n_rows(con, year, qtr) is not None:
+        return True
+
+    path_ind = index_path(year, qtr)
+    if not path_ind.exists():
+        return False
+
+    with open_index(path_ind) as f:
+        rows = [row + (year, qtr) for row in map(parse_index_line, f) if row is not None]
+    with con:
+        if not append:
+            con.execute('DELETE FROM filings WHERE year = ? AND qtr = ?', (year, qtr))
+        con.executemany('INSERT OR IGNORE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        n = con.execute('SELECT COUNT(*) FROM filings WHERE year = ? AND qtr = ?', (year, qtr)).fetchone()[0]
+        con.execute('INSERT OR REPLACE INTO ingested VALUES (?, ?, ?)', (year, qtr, n))
+    return True
+
+
+def append_filings(con: sqlite3.Connection, rows: list):
+    """ Add filings (e.g. from daily index files) that are not in the store yet
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param list rows:
+        Rows of (cik, comp_name, form_type, date_filed, fname, accession, year, qtr)
+    :return int:
+        Number of added filings
+    """
+    with con:
+        return con.executemany('INSERT OR IGNORE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows).rowcount
+
+
+def index_file(con: sqlite3.Connection, year: int, qtr: int):
+    """ HTTP validators of the downloaded index file of a quarter
+    :return tuple:
+        (etag, last_modified, fetched) or None if the index file was not downloaded with validators
+    """
+    return con.execute('SELECT etag, last_modified, fetched FROM index_files WHERE year = ? AND qtr = ?',
+                       (year, qtr)).fetchone()
+
+
+def record_index_file(con: sqlite3.Connection, year: int, qtr: int, etag: str = None, last_modified: str = None):
+    """ Record HTTP validators (`ETag`, `Last-Modified`) of an index file that was fetched or revalidated just now """
+    with con:
+        con.execute('INSERT OR REPLACE INTO index_files VALUES (?, ?, ?, ?, ?)',
+                    (year, qtr, etag, last_modified, dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def matching_form_types(con: sqlite3.Connection, form_pattern):
+    """ Resolve form pattern (e.g. `PAT_10K`) to the distinct form types it matches in the store
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param re.Pattern form_pattern:
+        Regex pattern for matching form types in index lines
+    :return list:
+        Matching form types as stored in the index
+    """
+    return [ft for (ft,) in con.execute('SELECT DISTINCT form_type FROM filings')
+            if form_pattern.search(f'|{ft}|')]
+
+
+def select_filings(con: sqlite3.Connection, form_pattern, start: int, end: int,
+                   ciks: list = None, qtr: int = None, limit: int = None, date_from: str = None, date_to: str = None):
+    """ Select filings of a form type from the store (in index file order)
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param re.Pattern form_pattern:
+        Regex pattern for matching form types in index lines
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :param list ciks:
+        Optional CIKs to restrict the selection to (an empty whitelist selects nothing)
+    :param int qtr:
+        Optional quarter to restrict the selection to
+    :param int limit:
+        Optional maximum number of filings
+    :param str date_from:
+        Optional first filing date (YYYY-MM-DD)
+    :param str date_to:
+        Optional last filing date (YYYY-MM-DD)
+    :return list:
+        Rows of (cik, comp_name, form_type, date_filed, fname, accession, year, qtr)
+    """
+    form_types = matching_form_types(con, form_pattern)
+    query = (f'SELECT * FROM filings WHERE form_type IN ({",".join("?" * len(form_types))}) '
+             f'AND year BETWEEN ? AND ?')
+    params = [*form_types, start, end]
+    if ciks is not None:
+        # whitelists may exceed the maximum number of query parameters, hence they are joined as a temporary table
+        with con:
+            con.execute('CREATE TEMP TABLE IF NOT EXISTS selected_ciks (cik INTEGER PRIMARY KEY)')
+            con.execute('DELETE FROM selected_ciks')
+            con.executemany('INSERT OR IGNORE INTO selected_ciks VALUES (?)', ((int(c),) for c in ciks))
+        query += ' AND cik IN (SELECT cik FROM selected_ciks)'
+    if qtr is not None:
+        query += ' AND qtr = ?'
+        params.append(qtr)
+    if date_from is not None:
+        query += ' AND date_filed >= ?'
+        params.append(date_from)
+    if date_to is not None:
+        query += ' AND date_filed <= ?'
+        params.append(date_to)
+    query += ' ORDER BY year, qtr, rowid'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return con.execute(query, params).fetchall()
+
+
+def count_by_quarter(con: sqlite3.Connection, form_pattern, start: int, end: int):
+    """ Count filings of a form type per quarter
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param re.Pattern form_pattern:
+        Regex pattern for matching form types in index lines
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :return list:
+        Rows of (year, qtr, no_of_filings) for all ingested quarters
+    """
+    form_types = matching_form_types(con, form_pattern)
+    return con.execute(
+        f'SELECT i.year, i.qtr, COUNT(f.fname) FROM ingested i '
+        f'LEFT JOIN filings f ON f.year = i.year AND f.qtr = i.qtr '
+        f'AND f.form_type IN ({",".join("?" * len(form_types))}) '
+        f'WHERE i.year BETWEEN ? AND ? GROUP BY i.year, i.qtr ORDER BY i.year, i.qtr',
+        [*form_types, start, end]
+    ).fetchall()
+
+
+def filings_by_cik(con: sqlite3.Connection, start: int, end: int):
+    """ Number of filings (of any form type) per CIK in the start-end period """
+    return dict(con.execute('SELECT cik, COUNT(*) FROM filings WHERE year BETWEEN ? AND ? GROUP BY cik',
+                            (start, end)).fetchall())
+
+
+def sic_by_cik(con: sqlite3.Connection):
+    """ SIC code per CIK as parsed from the SEC header of its latest downloaded filing """
+    rows = con.execute("SELECT cik, sic FROM metadata WHERE sic IS NOT NULL AND sic != '' AND cik IS NOT NULL "
+                       "AND cik != '' ORDER BY date_filing").fetchall()
+    return {int(cik): sic for cik, sic in rows}
+
+
+def upsert_metadata(con: sqlite3.Connection, rows: list):
+    """ Insert or replace a batch of filing metadata
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param list rows:
+        Metadata dicts with one entry per column in `METADATA_COLUMNS`
+    """
+    with con:
+        con.executemany(f'INSERT OR REPLACE INTO metadata VALUES ({",".join("?" * len(METADATA_COLUMNS))})',
+                        [[row[c] for c in METADATA_COLUMNS] for row in rows])
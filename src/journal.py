@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Persistent journal of filing downloads.
+
+Each filing selected for download is recorded once as a job with its state
+(queued -> downloading -> written -> metadata-done, or failed; processed for filings the
+pipeline did not keep), the number of attempts, the downloaded bytes and the latency.
+Interrupted downloads resume from the journal instead of re-walking the index and checking
+every target path. Incremental syncs from the daily index keep their high-water mark (the
+last synced filing date) in the same journal.
+"""
+
+
+import datetime as dt
+import sqlite3
+from pathlib import Path
+
+
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+WRITTEN = 'written'
+METADATA_DONE = 'metadata-done'
+FAILED = 'failed'
+# processed by the pipeline without keeping the filing (only sections and/or metadata were written)
+PROCESSED = 'processed'
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS jobs (
+    accession TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER,
+    latency REAL,
+    error TEXT,
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_state ON jobs (state, year, qtr, seq);
+CREATE TABLE IF NOT EXISTS quarters (
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (year, qtr)
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    name TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+"""
+
+
+def now():
+    return dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def connect(form_type: str = '10-k'):
+    """ Open (and if necessary create) the download journal of a form type
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return sqlite3.Connection:
+        Connection to journal (write to `output/filings/{form_type}/journal.sqlite`)
+    """
+    path_db = Path('output', 'filings', form_type, 'journal.sqlite')
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def enqueued(con: sqlite3.Connection, year: int, qtr: int):
+    """ Number of filings per quarter that were enqueued before (0 if the quarter was never enqueued) """
+    row = con.execute('SELECT n FROM quarters WHERE year = ? AND qtr = ?', (year, qtr)).fetchone()
+    return row['n'] if row else 0
+
+
+def enqueue(con: sqlite3.Connection, jobs: list, year: int = None, qtr: int = None, n: int = None):
+    """ Add jobs to the journal (jobs that exist already keep their state)
+    :param sqlite3.Connection con:
+        Connection to journal
+    :param list jobs:
+        Tuples of (accession, url, path, year, qtr, seq, state)
+    :param int year:
+        Year of the enqueued quarter (optional)
+    :param int qtr:
+        Quarter of the enqueued quarter (optional)
+    :param int n:
+        Number of filings per quarter the quarter was enqueued with (optional)
+    """
+    with con:
+        con.executemany('INSERT OR IGNORE INTO jobs (accession, url, path, year, qtr, seq, state, updated) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [(*job, now()) for job in jobs])
+        if n is not None:
+            con.execute('INSERT OR REPLACE INTO quarters VALUES (?, ?, ?)', (year, qtr, n))
+
+
+def next_seq(con: sqlite3.Connection, year: int, qtr: int):
+    """ Sequence number following the last job of a quarter (jobs added later are visited last) """
+    return con.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs WHERE year = ? AND qtr = ?',
+                       (year, qtr)).fetchone()[0]
+
+
+def jobs(con: sqlite3.Connection, accessions: list):
+    """ Jobs of the specified accession numbers (in index file order) """
+    rows = []
+    for i in range(0, len(accessions), 500):
+        batch = accessions[i:i + 500]
+        rows += con.execute(f'SELECT * FROM jobs WHERE accession IN ({",".join("?" * len(batch))})', batch).fetchall()
+    return sorted(rows, key=lambda row: (row['year'], row['qtr'], row['seq']))
+
+
+def pending(con: sqlite3.Connection, state: str, year: int, qtr: int):
+    """ Jobs of a quarter in the specified state (in index file order) """
+    return con.execute('SELECT * FROM jobs WHERE state = ? AND year = ? AND qtr = ? ORDER BY seq',
+                       (state, year, qtr)).fetchall()
+
+
+def set_state(con: sqlite3.Connection, accessions: list, state: str, **fields):
+    """ Move jobs to a new state, optionally updating `attempts`, `bytes`, `latency` and `error` """
+    assignments = ''.join(f', {k} = ?' for k in fields)
+    con.executemany(f'UPDATE jobs SET state = ?, updated = ?{assignments} WHERE accession = ?',
+                    [(state, now(), *fields.values(), a) for a in accessions])
+
+
+def reset_interrupted(con: sqlite3.Connection):
+    """ Requeue jobs that were interrupted while downloading
+    :return int:
+        Number of requeued jobs
+    """
+    with con:
+        return con.execute('UPDATE jobs SET state = ?, updated = ? WHERE state = ?',
+                           (QUEUED, now(), DOWNLOADING)).rowcount
+
+
+def requeue_failed(con: sqlite3.Connection, start: int, end: int):
+    """ Requeue failed jobs of the start-end period
+    :return int:
+        Number of requeued jobs
+    """
+    with con:
+        return con.execute('UPDATE jobs SET state = ?, error = NULL, updated = ? '
+                           'WHERE state = ? AND year BETWEEN ? AND ?', (QUEUED, now(), FAILED, start, end)).rowcount
+
+
+def requeue_processed(con: sqlite3.Connection, year: int, qtr: int):
+    """ Requeue jobs of a quarter that the pipeline processed without keeping the filing, e.g. to download them
+    :return int:
+        Number of requeued jobs
+    """
+    with con:
+        return con.execute('UPDATE jobs SET state = ?, updated = ? WHERE state = ? AND year = ? AND qtr = ?',
+                           (QUEUED, now(), PROCESSED, year, qtr)).rowcount
+
+
+def counts(con: sqlite3.Connection, start: int, end: int):
+    """ Number of jobs per state in the start-end period """
+    return dict(con.execute('SELECT state, COUNT(*) FROM jobs WHERE year BETWEEN ? AND ? GROUP BY state',
+                            (start, end)).fetchall())
+
+
+def watermark(con: sqlite3.Connection, name: str = 'daily-index'):
+    """ High-water mark of an incremental sync, i.e. the last date (YYYY-MM-DD) that was synced (None if never synced) """
+    row = con.execute('SELECT date FROM watermarks WHERE name = ?', (name,)).fetchone()
+    return row['date'] if row else None
+
+
+def set_watermark(con: sqlite3.Connection, date: str, name: str = 'daily-index'):
+    """ Advance the high-water mark of an incremental sync (in a single transaction) """
+    with con:
+        con.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)', (name, date, now()))
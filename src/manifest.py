@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Content-addressed manifest of processed filings.
+
+For each filing and processing stage (clean, mda, item1, ...) the manifest records the content
+hash of the stage input, a hash of the stage version (patterns and parameters) and the stage
+output, so that reruns only process filings whose input or version changed.
+"""
+
+
+import datetime as dt
+import hashlib
+import sqlite3
+from pathlib import Path
+
+import storage
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    version TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    output TEXT,
+    output_hash TEXT,
+    filing_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL, -- version part of the storage fingerprint (mtime or pack offset)
+    updated TEXT NOT NULL,
+    PRIMARY KEY (path, stage)
+);
+"""
+
+
+def connect(form_type: str = '10-k'):
+    """ Open (and if necessary create) the manifest of a form type
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return sqlite3.Connection:
+        Connection to manifest (write to `output/filings/{form_type}/manifest.sqlite`)
+    """
+    path_db = Path('output', 'filings', form_type, 'manifest.sqlite')
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def version_hash(*parts):
+    """ Hash stage version from its defining parts (e.g. pattern strings and parameters) """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode('utf-8'))
+    return h.hexdigest()
+
+
+def file_hash(path: Path):
+    """ Compute SHA-256 content hash of a (possibly packed) file """
+    return storage.store_for(path).hash(path)
+
+
+def filing_hash(con: sqlite3.Connection, path: Path):
+    """ Get content hash of a filing, reusing a recorded hash if size and modification time are unchanged
+    :param sqlite3.Connection con:
+        Connection to manifest
+    :param Path path:
+        Path to filing
+    :return str:
+        SHA-256 content hash
+    """
+    size, mtime_ns = storage.store_for(path).fingerprint(path)
+    row = con.execute('SELECT filing_hash FROM manifest WHERE path = ? AND size = ? AND mtime_ns = ? LIMIT 1',
+                      (str(path), size, mtime_ns)).fetchone()
+    return row['filing_hash'] if row else file_hash(path)
+
+
+def entry(con: sqlite3.Connection, path: Path, stage: str):
+    """ Get manifest entry of a filing and stage (None if not recorded) """
+    return con.execute('SELECT * FROM manifest WHERE path = ? AND stage = ?', (str(path), stage)).fetchone()
+
+
+def record(con: sqlite3.Connection, path: Path, stage: str, version: str, input_hash: str,
+           output: Path = None, output_hash: str = None):
+    """ Record that a stage processed a filing
+    :param sqlite3.Connection con:
+        Connection to manifest
+    :param Path path:
+        Path to filing
+    :param str stage:
+        Processing stage (e.g. clean, mda, item1)
+    :param str version:
+        Stage version hash
+    :param str input_hash:
+        Content hash of the stage input
+    :param Path output:
+        Path to stage output (None if the filing is processed in place or the output is only indexed)
+    :param str output_hash:
+        Content hash of the stage output
+    """
+    size, mtime_ns = storage.store_for(path).fingerprint(path)
+    # hash of the filing as it is on disk now (after in-place cleaning that is the output)
+    current = output_hash if output is None and output_hash is not None else input_hash
+    con.execute('INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (str(path), stage, version, input_hash, None if output is None else str(output), output_hash,
+                 current, size, mtime_ns, dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Single-pass cleaner of SGML/HTML filings.
+
+The regex engine of `parsing.clean_filing` applies the `PAT_MU1` patterns, `html.unescape`, `PAT_TAB1`,
+`PAT_MU2` and two whitespace patterns one after the other, each scanning and copying the whole filing.
+This module tokenizes the filing once instead: a single scanner jumps from one markup token (non-text
+block, tag, table, entity) to the next, and the text in between is written to a sink that replaces
+non-breaking spaces and collapses blank lines on the fly. The tokens mirror the regex cascade:
+
+- blocks of `PAT_MU1['ascii_alt']` (GRAPHIC, ZIP, EXCEL, JSON, PDF, XML, EX-) and the SEC header
+  (`PAT_MU1['header_footer']`) are dropped,
+- tags of `PAT_MU1['html_tags']` (which may span several lines) and of `PAT_MU2` (at most two lines) are
+  replaced by newlines,
+- tables of `PAT_TAB1` are kept (with [TABLE] tags) or dropped according to `parsing.keep_table`,
+- a stray `<` before a table starts a tag of `PAT_MU2` if the tag ends within the `[TABLE]<TABLE...>` of the
+  retained table or after the dropped table (`PAT_MU2` is applied after `PAT_TAB1` replaced the table),
+- character references are unescaped like `html.unescape`.
+
+Unlike the regex engine, unescaped characters are never parsed as markup, e.g. `a &lt; b and c &gt; d`
+is kept as `a < b and c > d` instead of being removed as a tag.
+"""
+
+
+import functools
+import html
+import re
+from html.entities import html5
+
+
+PAT_SEC_HEADER_END = re.compile(r'</SEC-HEADER>', re.I)
+PAT_TABLE_END = re.compile(r'</TABLE>', re.I)
+# tags of `PAT_MU1['html_tags']`
+HTML_TAG = r'<(?:div|font|tr|td|p)[^>]*>|</(?:font|div|tr|td|p)>'
+# `PAT_MU2` is applied after `PAT_MU1` replaced its matches by a newline and after `PAT_TAB1`, i.e. a tag of
+# `PAT_MU2` spans at most one newline or `PAT_MU1` match (but never starts one) and never starts a table
+# (within a table, table tags are ordinary characters)
+MU1 = rf'{HTML_TAG}|-----END PRIVACY-ENHANCED MESSAGE-----'
+MU2_CHAR = rf'(?:(?!{MU1}|<TABLE[\s\S]*?</TABLE>)[^>\n])'
+MU2_TABLE_CHAR = rf'(?:(?!{MU1})[^>\n])'
+PAT_TAG = re.compile(rf'{HTML_TAG}|<{MU2_CHAR}*(?:(?:\n|{MU1}){MU2_CHAR}*)?>', re.I)
+PAT_TABLE_TAG = re.compile(rf'{HTML_TAG}|<{MU2_TABLE_CHAR}*(?:(?:\n|{MU1}){MU2_TABLE_CHAR}*)?>', re.I)
+# text following a stray `<` (starting no tag) up to the next table or end of its tag (after no or one newline so
+# far), and the rest of the tag within the `[TABLE]<TABLE...` replacing a retained table
+PAT_STRAY = (re.compile(rf'{MU2_CHAR}*(?P<newline>(?:\n|{MU1}){MU2_CHAR}*)?', re.I), re.compile(rf'{MU2_CHAR}*', re.I))
+PAT_TABLE_TAG_REST = (re.compile(rf'{MU2_TABLE_CHAR}*(?:(?:\n|{MU1}){MU2_TABLE_CHAR}*)?>', re.I),
+                      re.compile(rf'{MU2_TABLE_CHAR}*>', re.I))
+PAT_BLOCK = re.compile(r'\n<GRAPHIC>|<(?:ZIP|EXCEL|JSON|PDF|XML)>|<EX[^>\n]*>', re.I)
+FOOTER = r'(?P<footer>-----END PRIVACY-ENHANCED MESSAGE-----)'
+# character references as matched by `html.unescape`
+ENTITY = r'(?P<entity>&(?:#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?))'
+PAT_TOKEN = re.compile(rf'{FOOTER}|(?P<table><TABLE)|(?P<tag>{PAT_TAG.pattern})|{ENTITY}', re.I)
+PAT_TABLE_TOKEN = re.compile(rf'{FOOTER}|(?P<tag>{PAT_TABLE_TAG.pattern})|{ENTITY}', re.I)
+PAT_BLOCK_END = {
+    'EX': re.compile(r'</EX[^>\n]*>', re.I),
+    **{name: re.compile(rf'</{name}>', re.I) for name in ('GRAPHIC', 'ZIP', 'EXCEL', 'JSON', 'PDF', 'XML')},
+}
+# blank lines within a text segment (equivalent to `(\n\s*){3,}` without backtracking)
+PAT_BLANK_LINES = re.compile(r'\n(?:[^\S\n]*\n){2,}\s*')
+
+
+@functools.lru_cache(maxsize=4096)
+def charref(ref: str):
+    """ Replacement of a character reference (as by `html.unescape`) and its length, i.e. the length of the longest
+    prefix of an unknown name that is a named reference without semicolon (just `&` if there is none) """
+    if ref[1] == '#':
+        return html.unescape(ref), len(ref)
+    name = ref[1:]
+    if name in html5:
+        return html5[name], len(ref)
+    for x in range(len(name) - 1, 1, -1):
+        if name[:x] in html5:
+            return html5[name[:x]], x + 1
+    return '&', 1
+
+
+class TextSink:
+    """ Collects cleaned text, replacing non-breaking and zero-width spaces by newlines and collapsing
+    whitespace runs with three or more newlines into a blank line (like the final regexes of the cascade) """
+
+    def __init__(self):
+        self.out = []
+        # part of the trailing whitespace run from its first newline on (None if it has no newline yet)
+        self.run = None
+        self.newlines = 0
+
+    def newline(self):
+        if self.run is None:
+            self.run, self.newlines = ['\n'], 1
+        else:
+            self.run.append('\n')
+            self.newlines += 1
+
+    def space(self, s: str):
+        if self.run is None:
+            i = s.find('\n')
+            if i < 0:
+                self.out.append(s)
+                return
+            self.out.append(s[:i])
+            s, self.run, self.newlines = s[i:], [], 0
+        self.run.append(s)
+        self.newlines += s.count('\n')
+
+    def text(self, s: str):
+        if '\xa0' in s or '\u200b' in s:
+            s = s.replace('\xa0', '\n').replace('\u200b', '\n')
+        body = s.lstrip()
+        if not body:
+            if s:
+                self.space(s)
+            return
+        if len(body) < len(s):
+            self.space(s[:len(s) - len(body)])
+        if self.run is not None:
+            self.out.append('\n\n' if self.newlines >= 3 else ''.join(self.run))
+            self.run = None
+        core = body.rstrip()
+        self.out.append(PAT_BLANK_LINES.sub('\n\n', core) if core.count('\n') >= 3 else core)
+        if len(core) < len(body):
+            self.space(body[len(core):])
+
+    def getvalue(self):
+        # a trailing whitespace run would be stripped anyway
+        return ''.join(self.out).strip()
+
+
+class ListSink(list):
+    """ Collects the raw text of a table (markup replaced by newlines) """
+
+    def newline(self):
+        self.append('\n')
+
+    def text(self, s: str):
+        self.append(s)
+
+
+def block_end(txt: str, m: re.Match):
+    """ End of a non-text block starting with match `m` (None if its end tag is missing) """
+    name = m.group().lstrip('\n')[1:].rstrip('>').upper()
+    # e.g. <EXCEL> is closed by </EXCEL> or, like any other <EX...> block, by </EX...>
+    for pat in ([PAT_BLOCK_END[name]] if name in PAT_BLOCK_END else []) + [PAT_BLOCK_END['EX']] * name.startswith('EX'):
+        e = pat.search(txt, m.end())
+        if e:
+            return e.end()
+    return None
+
+
+def drop_blocks(txt: str):
+    """ Replace non-text blocks of `PAT_MU1['ascii_alt']` by a newline (`iter_text_documents` leaves hardly any, hence
+    the filing is only copied if there are blocks) """
+    pieces, pos = [], 0
+    m = PAT_BLOCK.search(txt)
+    while m is not None:
+        e = block_end(txt, m)
+        if e is None:
+            # the block may still start a few characters later, e.g. <EXCEL> without end tag within <EXCEL>...</EX-1>
+            m = PAT_BLOCK.search(txt, m.start() + 1)
+            continue
+        pieces += [txt[pos:m.start()], '\n']
+        pos = e
+        m = PAT_BLOCK.search(txt, pos)
+    return ''.join(pieces) + txt[pos:] if pieces else txt
+
+
+def stray_tag(txt: str, pos: int, start: int, end: int, keep_table):
+    """ Tag of `PAT_MU2` starting at a stray `<` of a text segment and ending within or after the next table (in the
+    regex cascade, `PAT_MU2` is applied after `PAT_TAB1` replaced the table)
+    :param str txt:
+        Filing
+    :param int pos:
+        Start offset of the text segment
+    :param int start:
+        End offset of the text segment
+    :param int end:
+        End offset of the scan
+    :param callable keep_table:
+        Decides from the text of a table whether it is retained
+    :return tuple:
+        Offset of the stray `<`, end of its tag, and end of the retained table it ends in (None if it ends after
+        dropped tables); None if there is no such tag
+    """
+    k = txt.find('<', pos, start)
+    while k >= 0:
+        t, newlines = k + 1, 0
+        while True:
+            m = PAT_STRAY[newlines].match(txt, t, end)
+            newlines += m.groupdict().get('newline') is not None
+            t = m.end()
+            if txt.startswith('>', t, end):
+                return k, t + 1, None
+            if txt[t:t + 6].upper() != '<TABLE':
+                break
+            e = PAT_TABLE_END.search(txt, t, end).end()
+            table = ListSink()
+            scan(txt, t, e, table, keep_table, tables=False)
+            if keep_table(''.join(table)):
+                # the tag ends within the start tag of the table (following `[TABLE]`)
+                r = PAT_TABLE_TAG_REST[newlines].match(txt, t + 1, e)
+                if r is not None:
+                    return k, r.end(), e
+                break
+            # a dropped table is removed, hence the tag continues after it
+            t = e
+        k = txt.find('<', k + 1, start)
+    return None
+
+
+def scan(txt: str, pos: int, end: int, sink, keep_table, tables: bool = True):
+    """ Tokenize `txt[pos:end]` and write its text to `sink`
+    :param str txt:
+        Filing
+    :param int pos:
+        Start offset
+    :param int end:
+        End offset
+    :param sink:
+        `TextSink` or `ListSink`
+    :param callable keep_table:
+        Decides from the text of a table whether it is retained
+    :param bool tables:
+        Parse tables (False within a table, where table tags are ordinary tags)
+    """
+    search = (PAT_TOKEN if tables else PAT_TABLE_TOKEN).search
+    while True:
+        m = search(txt, pos, end)
+        if m is None:
+            if pos < end:
+                sink.text(txt[pos:end])
+            return
+        start = m.start()
+        stray = stray_tag(txt, pos, start, end, keep_table) if tables and txt.find('<', pos, start) >= 0 else None
+        if stray is not None:
+            k, tag_end, table_end = stray
+            if k > pos:
+                sink.text(txt[pos:k])
+            sink.newline()
+            if table_end is not None:
+                # the rest of the table is text (followed by the `[/TABLE]` of its replacement)
+                scan(txt, tag_end, table_end, sink, keep_table, tables=False)
+                sink.text('[/TABLE]')
+                pos = table_end
+            else:
+                pos = tag_end
+            continue
+        if start > pos:
+            sink.text(txt[pos:start])
+        kind = m.lastgroup
+        if kind == 'tag' or kind == 'footer':
+            sink.newline()
+            pos = m.end()
+            continue
+        if kind == 'entity':
+            text, n = charref(m.group())
+            sink.text(text)
+            pos = start + n
+            continue
+        # table (only parsed outside of tables)
+        e = PAT_TABLE_END.search(txt, m.end(), end)
+        if e is not None:
+            table = ListSink()
+            scan(txt, start, e.end(), table, keep_table, tables=False)
+            content = ''.join(table)
+            if keep_table(content):
+                sink.text(f'[TABLE]{content}[/TABLE]')
+            pos = e.end()
+            continue
+        # start tag of a table without end tag
+        t = PAT_TAG.match(txt, start, end)
+        if t is not None:
+            sink.newline()
+            pos = t.end()
+        else:
+            sink.text(txt[start])
+            pos = start + 1
+
+
+def clean_text(txt: str, keep_table):
+    """ Clean a filing in a single pass (equivalent to the regex cascade of `parsing.clean_filing` applied
+    to the output of `parsing.iter_text_documents`, see module docstring for deviations)
+    :param str txt:
+        Filing without non-text documents
+    :param callable keep_table:
+        Decides from the text of a table (markup replaced by newlines) whether it is retained
+    :return str:
+        Cleaned text
+    """
+    txt = drop_blocks(txt)
+    sink = TextSink()
+    pos = 0
+    m = PAT_SEC_HEADER_END.search(txt)
+    if m is not None:
+        sink.newline()
+        pos = m.end()
+    scan(txt, pos, len(txt), sink, keep_table)
+    return sink.getvalue()
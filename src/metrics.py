@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Structured per-filing metrics of the download, cleaning and extraction stages.
+
+Usage:
+    edgar_metrics.py report [--form-type=STR] [--stage=STR] [--run=STR] [-N=INT | --no-of-filings=INT]
+
+Options:
+    -h, --help
+    --form-type=STR                 Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a) [default: 10-k].
+    --stage=STR                     Stage to summarize (one of: download, clean, mda, item1); all stages if omitted.
+    --run=STR                       Run to summarize (`all` for all runs); the latest run of each stage if omitted.
+    -N INT, --no-of-filings=INT     Number of slowest filings listed per stage [default: 10].
+
+Every processed filing adds one row per metric to `output/filings/{form_type}/metrics.sqlite`:
+`seconds` (wall time of the stage), `bytes`/`chars` (size of the input/output), `wire_bytes`, `retries`
+and `failed` (downloads), `peak_mb` (cleaning) and `time:{pattern}` (time spent per cleaning regex or section pattern).
+Rows are tagged with the run, i.e. the start time of the command that recorded them.
+"""
+
+
+import datetime as dt
+import math
+import sqlite3
+from pathlib import Path
+
+from docopt import docopt
+
+
+RUN = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+STAGES = ('download', 'clean', 'mda', 'item1')
+QUANTILES = (0.5, 0.95, 0.99)
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS metrics (
+    run TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_metrics_stage ON metrics (stage, run, metric);
+"""
+
+
+def connect(form_type: str = '10-k'):
+    """ Open (and if necessary create) the metrics store of a form type
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return sqlite3.Connection:
+        Connection to metrics store (write to `output/filings/{form_type}/metrics.sqlite`)
+    """
+    path_db = Path('output', 'filings', form_type, 'metrics.sqlite')
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def record(con: sqlite3.Connection, stage: str, path: Path, values: dict):
+    """ Add the metrics of a processed filing (committed by the caller, e.g. in batches)
+    :param sqlite3.Connection con:
+        Connection to metrics store
+    :param str stage:
+        Processing stage (one of: download, clean, mda, item1)
+    :param Path path:
+        Path to filing
+    :param dict values:
+        Metric values by name (None values are skipped)
+    """
+    con.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?)',
+                    [(RUN, stage, str(path), k, v) for k, v in values.items() if v is not None])
+
+
+def quantile(values: list, q: float):
+    """ Nearest-rank quantile of sorted values """
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def runs(con: sqlite3.Connection, stage: str, run: str = None):
+    """ Runs of a stage to summarize (the latest run if `run` is None, all runs if `run` is 'all') """
+    if run == 'all':
+        return [r[0] for r in con.execute('SELECT DISTINCT run FROM metrics WHERE stage = ?', (stage,))]
+    if run is None:
+        run = con.execute('SELECT MAX(run) FROM metrics WHERE stage = ?', (stage,)).fetchone()[0]
+    return [] if run is None else [run]
+
+
+def summarize(con: sqlite3.Connection, stage: str, run: str = None):
+    """ Summarize the metrics of a stage
+    :param sqlite3.Connection con:
+        Connection to metrics store
+    :param str stage:
+        Processing stage (one of: download, clean, mda, item1)
+    :param str run:
+        Run to summarize (`all` for all runs, latest run if None)
+    :return list:
+        Tuples of metric name, number of filings, sum, p50, p95, p99 and maximum
+    """
+    selected = runs(con, stage, run)
+    values = {}
+    for r in selected:
+        for metric, value in con.execute('SELECT metric, value FROM metrics WHERE stage = ? AND run = ?', (stage, r)):
+            values.setdefault(metric, []).append(value)
+    summary = []
+    for metric, v in values.items():
+        v.sort()
+        summary.append((metric, len(v), sum(v), *(quantile(v, q) for q in QUANTILES), v[-1]))
+    # wall time first, then the time spent per pattern (largest first) and the remaining metrics
+    return sorted(summary, key=lambda row: (row[0] != 'seconds', not row[0].startswith('time:'),
+                                            -row[2] if row[0].startswith('time:') else 0, row[0]))
+
+
+def slowest(con: sqlite3.Connection, stage: str, run: str = None, n: int = 10):
+    """ Filings of a stage with the largest wall time, as pairs of path and seconds """
+    selected = runs(con, stage, run)
+    return con.execute(f'SELECT path, MAX(value) AS seconds FROM metrics WHERE stage = ? AND metric = ? '
+                       f'AND run IN ({",".join("?" * len(selected))}) GROUP BY path ORDER BY seconds DESC LIMIT ?',
+                       (stage, 'seconds', *selected, n)).fetchall()
+
+
+def report(form_type: str = '10-k', stage: str = None, run: str = None, n: int = 10):
+    """ Print p50/p95/p99 per metric and the slowest filings of each stage
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param str stage:
+        Stage to summarize (one of: download, clean, mda, item1); all stages if None
+    :param str run:
+        Run to summarize (`all` for all runs); the latest run of each stage if None
+    :param int n:
+        Number of slowest filings listed per stage
+    """
+    if stage is not None and stage not in STAGES:
+        raise ValueError(f'Stage not implemented! Choose from: {", ".join(STAGES)}.')
+    con = connect(form_type)
+    for s in STAGES if stage is None else (stage,):
+        summary = summarize(con, s, run)
+        if not summary:
+            continue
+        print(f'\nStage {s} ({", ".join(runs(con, s, run)) if run != "all" else "all runs"}):')
+        print(f'{"metric":<28}{"n":>8}{"sum":>14}{"p50":>12}{"p95":>12}{"p99":>12}{"max":>12}')
+        for metric, count, total, *values in summary:
+            print(f'{metric:<28}{count:>8}{total:>14.4g}' + ''.join(f'{v:>12.4g}' for v in values))
+        print('\nSlowest filings:')
+        for row in slowest(con, s, run, n):
+            print(f'{row["seconds"]:>10.3f}s  {row["path"]}')
+    con.close()
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['report']:
+        report(args['--form-type'], args['--stage'], args['--run'], int(args['--no-of-filings']))
@@ -4,195 +4,1073 @@
 """ Functions for cleaning corporate filings and extracting the MD&A section.
 
 Usage:
-    edgar_clean.py clean-filings [--start=INT] [--end=INT] [--form-type=STR]
-    edgar_clean.py extract-mda [--start=INT] [--end=INT] [--form-type=STR]
-    edgar_clean.py extract-item1 [--start=INT] [--end=INT] [--form-type=STR]
+    edgar_clean.py clean-filings [--start=INT] [--end=INT] [--form-type=STR] [--workers=INT] [--tab-ratio=FLOAT] [--engine=STR]
+    edgar_clean.py compare-engines [--start=INT] [--end=INT] [--form-type=STR] [-N=INT | --no-of-filings=INT] [--seed=INT] [--workers=INT] [--tab-ratio=FLOAT]
+    edgar_clean.py profile-patterns [--start=INT] [--end=INT] [--form-type=STR] [--sections=STR] [-N=INT | --no-of-filings=INT] [--seed=INT] [--workers=INT] [--tab-ratio=FLOAT] [--timeout=FLOAT]
+    edgar_clean.py extract-mda [--start=INT] [--end=INT] [--form-type=STR] [--workers=INT] [--timeout=FLOAT] [--mmap] [--materialize]
+    edgar_clean.py extract-item1 [--start=INT] [--end=INT] [--form-type=STR] [--workers=INT] [--timeout=FLOAT] [--mmap] [--materialize]
+    edgar_clean.py extract-sections [--start=INT] [--end=INT] [--form-type=STR] [--sections=STR] [--workers=INT] [--timeout=FLOAT] [--mmap] [--materialize]
 
 Options:
     -h, --help
     --start=INT                     Start year for scraping [default: 1996].
     --end=INT                       End year for scraping [default: 2020].
     --form-type=STR                 Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a) [default: 10-k].
+    --sections=STR                  Comma-separated section types (any of: mda, item1) [default: mda,item1].
+    --workers=INT                   Number of worker processes [default: 1].
+    --timeout=FLOAT                 Maximum time in seconds spent searching sections per filing [default: 60].
+    --tab-ratio=FLOAT               Maximum proportion of digits for a table to be retained [default: 0.1].
+    --mmap                          Search sections in the memory-mapped bytes of each filing, decoding only the sections.
+    --materialize                   Also write each section next to its filing instead of only recording its offsets.
+    --engine=STR                    Cleaning engine (one of: regex, tokenizer) [default: regex].
+    -N INT, --no-of-filings=INT     Number of filings sampled to compare the cleaning engines or profile the patterns [default: 100].
+    --seed=INT                      Random seed for sampling [default: 2020].
 
 """
 
 
+import array
+import bisect
+import contextlib
 import datetime as dt
+import difflib
+import functools
+import hashlib
 import html
+import io
 import itertools
+import random
 import re
+import string
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import regex
 from docopt import docopt
 from tqdm import tqdm
 
-from parsing_patterns import (PAT_10K_MDA1, PAT_10K_MDA2, PAT_10Q_MDA,
-                              PAT_ITEM1, PAT_MU1, PAT_MU2, PAT_TAB1, PAT_TAB2,
-                              PAT_TOC1, PAT_TOC2)
+import manifest
+import markup
+import metrics
+import section_index
+import storage
+from parsing_patterns import (PAT_10K_MDA1_ANCHORS, PAT_10K_MDA2_ANCHORS,
+                              PAT_10Q_MDA_ANCHORS, PAT_DOC_END, PAT_DOC_START,
+                              PAT_ITEM1_ANCHORS, PAT_MU1, PAT_MU2, PAT_RAW,
+                              PAT_TAB1, PAT_TAB2, PAT_TAB2_BYTES, PAT_TOC1, PAT_TOC2,
+                              pattern_stats, reset_stats)
 
 
-def clean_filings(start: int, end: int, form_type: str = '10-k'):
-    """ Preprocess raw filings
+CHUNK_SIZE = 1 << 20
+SECTION_NAMES = {'mda': 'MD&A', 'item1': 'Item 1'}
+SECTION_TIMEOUT = 60
+ENGINES = ('regex', 'tokenizer')
+RAW_PROBE_SIZE = 1 << 12
+# maps ASCII letters to `a`, digits to `0` and any other byte to a space, so both can be counted after a single pass
+TAB_CHAR_CLASSES = bytes(ord('a') if chr(i) in string.ascii_letters else ord('0') if chr(i) in string.digits else ord(' ')
+                         for i in range(256))
+# UTF-8 continuation bytes (deleted to count the characters of a byte span)
+UTF8_CONTINUATION = bytes(range(0x80, 0xc0))
+# bump when the cleaning/extraction code changes in ways not captured by the pattern strings
+CLEAN_VERSION = 1
+EXTRACT_VERSION = 1
+
+
+def iter_text_documents(f, chunk_size: int = CHUNK_SIZE, reopen=None):
+    """ Stream filing while dropping non-text documents (GRAPHIC, ZIP, EX-, ...) without materializing them
+    :param io.TextIOBase f:
+        Filing opened in text mode
+    :param int chunk_size:
+        Number of characters read at once
+    :param callable reopen:
+        Returns the filing opened anew (for streams that cannot seek back, e.g. packed filings)
+    :return Iterator[str]:
+        Chunks of the filing; joined they equal `PAT_MU1['ascii'].sub('\n', f.read())`
+    """
+    # a start tag can only be decided once enough characters of look-ahead are buffered
+    max_start = len('<DOCUMENT>\n<TYPE>GRAPHIC')
+    max_end = len('</DOCUMENT>')
+    buf, offset, skip_from = '', 0, None
+
+    for chunk in iter(lambda: f.read(chunk_size), ''):
+        buf += chunk
+        while True:
+            if skip_from is None:
+                m = PAT_DOC_START.search(buf)
+                limit = len(buf) - max_start
+                if m and m.start() <= limit:
+                    yield buf[:m.start()]
+                    skip_from = offset + m.start()
+                    offset, buf = offset + m.end(), buf[m.end():]
+                else:
+                    cut = max(0, limit + 1)
+                    yield buf[:cut]
+                    offset, buf = offset + cut, buf[cut:]
+                    break
+            else:
+                m = PAT_DOC_END.search(buf)
+                if m:
+                    yield '\n'
+                    offset, buf, skip_from = offset + m.end(), buf[m.end():], None
+                else:
+                    # discard skipped payload but keep enough characters to detect a split end tag
+                    cut = max(0, len(buf) - max_end + 1)
+                    offset, buf = offset + cut, buf[cut:]
+                    break
+
+    # end of file: all remaining positions can be decided
+    while skip_from is None:
+        m = PAT_DOC_START.search(buf)
+        if not m:
+            yield buf
+            return
+        yield buf[:m.start()]
+        skip_from = offset + m.start()
+        offset, buf = offset + m.end(), buf[m.end():]
+        m = PAT_DOC_END.search(buf)
+        if m:
+            yield '\n'
+            offset, buf, skip_from = offset + m.end(), buf[m.end():], None
+
+    # unterminated document: nothing after `skip_from` matches, hence re-read it verbatim
+    with contextlib.ExitStack() as stack:
+        if reopen is None:
+            f.seek(0)
+        else:
+            f = stack.enter_context(reopen())
+        while skip_from > 0:
+            skip_from -= len(f.read(min(chunk_size, skip_from)))
+        yield from iter(lambda: f.read(chunk_size), '')
+
+
+def tab_replace(match, tab_ratio: float = 0.1):
+    """ Helper function to retain text-heavy tables (keep if proportion of digits < `tab_ratio`) """
+    if keep_table(PAT_MU2.sub('\n', match.group(0)), tab_ratio):
+        return f'[TABLE]{match.group(0)}[/TABLE]'
+    return ''
+
+
+def keep_table(tab_content: str, tab_ratio: float = 0.1):
+    """ Decide whether a table is text-heavy, i.e. whether the proportion of digits among the ASCII letters and digits
+    of its text (markup removed) is below `tab_ratio` """
+    # count ASCII letters (not counting those of 'nbsp') and digits without building one string per character class
+    classes = tab_content.encode('ascii', 'ignore').translate(TAB_CHAR_CLASSES)
+    c = classes.count(b'a') - 4 * tab_content.count('nbsp')
+    d = classes.count(b'0')
+    # error handling for ZeroDivisionError
+    try:
+        num_ratio = d / (c + d)
+        return num_ratio < tab_ratio
+    except Exception as e:
+        print(type(e).__name__, e)
+        return False
+
+
+def clean_filing(filing: Path, tab_ratio: float = 0.1, engine: str = 'regex', trace_memory: bool = True):
+    """ Clean a single raw filing
+    :param Path filing:
+        Path to raw filing
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained
+    :param str engine:
+        Cleaning engine (regex: cascade of cleaning regexes, tokenizer: single pass of `markup.clean_text`)
+    :param bool trace_memory:
+        Trace peak memory (slows down cleaning)
+    :return tuple:
+        Cleaned text and metrics of the filing (see `metrics`), i.e. wall time, size of the raw filing,
+        peak memory allocated while cleaning and time spent per cleaning step
+    """
+    store = storage.store_for(filing)
+    with store.open(filing) as f:
+        txt, stats = clean_stream(f, tab_ratio, engine, trace_memory, reopen=functools.partial(store.open, filing))
+    return txt, {**stats, 'bytes': store.fingerprint(filing)[0]}
+
+
+def clean_stream(f, tab_ratio: float = 0.1, engine: str = 'regex', trace_memory: bool = True, reopen=None):
+    """ Clean a raw filing read from a stream (see `clean_filing`)
+    :param io.TextIOBase f:
+        Raw filing opened in text mode
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained
+    :param str engine:
+        Cleaning engine (one of: regex, tokenizer)
+    :param bool trace_memory:
+        Trace peak memory (slows down cleaning)
+    :param callable reopen:
+        Returns the filing opened anew (for streams that cannot seek back, e.g. packed filings)
+    :return tuple:
+        Cleaned text and metrics (wall time, peak memory and time spent per cleaning step)
+    """
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    timings = {}
+
+    def lap(step):
+        timings[f'time:{step}'] = time.perf_counter() - t0 - sum(timings.values())
+
+    txt = ''.join(iter_text_documents(f, reopen=reopen))
+    lap('mu1_ascii')
+    if engine == 'tokenizer':
+        txt = markup.clean_text(txt, functools.partial(keep_table, tab_ratio=tab_ratio))
+        lap('tokenizer')
+    else:
+        for k, v in PAT_MU1.items():
+            if k != 'ascii':
+                txt = v.sub('\n', txt)
+                lap(f'mu1_{k}')
+        txt = html.unescape(txt)
+        lap('unescape')
+        txt = PAT_TAB1.sub(functools.partial(tab_replace, tab_ratio=tab_ratio), txt)
+        lap('tab1')
+        txt = PAT_MU2.sub('\n', txt)
+        lap('mu2')
+        txt = re.sub(r'\xa0|\u200b', '\n', txt).strip()
+        txt = re.sub(r'(\n\s*){3,}', '\n\n', txt).strip()
+        lap('whitespace')
+    seconds = time.perf_counter() - t0
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return txt, {'seconds': seconds, 'peak_mb': peak, **timings}
+
+
+def list_filings(start: int, end: int, form_type: str = '10-k'):
+    """ Collect all filings of the quarters in the start-end period
     :param int start:
         Start year for scraping
     :param int start:
         End year for scraping
     :param str form_type:
         Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return list:
+        Paths to filings (excluding extracted sections)
+    """
+    filings = []
+    store = storage.get_store(Path('output', 'filings', form_type))
+    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+        path_filings_dir = Path('output', 'filings', form_type, str(year), f'q{str(qtr)}')
+        filings += [f for f in store.list(path_filings_dir) if not re.search('_', str(f))]
+    return filings
+
+
+def map_filings(func, filings: list, workers: int = 1):
+    """ Apply `func` to each filing, optionally in a process pool
+    :param callable func:
+        Picklable (module-level) function taking the path to a filing
+    :param list filings:
+        Paths to filings
+    :param int workers:
+        Number of worker processes (1 runs in the current process)
+    :return Iterator[tuple]:
+        Pairs of filing and result (in order of `filings`)
+    """
+    if workers > 1 and len(filings) > 1:
+        chunksize = max(1, min(64, len(filings) // (4 * workers)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from zip(filings, pool.map(func, filings, chunksize=chunksize))
+    else:
+        yield from zip(filings, map(func, filings))
+
+
+def is_raw_filing(filing: Path):
+    """ Check whether a filing still contains its SGML container (i.e. was not cleaned yet) """
+    with storage.store_for(filing).open(filing) as f:
+        return PAT_RAW.search(f.read(RAW_PROBE_SIZE)) is not None
+
+
+def stage_version(stage: str, form_type: str = '10-k', tab_ratio: float = 0.1, engine: str = 'regex'):
+    """ Hash the version of a processing stage from the patterns and parameters it depends on
+    :param str stage:
+        Processing stage (clean or a section type)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained (clean stage only)
+    :param str engine:
+        Cleaning engine (clean stage only)
+    :return str:
+        Version hash
     """
+    if stage == 'clean' and engine == 'tokenizer':
+        return manifest.version_hash(CLEAN_VERSION, tab_ratio, engine, markup.PAT_TOKEN.pattern)
+    if stage == 'clean':
+        return manifest.version_hash(CLEAN_VERSION, tab_ratio, [p.pattern for p in PAT_MU1.values()],
+                                     PAT_MU2.pattern, PAT_TAB1.pattern)
+    return manifest.version_hash(EXTRACT_VERSION, PAT_TAB2.pattern, PAT_TOC1.pattern, PAT_TOC2.pattern,
+                                 [p.pattern for anchors in section_patterns(stage, form_type) for p in anchors])
+
+
+def clean_filings(start: int, end: int, form_type: str = '10-k', workers: int = 1, tab_ratio: float = 0.1,
+                  filings: list = None, engine: str = 'regex'):
+    """ Preprocess raw filings (skipping filings that were already cleaned with the current version)
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int workers:
+        Number of worker processes
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained
+    :param list filings:
+        Paths to filings to be cleaned instead of all filings of the start-end period (optional)
+    :param str engine:
+        Cleaning engine (one of: regex, tokenizer)
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'Engine not implemented! Choose from: {", ".join(ENGINES)}.')
 
     path_log = Path('output', 'filings', form_type, 'log_parse.txt')
-    tab_ratio = 0.1
-
-    # define conditional replacement pattern for table-tags (keep if proportion of digits < 10%)
-    def tab_replace(match):
-        """ Helper function to retain text-heavy tables """
-        tab_content = match.group(0)
-        tab_content = PAT_MU2.sub('\n', tab_content)
-        c = len(re.sub('[^A-Za-z]|nbsp', '', tab_content))
-        d = len(re.sub('[^0-9]|nbsp', '', tab_content))
-        # error handling for ZeroDivisionError
-        try:
-            num_ratio = d / (c + d)
-            if num_ratio < tab_ratio:
-                return f'[TABLE]{match.group(0)}[/TABLE]'
-            else:
-                return ''
-        except Exception as e:
-            print(type(e).__name__, e)
-            return ''
+    con = manifest.connect(form_type)
+    mcon = metrics.connect(form_type)
+    store = storage.get_store(Path('output', 'filings', form_type))
+    version = stage_version('clean', form_type, tab_ratio, engine)
 
-    # iterate over all quarters in the start-end period and clean available filings
-    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+    # cleaning overwrites the raw filing, hence only filings whose content is not a recorded cleaning output are stale
+    candidates = list_filings(start, end, form_type) if filings is None else filings
+    filings, hashes, outdated = [], {}, 0
+    for filing in candidates:
+        entry = manifest.entry(con, filing, 'clean')
+        h = manifest.filing_hash(con, filing)
+        if entry is not None and h == entry['output_hash']:
+            outdated += entry['version'] != version
+        elif is_raw_filing(filing):
+            filings.append(filing)
+            hashes[filing] = h
+        elif entry is not None:
+            # a cleaned filing that changed since (e.g. edited or copied in) is not cleaned twice
+            outdated += 1
 
-        path_filings_dir = Path('output', 'filings', form_type, str(year), f'q{str(qtr)}')
-        filings = [f for f in path_filings_dir.rglob('*.txt') if not re.search('_', str(f))]
-
-        for filing in tqdm(filings):
-
-            with filing.open('r', encoding='utf-8', errors='ignore') as f:
-                txt = f.read()
-                for v in PAT_MU1.values():
-                    txt = v.sub('\n', txt)
-                txt = html.unescape(txt)
-                txt = PAT_TAB1.sub(tab_replace, txt)
-                txt = PAT_MU2.sub('\n', txt)
-                txt = re.sub(r'\xa0|\u200b', '\n', txt).strip()
-                txt = re.sub(r'(\n\s*){3,}', '\n\n', txt).strip()
-
-            with open(filing, 'w', encoding='utf-8', errors='ignore') as f:
-                f.write(txt)
-            with open(path_log, 'a', encoding='utf-8') as log:
-                log.write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Cleaning successful! Write to {f.name}'
-                          f'\t Length: {len(txt)} chars\n')
+    # clean stale filings of all quarters in the start-end period (logs are only written by the main process)
+    with path_log.open('a', encoding='utf-8') as log:
+        func = functools.partial(clean_filing, tab_ratio=tab_ratio, engine=engine)
+        for i, (filing, (txt, stats)) in enumerate(tqdm(map_filings(func, filings, workers), total=len(filings))):
+
+            store.write_text(filing, txt)
+            manifest.record(con, filing, 'clean', version, hashes[filing], output_hash=store.hash(filing))
+            metrics.record(mcon, 'clean', filing, {**stats, 'chars': len(txt)})
+            log.write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Cleaning successful! Write to {filing}'
+                      f'\t Length: {len(txt)} chars\t Peak memory: {stats["peak_mb"]:.1f} MB\n')
+            if i % 100 == 99:
+                con.commit()
+                mcon.commit()
+    con.commit()
+    con.close()
+    mcon.commit()
+    mcon.close()
 
+    if outdated:
+        print(f'\n{outdated} filings were cleaned with an outdated version or changed since they were cleaned. '
+              f'Download the raw filings again to re-clean them.')
     print(f'\nCleaning completed!\n'
           f'Log-file written to {path_log}')
 
 
-def extract_mda(start: int, end: int, form_type: str = '10-k'):
-    """ Extract MD&A section from corporate filing
+def compare_task(filing: Path, tab_ratio: float = 0.1):
+    """ Worker function cleaning a raw filing with both engines, returning texts and wall times per engine """
+    return {engine: clean_filing(filing, tab_ratio, engine, trace_memory=False) for engine in ENGINES}
+
+
+def compare_engines(start: int, end: int, form_type: str = '10-k', n: int = 100, seed: int = 2020,
+                    workers: int = 1, tab_ratio: float = 0.1):
+    """ Clean a random sample of raw filings with both cleaning engines (without writing the cleaned filings) and
+    report their agreement and speed
     :param int start:
         Start year for scraping
     :param int start:
         End year for scraping
     :param str form_type:
         Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int n:
+        Number of sampled raw filings
+    :param int seed:
+        Random seed for sampling
+    :param int workers:
+        Number of worker processes
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained
     """
+    filings = [f for f in list_filings(start, end, form_type) if is_raw_filing(f)]
+    filings = random.Random(seed).sample(filings, min(n, len(filings)))
+    if not filings:
+        print('No raw filings found! Download filings first.')
+        return
 
-    path_log = Path('output', 'filings', form_type, 'log_extract_mda.txt')
+    path_diff_dir = Path('output', 'compare', form_type)
+    path_diff_dir.mkdir(parents=True, exist_ok=True)
+    seconds = dict.fromkeys(ENGINES, 0.0)
+    identical, ratios = 0, []
+    for filing, results in tqdm(map_filings(functools.partial(compare_task, tab_ratio=tab_ratio), filings, workers),
+                                total=len(filings)):
+        (txt_regex, stats_regex), (txt_tokenizer, stats_tokenizer) = results['regex'], results['tokenizer']
+        seconds['regex'] += stats_regex['seconds']
+        seconds['tokenizer'] += stats_tokenizer['seconds']
+        if txt_regex == txt_tokenizer:
+            identical += 1
+            continue
+        lines_regex, lines_tokenizer = txt_regex.splitlines(keepends=True), txt_tokenizer.splitlines(keepends=True)
+        ratios.append(difflib.SequenceMatcher(None, lines_regex, lines_tokenizer, autojunk=False).ratio())
+        with Path(path_diff_dir, f'{filing.stem}.diff').open('w', encoding='utf-8') as f:
+            f.writelines(difflib.unified_diff(lines_regex, lines_tokenizer, f'{filing} (regex)',
+                                              f'{filing} (tokenizer)'))
 
-    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+    print(f'\n{identical}/{len(filings)} filings cleaned identically by both engines.')
+    if ratios:
+        print(f'{len(ratios)} filings differ (mean similarity of lines: {sum(ratios) / len(ratios):.4f}), '
+              f'diffs written to {path_diff_dir}')
+    print(f'Cleaning time: regex {seconds["regex"]:.2f}s, tokenizer {seconds["tokenizer"]:.2f}s '
+          f'({seconds["regex"] / max(seconds["tokenizer"], 1e-9):.1f}x)')
 
-        path_filings_dir = Path('output', 'filings', form_type, str(year), f'q{str(qtr)}')
-        filings = [f for f in path_filings_dir.rglob('*.txt') if not re.search('_', str(f))]
-
-        for filing in tqdm(filings):
-
-            path_mda = Path(filing.parent, f'{filing.stem}_mda.txt')
-            if not path_mda.exists():
-                with filing.open('r', encoding='utf-8', errors='ignore') as f:
-                    txt = f.read()
-                    mda = ''
-                    txt = PAT_TAB2.sub('', txt)
-                    # search for matches with MD&A pattern defined above and keep longest match (to omit matches within toc or elsewhere)
-                    if form_type == '10-k':
-                        for match in PAT_10K_MDA1.finditer(txt):
-                            if len(match.group(0)) > len(mda):
-                                mda = match.group(0)
-                        for match in PAT_10K_MDA2.finditer(txt):
-                            if len(match.group(0)) > len(mda):
-                                mda = match.group(0)
-                    elif form_type == '10-q':
-                        for match in PAT_10Q_MDA.finditer(txt):
-                            if len(match.group(0)) > len(mda):
-                                mda = match.group(0)
-                    mda = re.sub(PAT_TOC1, ' ', mda)
-                    mda = re.sub(PAT_TOC2, ' ', mda)
-                    mda = re.sub(r'(\_{2,}|\-{2,}|={2,})', ' ', mda)
-                    mda = re.sub(r'(\s{1,})', ' ', mda)
-                    mda = re.sub(r' (,|;|\.|’|®) ', r'\1 ', mda)
-                    mda = re.sub(r'^(.*?)" -->', '', mda)
-
-                with path_mda.open('w', encoding='utf-8') as f:
-                    f.write(mda)
-                with path_log.open('a', encoding='utf-8') as f:
-                    f.write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] MD&A extraction successful! Write to {path_mda}'
-                            f'\t Length: {len(mda)} chars\n')
 
-    print(f'\nExtraction completed!\n'
-          f'Log-file written to {path_log}\n')
+def profile_task(filing: Path, sections: tuple = ('mda',), form_type: str = '10-k', tab_ratio: float = 0.1,
+                 timeout: float = SECTION_TIMEOUT):
+    """ Worker function cleaning (if raw) and extracting sections of a filing in memory, returning the calls and
+    time per pattern (see `parsing_patterns.pattern_stats`) """
+    reset_stats()
+    if is_raw_filing(filing):
+        txt = clean_filing(filing, tab_ratio, trace_memory=False)[0]
+    else:
+        txt = storage.store_for(filing).read_text(filing)
+    deadline = time.monotonic() + timeout if timeout else None
+    extract_sections_text(txt, sections, form_type, deadline)
+    return pattern_stats()
 
 
-def extract_item1(start: int, end: int, form_type: str = '10-k'):
-    """ Extract Item 1 section from corporate filing
+def profile_patterns(start: int, end: int, form_type: str = '10-k', n: int = 100, seed: int = 2020,
+                     workers: int = 1, sections: tuple = ('mda', 'item1'), tab_ratio: float = 0.1,
+                     timeout: float = SECTION_TIMEOUT):
+    """ Clean (if raw) and extract sections of a random sample of filings in memory (without writing any output)
+    and report the number of calls and cumulative time per pattern, i.e. which pattern to optimize first
     :param int start:
         Start year for scraping
     :param int start:
         End year for scraping
     :param str form_type:
         Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int n:
+        Number of sampled filings
+    :param int seed:
+        Random seed for sampling
+    :param int workers:
+        Number of worker processes
+    :param tuple sections:
+        Section types (any of: mda, item1)
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained
+    :param float timeout:
+        Maximum time in seconds spent searching sections of a single filing
     """
+    for s in sections:
+        section_patterns(s, form_type)
+    filings = list_filings(start, end, form_type)
+    filings = random.Random(seed).sample(filings, min(n, len(filings)))
+    if not filings:
+        print('No filings found! Download filings first.')
+        return
 
-    path_log = Path('output', 'filings', form_type, 'log_extract_item1.txt')
+    totals = {}
+    func = functools.partial(profile_task, sections=sections, form_type=form_type, tab_ratio=tab_ratio,
+                             timeout=timeout)
+    for _, stats in tqdm(map_filings(func, filings, workers), total=len(filings)):
+        for row in stats:
+            total = totals.setdefault(row['name'], {**row, 'calls': 0, 'seconds': 0.0})
+            total['calls'] += row['calls']
+            total['seconds'] += row['seconds']
 
-    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+    seconds = sum(t['seconds'] for t in totals.values())
+    print(f'\nPattern time over {len(filings)} filings ({seconds:.2f}s in total):')
+    print(f'{"pattern":<28} {"engine":<6} {"calls":>10} {"seconds":>10} {"share":>7}')
+    for t in sorted(totals.values(), key=lambda t: -t['seconds']):
+        print(f'{t["name"]:<28} {t["engine"]:<6} {t["calls"]:>10} {t["seconds"]:>10.3f} '
+              f'{t["seconds"] / max(seconds, 1e-9):>7.1%}')
 
-        path_filings_dir = Path('output', 'filings', form_type, str(year), f'q{str(qtr)}')
-        filings = [f for f in path_filings_dir.rglob('*.txt') if not re.search('_', str(f))]
-
-        # iterate over all available filings in quarter
-        for filing in tqdm(filings):
-
-            path_item1 = Path(filing.parent, f'{filing.stem}_item1.txt')
-            if not path_item1.exists():
-                with filing.open('r', encoding='utf-8', errors='ignore') as f:
-                    txt = f.read()
-                    item1 = ''
-                    txt = PAT_TAB2.sub('', txt)
-                    # search for matches with item1 pattern defined above and keep longest match (to omit matches within toc or elsewhere)
-                    for match in PAT_ITEM1.finditer(txt):
-                        if len(match.group(0)) > len(item1):
-                            item1 = match.group(0)
-                    item1 = re.sub(PAT_TOC1, ' ', item1)
-                    item1 = re.sub(PAT_TOC2, ' ', item1)
-                    item1 = re.sub(r'(\_{2,}|\-{2,}|={2,})', ' ', item1)
-                    item1 = re.sub(r'(\s{1,})', ' ', item1)
-                    item1 = re.sub(r' (,|;|\.|’|®) ', r'\1 ', item1)
-                    item1 = re.sub(r'^(.*?)" -->', '', item1)
-
-                with path_item1.open('w', encoding='utf-8') as f:
-                    f.write(item1)
-                with path_log.open('a', encoding='utf-8') as f:
-                    f.write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Item 1 extraction successful! Write to {path_item1}'
-                            f'\t Length: {len(item1)} chars\n')
+
+def section_patterns(section: str, form_type: str = '10-k'):
+    """ Get start/end anchor patterns identifying a section in the specified form type
+    :param str section:
+        Section type (one of: mda, item1)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return list:
+        Pairs of start and end anchor patterns to be searched in order
+    """
+    if section == 'mda':
+        if form_type == '10-k':
+            return [PAT_10K_MDA1_ANCHORS, PAT_10K_MDA2_ANCHORS]
+        elif form_type == '10-q':
+            return [PAT_10Q_MDA_ANCHORS]
+        return []
+    elif section == 'item1':
+        return [PAT_ITEM1_ANCHORS]
+    raise ValueError(f'Section not implemented! Choose from: {", ".join(SECTION_NAMES)}.')
+
+
+def iter_section_spans(txt: str, anchors: tuple, deadline: float = None):
+    """ Two-phase section search yielding the same spans as `finditer` of the full section pattern
+    (start anchor + lazy section content + end anchor) without running the lazy content over the filing:
+    first all start and end anchor positions are located, then each start is paired with the first end
+    anchor following it
+    :param str txt:
+        Cleaned filing without table tags
+    :param tuple anchors:
+        Start and end anchor pattern
+    :param float deadline:
+        Point in time (`time.monotonic`) after which a `TimeoutError` is raised
+    :return Iterator[tuple]:
+        Start and end offsets of non-overlapping section matches
+    """
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    pat_start, pat_end = anchors
+    ends = [m.span() for m in pat_end.finditer(txt, overlapped=True, timeout=remaining())]
+    end_starts = [e[0] for e in ends]
+    pos = 0
+    for m in pat_start.finditer(txt, overlapped=True, timeout=remaining()):
+        if m.start() < pos:
+            continue
+        i = bisect.bisect_left(end_starts, m.end())
+        if i < len(ends):
+            pos = ends[i][1]
+            yield m.start(), pos
+
+
+def find_section(txt: str, patterns: list, deadline: float = None, timings: list = None):
+    """ Search for matches with section patterns and keep longest match (to omit matches within toc or elsewhere)
+    :param str txt:
+        Cleaned filing without table tags
+    :param list patterns:
+        Pairs of start and end anchor patterns
+    :param float deadline:
+        Point in time (`time.monotonic`) after which a `TimeoutError` is raised
+    :param list timings:
+        Optional list that receives the search time in seconds per pair of anchor patterns
+    :return tuple:
+        Start and end offset of the longest match and position of its pair of anchor patterns (0, 0, None if not
+        found)
+    """
+    span = (0, 0, None)
+    for i, anchors in enumerate(patterns, 1):
+        t0 = time.perf_counter()
+        for start, end in iter_section_spans(txt, anchors, deadline):
+            if end - start > span[1] - span[0]:
+                span = (start, end, i)
+        if timings is not None:
+            timings.append(time.perf_counter() - t0)
+    return span
+
+
+@functools.lru_cache(maxsize=None)
+def utf8_universe():
+    """ All Unicode scalar values (i.e. without surrogates) as a single string """
+    codepoints = array.array('I', itertools.chain(range(0xd800), range(0xe000, 0x110000)))
+    return codepoints.tobytes().decode(f'utf-32-{"le" if sys.byteorder == "little" else "be"}')
+
+
+def utf8_sequences(lo: int, hi: int):
+    """ Split a range of code points into sequences of byte ranges matching exactly their UTF-8 encodings
+    :param int lo:
+        First code point
+    :param int hi:
+        Last code point
+    :return list:
+        Sequences of (first byte, last byte) ranges
+    """
+    for bound in (0x7f, 0x7ff, 0xffff):
+        if lo <= bound < hi:
+            return utf8_sequences(lo, bound) + utf8_sequences(bound + 1, hi)
+    for i in range(1, 4):
+        mask = (1 << 6 * i) - 1
+        if lo & ~mask != hi & ~mask:
+            if lo & mask:
+                return utf8_sequences(lo, lo | mask) + utf8_sequences((lo | mask) + 1, hi)
+            if hi & mask != mask:
+                return utf8_sequences(lo, (hi & ~mask) - 1) + utf8_sequences(hi & ~mask, hi)
+    return [list(zip(chr(lo).encode('utf-8'), chr(hi).encode('utf-8')))]
+
+
+@functools.lru_cache(maxsize=None)
+def utf8_atom(atom: str, flags: int = 0):
+    """ Translate a single-character atom of a pattern (literal, escape, class or `.`) into a bytes pattern
+    matching exactly the UTF-8 encodings of the characters the atom matches in a str pattern
+    :param str atom:
+        Pattern atom (e.g. 'M', '[a-z]', '.', '–')
+    :param int flags:
+        Flags of the str pattern (e.g. `regex.I`)
+    :return str:
+        Bytes pattern source (ASCII)
+    """
+    pattern, universe = regex.compile(atom, flags), utf8_universe()
+    sample = universe[::97]
+    ranges = []
+    if len(pattern.findall(sample)) < len(sample) // 2:
+        for cp in map(ord, pattern.findall(universe)):
+            if ranges and ranges[-1][1] == cp - 1:
+                ranges[-1][1] = cp
+            else:
+                ranges.append([cp, cp])
+    else:
+        # atoms matching most characters (e.g. `.`) are cheaper to enumerate via their complement
+        unmatched = regex.compile(f'(?!{atom})(?s:.)', flags).findall(universe)
+        lo = 0
+        for cp in itertools.chain(map(ord, unmatched), [0x110000]):
+            if lo < cp:
+                ranges += [[lo, min(cp, 0xd800) - 1], [0xe000, cp - 1]] if lo < 0xd800 < cp else [[lo, cp - 1]]
+            lo = cp + 1
+
+    def byte_class(*byte_ranges):
+        members = ''.join(f'\\x{a:02x}' if a == b else f'\\x{a:02x}-\\x{b:02x}' for a, b in byte_ranges)
+        return members if len(byte_ranges) == 1 and byte_ranges[0][0] == byte_ranges[0][1] else f'[{members}]'
+
+    def trie(seqs):
+        # sequences sharing their leading byte range are factored, which keeps large classes (e.g. `\w`) compact
+        groups = {}
+        for seq in seqs:
+            groups.setdefault(seq[0], []).append(seq[1:])
+        alternatives = []
+        for first, rests in groups.items():
+            suffixes = trie(rests) if rests[0] else []
+            suffix = suffixes[0] if len(suffixes) == 1 else f'(?:{"|".join(suffixes)})' if suffixes else ''
+            alternatives.append(byte_class(first) + suffix)
+        return alternatives
+
+    ascii_ranges = [(lo, min(hi, 0x7f)) for lo, hi in ranges if lo < 0x80]
+    alternatives = [byte_class(*ascii_ranges)] if ascii_ranges else []
+    alternatives += trie([seq for lo, hi in ranges if hi >= 0x80 for seq in utf8_sequences(max(lo, 0x80), hi)])
+    if not alternatives:
+        return '(?!)'
+    return f'(?:{"|".join(alternatives)})'
+
+
+@functools.lru_cache(maxsize=None)
+def utf8_pattern(pattern):
+    """ Translate a str pattern into an equivalent bytes pattern for UTF-8 encoded text, i.e. each atom matches
+    the same characters as in the str pattern (including Unicode white space and case folding) and match
+    offsets are byte offsets of the same matches
+    :param regex.Pattern pattern:
+        Compiled str pattern without backreferences, word boundaries or inline flags
+    :return regex.Pattern:
+        Compiled bytes pattern
+    """
+    src, flags = pattern.pattern, pattern.flags & regex.I
+    out, i = [], 0
+    while i < len(src):
+        c = src[i]
+        if c == '\\':
+            if src[i + 1] in 'AbBZGxuUN0123456789':
+                raise ValueError(f'Unsupported escape in pattern: {src[i:i + 2]}')
+            atom, i = src[i:i + 2], i + 2
+        elif c == '[':
+            j = i + 1 + (src[i + 1] == '^')
+            j += src[j] == ']'
+            while src[j] != ']':
+                j += 2 if src[j] == '\\' else 1
+            atom, i = src[i:j + 1], j + 1
+        elif c == '(':
+            if src.startswith('(?', i):
+                opener = next((o for o in ('(?:', '(?=', '(?!', '(?<=', '(?<!') if src.startswith(o, i)), None)
+                if opener is None:
+                    raise ValueError(f'Unsupported group in pattern: {src[i:i + 4]}')
+            else:
+                opener = '('
+            out.append(opener)
+            i += len(opener)
+            continue
+        elif c in ')|*+?^$':
+            out.append(c)
+            i += 1
+            continue
+        elif c == '{' and regex.match(r'\{\d*,?\d*\}', src[i:]):
+            quantifier = regex.match(r'\{\d*,?\d*\}', src[i:]).group()
+            out.append(quantifier)
+            i += len(quantifier)
+            continue
+        else:
+            atom, i = c, i + 1
+        out.append(utf8_atom(atom, flags))
+    return regex.compile(''.join(out).encode('ascii'))
+
+
+@functools.lru_cache(maxsize=None)
+def utf8_anchors(anchors: tuple):
+    """ Start and end anchor patterns translated for searching UTF-8 encoded filings """
+    return tuple(utf8_pattern(p) for p in anchors)
+
+
+def find_section_bytes(buf, patterns: list, deadline: float = None, timings: list = None):
+    """ Search for section matches in the UTF-8 bytes of a filing (the same match as `find_section` on the decoded
+    filing)
+    :param bytes buf:
+        Cleaned filing without table tags (bytes or memory-mapped file)
+    :param list patterns:
+        Pairs of start and end anchor patterns (str patterns)
+    :param float deadline:
+        Point in time (`time.monotonic`) after which a `TimeoutError` is raised
+    :param list timings:
+        Optional list that receives the search time in seconds per pair of anchor patterns
+    :return tuple:
+        Start and end byte offset of the longest match and position of its pair of anchor patterns (0, 0, None if
+        not found)
+    """
+    span, length = (0, 0, None), 0
+    for i, anchors in enumerate(patterns, 1):
+        t0 = time.perf_counter()
+        for start, end in iter_section_spans(buf, utf8_anchors(anchors), deadline):
+            # matches are compared by their number of characters, which is at most their number of bytes
+            if end - start > length:
+                n = len(buf[start:end].translate(None, UTF8_CONTINUATION))
+                if n > length:
+                    span, length = (start, end, i), n
+        if timings is not None:
+            timings.append(time.perf_counter() - t0)
+    return span
+
+
+def unstrip_offset(tags: list, pos: int, end: bool = False):
+    """ Offset in a filing of an offset in the filing without table tags
+    :param list tags:
+        Start and end offsets of the table tags in the filing
+    :param int pos:
+        Offset in the filing without table tags
+    :param bool end:
+        Offset ends a span (tags at the offset are not skipped)
+    :return int:
+        Offset in the filing
+    """
+    for start, stop in tags:
+        if start > pos or end and start == pos:
+            break
+        pos += stop - start
+    return pos
+
+
+def search_section(find, txt, section: str, form_type: str = '10-k', deadline: float = None, stats: dict = None,
+                   read: float = 0.0, spans: dict = None):
+    """ Search and postprocess a single section
+    :param callable find:
+        Search function (`find_section` or `find_section_bytes`)
+    :param str txt:
+        Cleaned filing without table tags (str or UTF-8 bytes, according to `find`)
+    :param str section:
+        Section type (one of: mda, item1)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param float deadline:
+        Point in time (`time.monotonic`) after which the search is aborted
+    :param dict stats:
+        Optional dict that receives the metrics of the section (wall time including the time `read` spent
+        reading the filing, and time spent per pair of anchor patterns as `time:{section}_{i}`)
+    :param float read:
+        Time in seconds spent reading the filing
+    :param dict spans:
+        Optional dict that receives the span of the section in `txt` (see `find_section`; None if search timed out)
+    :return str:
+        Section text (empty if not found, None if search timed out)
+    """
+    timings = []
+    span = None
+    t0 = time.perf_counter()
+    try:
+        span = find(txt, section_patterns(section, form_type), deadline, timings)
+        match = txt[span[0]:span[1]]
+        txt = section_index.postprocess_section(match if isinstance(match, str) else
+                                                match.decode('utf-8', errors='ignore'))
+    except TimeoutError:
+        txt = None
+    if stats is not None:
+        seconds = time.perf_counter() - t0
+        stats[section] = {'seconds': read + seconds, 'time:read': read,
+                          **{f'time:{section}_{i + 1}': t for i, t in enumerate(timings)},
+                          'time:postprocess': seconds - sum(timings) if txt is not None else None}
+    if spans is not None:
+        spans[section] = span
+    return txt
+
+
+def extract_sections_filing(filing: Path, sections: tuple = ('mda',), form_type: str = '10-k',
+                            overwrite: bool = True, timeout: float = SECTION_TIMEOUT, use_mmap: bool = False,
+                            stats: dict = None, spans: dict = None):
+    """ Extract several sections from a single cleaned filing, reading and normalizing it only once
+    :param Path filing:
+        Path to cleaned filing
+    :param tuple sections:
+        Section types (any of: mda, item1)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param bool overwrite:
+        Also extract sections that were already written to disk
+    :param float timeout:
+        Maximum time in seconds spent searching sections of the filing
+    :param bool use_mmap:
+        Search the memory-mapped UTF-8 bytes of the filing instead of the decoded text
+    :param dict stats:
+        Optional dict that receives the metrics (see `metrics`) per section type
+    :param dict spans:
+        Optional dict that receives the character offsets of each section in the cleaned filing and the position
+        of the matching pair of anchor patterns (see `section_index.record`)
+    :return dict:
+        Extracted section text (empty if not found, None if search timed out) per section type
+    """
+    store = storage.store_for(filing)
+    if not overwrite:
+        sections = [s for s in sections if not store.exists(Path(filing.parent, f'{filing.stem}_{s}.txt'))]
+    if not sections:
+        return {}
+    deadline = time.monotonic() + timeout if timeout else None
+    t0 = time.perf_counter()
+    if use_mmap:
+        with store.open_buffer(filing) as buf:
+            # carriage returns are translated when decoding plain files, hence such filings are searched as text
+            if buf.find(b'\r') < 0:
+                tags = [m.span() for m in PAT_TAB2_BYTES.finditer(buf)]
+                stripped = PAT_TAB2_BYTES.sub(b'', buf) if tags else buf
+                read = time.perf_counter() - t0
+                found = {}
+                extracted = {s: search_section(find_section_bytes, stripped, s, form_type, deadline, stats, read,
+                                               found) for s in sections}
+                if spans is not None:
+                    for s, span in found.items():
+                        if span is not None and span[2] is not None:
+                            # byte offsets are converted into character offsets of the decoded filing
+                            start, end = unstrip_offset(tags, span[0]), unstrip_offset(tags, span[1], end=True)
+                            n = len(buf[:start].translate(None, UTF8_CONTINUATION))
+                            span = (n, n + len(buf[start:end].translate(None, UTF8_CONTINUATION)), span[2])
+                        spans[s] = span
+                return extracted
+    return extract_sections_text(store.read_text(filing), sections, form_type, deadline, stats, t0, spans)
+
+
+def extract_sections_text(txt: str, sections: tuple = ('mda',), form_type: str = '10-k', deadline: float = None,
+                          stats: dict = None, t0: float = None, spans: dict = None):
+    """ Extract several sections from the text of a cleaned filing (see `extract_sections_filing`)
+    :param str txt:
+        Cleaned filing
+    :param tuple sections:
+        Section types (any of: mda, item1)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param float deadline:
+        Point in time (`time.monotonic`) after which the search is aborted
+    :param dict stats:
+        Optional dict that receives the metrics (see `metrics`) per section type
+    :param float t0:
+        Point in time (`time.perf_counter`) reading the filing started (counted as read time)
+    :param dict spans:
+        Optional dict that receives the offsets of each section in `txt` and the position of the matching pair of
+        anchor patterns (see `section_index.record`)
+    :return dict:
+        Extracted section text (empty if not found, None if search timed out) per section type
+    """
+    t0 = time.perf_counter() if t0 is None else t0
+    tags = [m.span() for m in PAT_TAB2.finditer(txt)]
+    txt = PAT_TAB2.sub('', txt) if tags else txt
+    read = time.perf_counter() - t0
+    found = {}
+    extracted = {s: search_section(find_section, txt, s, form_type, deadline, stats, read, found) for s in sections}
+    if spans is not None:
+        for s, span in found.items():
+            if span is not None and span[2] is not None:
+                span = (unstrip_offset(tags, span[0]), unstrip_offset(tags, span[1], end=True), span[2])
+            spans[s] = span
+    return extracted
+
+
+def extract_sections_task(task: tuple, form_type: str = '10-k', timeout: float = SECTION_TIMEOUT,
+                          use_mmap: bool = False):
+    """ Worker wrapper of `extract_sections_filing` for a (filing, sections) task, returning the extracted sections,
+    their metrics and their spans """
+    filing, sections = task
+    stats, spans = {}, {}
+    extracted = extract_sections_filing(filing, sections, form_type, timeout=timeout, use_mmap=use_mmap, stats=stats,
+                                        spans=spans)
+    return extracted, stats, spans
+
+
+def pipeline_task(body: bytes, sections: tuple = ('mda',), form_type: str = '10-k', tab_ratio: float = 0.1,
+                  engine: str = 'regex', timeout: float = SECTION_TIMEOUT):
+    """ Worker function of `scraping.run_pipeline` cleaning a downloaded raw filing in memory and extracting its
+    sections from the cleaned text
+    :param bytes body:
+        Raw filing as downloaded
+    :param tuple sections:
+        Section types (any of: mda, item1)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param float tab_ratio:
+        Maximum proportion of digits for a table to be retained
+    :param str engine:
+        Cleaning engine (one of: regex, tokenizer)
+    :param float timeout:
+        Maximum time in seconds spent searching sections of the filing
+    :return tuple:
+        Cleaned text, its metrics, extracted sections (see `extract_sections_filing`), their metrics and their spans
+    """
+    # universal newlines, as if the filing was read from disk
+    f = io.StringIO(body.decode('utf-8', errors='ignore'), newline=None)
+    txt, stats = clean_stream(f, tab_ratio, engine, trace_memory=False)
+    section_stats, spans = {}, {}
+    deadline = time.monotonic() + timeout if timeout else None
+    extracted = extract_sections_text(txt, sections, form_type, deadline, section_stats, spans=spans) if sections else {}
+    return txt, {**stats, 'bytes': len(body)}, extracted, section_stats, spans
+
+
+def extract_sections(start: int, end: int, form_type: str = '10-k',
+                     sections: tuple = ('mda', 'item1'), workers: int = 1,
+                     timeout: float = SECTION_TIMEOUT, filings: list = None, use_mmap: bool = False,
+                     materialize: bool = False):
+    """ Extract sections from corporate filings in a single pass over each filing and record their offsets in the
+    section index (see `section_index`)
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param tuple sections:
+        Section types (any of: mda, item1)
+    :param int workers:
+        Number of worker processes
+    :param float timeout:
+        Maximum time in seconds spent searching sections of a single filing
+    :param list filings:
+        Paths to cleaned filings instead of all filings of the start-end period (optional)
+    :param bool use_mmap:
+        Search the memory-mapped UTF-8 bytes of each filing, decoding only the extracted sections
+    :param bool materialize:
+        Also write each section next to its filing (`{accession}_{section}.txt`)
+    """
+    for s in sections:
+        section_patterns(s, form_type)
+
+    paths_log = {s: Path('output', 'filings', form_type, f'log_extract_{s}.txt') for s in sections}
+    con = manifest.connect(form_type)
+    mcon = metrics.connect(form_type)
+    scon = section_index.connect(form_type)
+    store = storage.get_store(Path('output', 'filings', form_type))
+    versions = {s: stage_version(s, form_type) for s in sections}
+
+    # a section is stale if it is not indexed (or not materialized if requested) or its filing or version changed
+    # since extraction
+    tasks, hashes = [], {}
+    for filing in list_filings(start, end, form_type) if filings is None else filings:
+        h = manifest.filing_hash(con, filing)
+        stale = []
+        for s in sections:
+            entry = manifest.entry(con, filing, s)
+            if (entry is None or entry['version'] != versions[s] or entry['input_hash'] != h
+                    or section_index.entry(scon, filing, s) is None
+                    or materialize and not store.exists(Path(filing.parent, f'{filing.stem}_{s}.txt'))):
+                stale.append(s)
+        if stale:
+            tasks.append((filing, tuple(stale)))
+            hashes[filing] = h
+    func = functools.partial(extract_sections_task, form_type=form_type, timeout=timeout, use_mmap=use_mmap)
+
+    with contextlib.ExitStack() as stack:
+        logs = {s: stack.enter_context(p.open('a', encoding='utf-8')) for s, p in paths_log.items()}
+        for i, ((filing, _), (extracted, stats, spans)) in enumerate(tqdm(map_filings(func, tasks, workers),
+                                                                          total=len(tasks))):
+            for s, section in extracted.items():
+                status = 'successful'
+                if section is None:
+                    section, status = '', f'timed out after {timeout}s'
+                    stats[s]['timed_out'] = 1
+                section_index.record(scon, filing, s, spans[s], len(section))
+                if materialize:
+                    path_section = Path(filing.parent, f'{filing.stem}_{s}.txt')
+                    store.write_text(path_section, section)
+                    manifest.record(con, filing, s, versions[s], hashes[filing], path_section,
+                                    hashlib.sha256(section.encode('utf-8')).hexdigest())
+                else:
+                    path_section = section_index.index_path(form_type)
+                    manifest.record(con, filing, s, versions[s], hashes[filing])
+                metrics.record(mcon, s, filing, {**stats[s], 'chars': len(section)})
+                logs[s].write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {SECTION_NAMES[s]} extraction {status}! Write to {path_section}'
+                              f'\t Length: {len(section)} chars\n')
+            if i % 100 == 99:
+                con.commit()
+                mcon.commit()
+                scon.commit()
+    con.commit()
+    con.close()
+    mcon.commit()
+    mcon.close()
+    scon.commit()
+    scon.close()
+
+    print(f'\nExtraction completed!\n'
+          f'Log-file(s) written to {", ".join(map(str, paths_log.values()))}\n')
+
+
+def extract_mda(start: int, end: int, form_type: str = '10-k', workers: int = 1,
+                timeout: float = SECTION_TIMEOUT, use_mmap: bool = False, materialize: bool = False):
+    """ Extract MD&A section from corporate filing
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int workers:
+        Number of worker processes
+    :param float timeout:
+        Maximum time in seconds spent searching the section of a single filing
+    :param bool use_mmap:
+        Search the memory-mapped UTF-8 bytes of each filing, decoding only the extracted section
+    :param bool materialize:
+        Also write the section next to each filing (`{accession}_{section}.txt`)
+    """
+    extract_sections(start, end, form_type, ('mda',), workers, timeout, use_mmap=use_mmap,
+                     materialize=materialize)
+
+
+def extract_item1(start: int, end: int, form_type: str = '10-k', workers: int = 1,
+                  timeout: float = SECTION_TIMEOUT, use_mmap: bool = False, materialize: bool = False):
+    """ Extract Item 1 section from corporate filing
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int workers:
+        Number of worker processes
+    :param float timeout:
+        Maximum time in seconds spent searching the section of a single filing
+    :param bool use_mmap:
+        Search the memory-mapped UTF-8 bytes of each filing, decoding only the extracted section
+    :param bool materialize:
+        Also write the section next to each filing (`{accession}_{section}.txt`)
+    """
+    extract_sections(start, end, form_type, ('item1',), workers, timeout, use_mmap=use_mmap,
+                     materialize=materialize)
 
 
 if __name__ == '__main__':
     args = docopt(__doc__)
     if args['clean-filings']:
-        clean_filings(int(args['--start']), int(args['--end']), args['--form-type'])
+        clean_filings(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--workers']),
+                      float(args['--tab-ratio']), engine=args['--engine'])
+    elif args['compare-engines']:
+        compare_engines(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--no-of-filings']),
+                        int(args['--seed']), int(args['--workers']), float(args['--tab-ratio']))
+    elif args['profile-patterns']:
+        profile_patterns(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--no-of-filings']),
+                         int(args['--seed']), int(args['--workers']), tuple(args['--sections'].split(',')),
+                         float(args['--tab-ratio']), float(args['--timeout']))
     elif args['extract-mda']:
-        extract_mda(int(args['--start']), int(args['--end']), args['--form-type'])
+        extract_mda(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--workers']),
+                    float(args['--timeout']), args['--mmap'], args['--materialize'])
     elif args['extract-item1']:
-        extract_item1(int(args['--start']), int(args['--end']), args['--form-type'])
+        extract_item1(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--workers']),
+                      float(args['--timeout']), args['--mmap'], args['--materialize'])
+    elif args['extract-sections']:
+        extract_sections(int(args['--start']), int(args['--end']), args['--form-type'],
+                         tuple(args['--sections'].split(',')), int(args['--workers']), float(args['--timeout']),
+                         use_mmap=args['--mmap'], materialize=args['--materialize'])
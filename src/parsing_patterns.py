@@ -1,57 +1,239 @@
-"""Module for storing regular expressions used for parsing SEC filings."""
+"""Module for storing regular expressions used for parsing SEC filings.
+
+Patterns are registered with the engine they require and compiled on first use, so that importing the module
+does not compile the large section patterns. Simple patterns without lookarounds are marked `linear` and run on
+a linear-time engine (`re2`) if installed, falling back to stdlib `re` otherwise; the section anchors require the
+`regex` module (variable-length lookbehinds, overlapped matching and timeouts). Each pattern records the number
+of calls and the cumulative time spent in them (see `pattern_stats`).
+"""
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
 
 import re
+import time
 
 import regex as re_
 
+try:
+    import re2
+except ImportError:  # optional dependency, simple patterns fall back to stdlib `re`
+    re2 = None
+
+
+ENGINES = ('re', 'linear', 'regex')
+PATTERNS = {}
+
+
+class LazyPattern:
+    """ Compiled pattern proxy that compiles on first use and records calls and cumulative time of its match
+    methods (any other attribute is looked up on the compiled pattern) """
+
+    def __init__(self, name: str, pattern, flags: int = 0, engine: str = 're'):
+        self.name = name
+        self.pattern = pattern
+        self.flags = flags
+        self.engine = engine
+        self.calls = 0
+        self.seconds = 0.0
+        self._compiled = None
+        self._engine = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name}, engine={self.engine})'
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.compiled, name)
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled, self._engine = compile_pattern(self.pattern, self.flags, self.engine)
+        return self._compiled
+
+    @property
+    def engine_used(self):
+        """ Engine the pattern was compiled with (None if not compiled yet) """
+        return self._engine
+
+    def _timed(self, method: str, *args, **kwargs):
+        func = getattr(self.compiled, method)
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.calls += 1
+
+    def search(self, *args, **kwargs):
+        return self._timed('search', *args, **kwargs)
+
+    def match(self, *args, **kwargs):
+        return self._timed('match', *args, **kwargs)
+
+    def fullmatch(self, *args, **kwargs):
+        return self._timed('fullmatch', *args, **kwargs)
+
+    def sub(self, *args, **kwargs):
+        return self._timed('sub', *args, **kwargs)
+
+    def subn(self, *args, **kwargs):
+        return self._timed('subn', *args, **kwargs)
+
+    def split(self, *args, **kwargs):
+        return self._timed('split', *args, **kwargs)
+
+    def findall(self, *args, **kwargs):
+        return self._timed('findall', *args, **kwargs)
+
+    def finditer(self, *args, **kwargs):
+        """ Iterate over matches, timing the search for each match (not the caller's work between matches) """
+        it = self._timed('finditer', *args, **kwargs)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                m = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.seconds += time.perf_counter() - t0
+            yield m
+
+
+def compile_pattern(pattern, flags: int = 0, engine: str = 're'):
+    """ Compile a pattern with an engine
+    :param pattern:
+        Pattern source (str or bytes)
+    :param int flags:
+        Flags (`re.I` and `regex.I` are equal)
+    :param str engine:
+        Engine (one of: re, linear, regex); `linear` uses `re2` if installed and the (str) pattern is supported
+    :return tuple:
+        Compiled pattern and engine used
+    """
+    if engine == 'regex':
+        return re_.compile(pattern, flags), 'regex'
+    # bytes patterns are matched on memory-mapped buffers, which stay on stdlib `re`
+    if engine == 'linear' and re2 is not None and not flags & ~re.I and isinstance(pattern, str):
+        try:
+            return re2.compile(('(?i)' if flags & re.I else '') + pattern), 're2'
+        except Exception:  # unsupported syntax
+            pass
+    return re.compile(pattern, flags), 're'
+
+
+def register(name: str, pattern, flags: int = 0, engine: str = 're'):
+    """ Register a pattern under a unique name (compiled on first use)
+    :param str name:
+        Name of the pattern in the timing statistics
+    :param pattern:
+        Pattern source (str or bytes)
+    :param int flags:
+        Flags
+    :param str engine:
+        Engine (one of: re, linear, regex)
+    :return LazyPattern:
+        Pattern proxy
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'Engine not implemented! Choose from: {", ".join(ENGINES)}.')
+    PATTERNS[name] = LazyPattern(name, pattern, flags, engine)
+    return PATTERNS[name]
+
+
+def pattern_stats():
+    """ Number of calls and cumulative time per pattern used in this process (in descending order of time)
+    :return list:
+        Dicts with name, engine, calls and seconds
+    """
+    return [{'name': p.name, 'engine': p.engine_used, 'calls': p.calls, 'seconds': p.seconds}
+            for p in sorted(PATTERNS.values(), key=lambda p: -p.seconds) if p.calls]
+
+
+def reset_stats():
+    """ Reset calls and cumulative time of all patterns """
+    for p in PATTERNS.values():
+        p.calls, p.seconds = 0, 0.0
+
 
 # identification of filing type and name in index file
-PAT_10K = re.compile(r'(?!.*?/A)\|10-?K(SB|SB40|405)?\|', re.I)
-PAT_10KA = re.compile(r'(\|10-?K(SB|SB40|405)?(/A))\|', re.I)
-PAT_10Q = re.compile(r'(?!.*?/A)\|10-?Q(SB|SB40|405)?\|', re.I)
-PAT_10QA = re.compile(r'(\|10-?Q(SB|SB40|405)?(/A))\|', re.I)
-PAT_8K = re.compile(r'\|8.?K\|', re.I)
-PAT_FNAME = re.compile(r'\|(edgar/data.*\/([\d-]+\.txt))', re.I)
+PAT_10K = register('PAT_10K', r'(?!.*?/A)\|10-?K(SB|SB40|405)?\|', re.I)
+PAT_10KA = register('PAT_10KA', r'(\|10-?K(SB|SB40|405)?(/A))\|', re.I, 'linear')
+PAT_10Q = register('PAT_10Q', r'(?!.*?/A)\|10-?Q(SB|SB40|405)?\|', re.I)
+PAT_10QA = register('PAT_10QA', r'(\|10-?Q(SB|SB40|405)?(/A))\|', re.I, 'linear')
+PAT_8K = register('PAT_8K', r'\|8.?K\|', re.I, 'linear')
+PAT_FNAME = register('PAT_FNAME', r'\|(edgar/data.*\/([\d-]+\.txt))', re.I, 'linear')
 
 
 # identification of filing metadata
-PAT_HEADER_END = re.compile(r'</(SEC|IMS)-HEADER>', re.I)
+PAT_HEADER_END = register('PAT_HEADER_END', r'</(SEC|IMS)-HEADER>', re.I, 'linear')
+PAT_HEADER_END_BYTES = register('PAT_HEADER_END_BYTES', PAT_HEADER_END.pattern.encode(), re.I)
 PAT_META = {
-    'fname': re.compile(r'<(?:SEC|IMS)-DOCUMENT>.*?(\d{10}-\d{2}-\d{6}\.txt)', re.I),
-    'cik': re.compile(r'^\s*CENTRAL\s*INDEX\s*KEY:\s*(\d{10})', re.I),
-    'comp_name': re.compile(r'^\s*COMPANY\s*CONFORMED\s*NAME:\s*(.+)', re.I),
-    'sic': re.compile(r'^\s*STANDARD\s*INDUSTRIAL\s*CLASSIFICATION:.*?(\d{4})', re.I),
-    'form_type': re.compile(r'^\s*CONFORMED\s*SUBMISSION\s*TYPE:\s(.+)', re.I),
-    'street': re.compile(r'^\s*STREET\s*1?:\s(.+)', re.I),
-    'city': re.compile(r'^\s*CITY:\s(.+)', re.I),
-    'state': re.compile(r'^\s*STATE:\s(.+)', re.I),
-    'zip': re.compile(r'^\s*ZIP:\s(.+)', re.I),
-    'phone': re.compile(r'^\s*(BUSINESS)?\s*PHONE(\sNUMBER)?:\s(.+)', re.I),
-    'date_report': re.compile(r'^\s*CONFORMED\s*PERIOD\s*OF\s*REPORT:\s*(\d{8})', re.I),
-    'date_filing': re.compile(r'^\s*FILED\s*AS\s*OF\s*DATE:\s*(\d{8})', re.I),
-    'hlink': re.compile(r'(.*?(([0]*(\d+))\-(\d{2})\-(\d{6})))', re.I)
+    'fname': register("PAT_META['fname']", r'<(?:SEC|IMS)-DOCUMENT>.*?(\d{10}-\d{2}-\d{6}\.txt)', re.I),
+    'cik': register("PAT_META['cik']", r'^\s*CENTRAL\s*INDEX\s*KEY:\s*(\d{10})', re.I),
+    'comp_name': register("PAT_META['comp_name']", r'^\s*COMPANY\s*CONFORMED\s*NAME:\s*(.+)', re.I),
+    'sic': register("PAT_META['sic']", r'^\s*STANDARD\s*INDUSTRIAL\s*CLASSIFICATION:.*?(\d{4})', re.I),
+    'form_type': register("PAT_META['form_type']", r'^\s*CONFORMED\s*SUBMISSION\s*TYPE:\s(.+)', re.I),
+    'street': register("PAT_META['street']", r'^\s*STREET\s*1?:\s(.+)', re.I),
+    'city': register("PAT_META['city']", r'^\s*CITY:\s(.+)', re.I),
+    'state': register("PAT_META['state']", r'^\s*STATE:\s(.+)', re.I),
+    'zip': register("PAT_META['zip']", r'^\s*ZIP:\s(.+)', re.I),
+    'phone': register("PAT_META['phone']", r'^\s*(BUSINESS)?\s*PHONE(\sNUMBER)?:\s(.+)', re.I),
+    'date_report': register("PAT_META['date_report']", r'^\s*CONFORMED\s*PERIOD\s*OF\s*REPORT:\s*(\d{8})', re.I),
+    'date_filing': register("PAT_META['date_filing']", r'^\s*FILED\s*AS\s*OF\s*DATE:\s*(\d{8})', re.I),
+    'hlink': register("PAT_META['hlink']", r'(.*?(([0]*(\d+))\-(\d{2})\-(\d{6})))', re.I)
 }
+# header line tokenizer: the named group identifies the only `PAT_META` key that can match a line
+PAT_META_LINE = register(
+    'PAT_META_LINE',
+    r'(?P<fname>.*?<(?:SEC|IMS)-DOCUMENT>)|^\s*(?:'
+    r'(?P<cik>CENTRAL\s*INDEX\s*KEY:)|'
+    r'(?P<comp_name>COMPANY\s*CONFORMED\s*NAME:)|'
+    r'(?P<sic>STANDARD\s*INDUSTRIAL\s*CLASSIFICATION:)|'
+    r'(?P<form_type>CONFORMED\s*SUBMISSION\s*TYPE:)|'
+    r'(?P<street>STREET\s*1?:)|'
+    r'(?P<city>CITY:)|'
+    r'(?P<state>STATE:)|'
+    r'(?P<zip>ZIP:)|'
+    r'(?P<phone>(?:BUSINESS)?\s*PHONE(?:\sNUMBER)?:)|'
+    r'(?P<date_report>CONFORMED\s*PERIOD\s*OF\s*REPORT:)|'
+    r'(?P<date_filing>FILED\s*AS\s*OF\s*DATE:))', re.I)
 
 
 # identification of markup tags
+PAT_DOC_START = register('PAT_DOC_START', r'(<DOCUMENT>)?(\n)?(<TYPE>)(GRAPHIC|ZIP|EXCEL|JSON|PDF|XML|EX)', re.I)
+PAT_DOC_END = register('PAT_DOC_END', r'(</DOCUMENT>)', re.I, 'linear')
 PAT_MU1 = {
-    'ascii': re.compile(r'(<DOCUMENT>)?(\n)?(<TYPE>)(GRAPHIC|ZIP|EXCEL|JSON|PDF|XML|EX)(.|\n)*?(</DOCUMENT>)', re.I),
-    'ascii_alt': re.compile(r'\n(<GRAPHIC>(.|\n)*?</GRAPHIC>)|(<ZIP>(.|\n)*?</ZIP>)|(<EXCEL>(.|\n)*?</EXCEL>)|(<JSON>(.|\n)*?</JSON>)|(<PDF>(.|\n)*?</PDF>)|(<XML>(.|\n)*?</XML>)|(<EX.*?>(.|\n)*?</EX.*?>)', re.I),
-    'header_footer': re.compile(r'(^(.|\n)*?(</SEC-HEADER>)|(-----END PRIVACY-ENHANCED MESSAGE-----))', re.I),
-    'html_tags': re.compile(r'((<div|<font|<tr|<td|<p)(.|\n)*?(>)|(</font>|</div>|</tr>|</td>|</p>))', re.I),
+    'ascii': register("PAT_MU1['ascii']", PAT_DOC_START.pattern + r'(.|\n)*?' + PAT_DOC_END.pattern, re.I),
+    'ascii_alt': register("PAT_MU1['ascii_alt']", r'\n(<GRAPHIC>(.|\n)*?</GRAPHIC>)|(<ZIP>(.|\n)*?</ZIP>)|(<EXCEL>(.|\n)*?</EXCEL>)|(<JSON>(.|\n)*?</JSON>)|(<PDF>(.|\n)*?</PDF>)|(<XML>(.|\n)*?</XML>)|(<EX.*?>(.|\n)*?</EX.*?>)', re.I),
+    'header_footer': register("PAT_MU1['header_footer']", r'(^(.|\n)*?(</SEC-HEADER>)|(-----END PRIVACY-ENHANCED MESSAGE-----))', re.I),
+    'html_tags': register("PAT_MU1['html_tags']", r'((<div|<font|<tr|<td|<p)(.|\n)*?(>)|(</font>|</div>|</tr>|</td>|</p>))', re.I),
 }
-PAT_MU2 = re.compile(r'<.*?>|<.*?\n.*?>|</.*?>', re.I)
-PAT_TAB1 = re.compile(r'((<TABLE)(.|\n)*?(</TABLE>))', re.I)
-PAT_TAB2 = re.compile(r'(\[TABLE\]|\[/TABLE\])', re.I)
-PAT_TOC1 = re.compile(r'\nTable\s*?of\s*?Contents\n', re.I)
-PAT_TOC2 = re.compile(r'\nReturn\s*?to\s*?Table\s*?of\s*?Contents\n', re.I)
+PAT_RAW = register('PAT_RAW', r'<(SEC-DOCUMENT|IMS-DOCUMENT|SEC-HEADER|IMS-HEADER|DOCUMENT)>', re.I, 'linear')
+PAT_MU2 = register('PAT_MU2', r'<.*?>|<.*?\n.*?>|</.*?>', re.I)
+PAT_TAB1 = register('PAT_TAB1', r'((<TABLE)(.|\n)*?(</TABLE>))', re.I)
+PAT_TAB2 = register('PAT_TAB2', r'(\[TABLE\]|\[/TABLE\])', re.I, 'linear')
+PAT_TOC1 = register('PAT_TOC1', r'\nTable\s*?of\s*?Contents\n', re.I, 'linear')
+PAT_TOC2 = register('PAT_TOC2', r'\nReturn\s*?to\s*?Table\s*?of\s*?Contents\n', re.I, 'linear')
+PAT_TAB2_BYTES = register('PAT_TAB2_BYTES', PAT_TAB2.pattern.encode('ascii'), re.I)
+
+
+# normalization of extracted sections
+PAT_SEPARATOR = register('PAT_SEPARATOR', r'(\_{2,}|\-{2,}|={2,})')
+PAT_WHITESPACE = register('PAT_WHITESPACE', r'(\s{1,})')
+PAT_PUNCT_SPACE = register('PAT_PUNCT_SPACE', r' (,|;|\.|’|®) ')
+PAT_COMMENT_END = register('PAT_COMMENT_END', r'^(.*?)" -->')
+
+
+# identification of section boundaries: each section pattern is split into a start and an end anchor
+# (separated by the section content) which are also compiled separately for the two-phase section search
+SECTION_BODY = r'(.|\n)*?'
 
 
 # identification of MD&A
-PAT_10K_MDA1 = re_.compile(
+_10K_MDA1 = (
     # search for 'Part 2' string that can optionally precede the 'Item' string and is itself preceded by a line-break (necessary condition)
     r'\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by optional white space characters
@@ -62,9 +244,8 @@ PAT_10K_MDA1 = re_.compile(
     # search for 'TEM 7.' string while accounting for numerous spelling variations
     r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?7\s*?(\.|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?\s*?'
     # search for 'Management's Discussion' or 'Management's Narrative' string
-    r'M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?.?\s*?((D\n*?I\n*?S\n*?C\n*?U\n*?S\n*?S\n*?I\n*?O\n*?N)|(N\n*?A\n*?R\n*?R\n*?A\n*?T\n*?I\n*?V\n*?E))'
-    # search for an arbitrarily long text block (i.e. the section content)
-    r'(.|\n)*?'
+    r'M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?.?\s*?((D\n*?I\n*?S\n*?C\n*?U\n*?S\n*?S\n*?I\n*?O\n*?N)|(N\n*?A\n*?R\n*?R\n*?A\n*?T\n*?I\n*?V\n*?E))',
+    # ... section content (see `SECTION_BODY`) ...
     # search for 'Part 2' string that can optionally precede the 'Item' string and is itself preceded by a line-break (necessary condition)
     r'\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by optional white space characters
@@ -73,10 +254,12 @@ PAT_10K_MDA1 = re_.compile(
     r'(?<!(in|to|see|and|under|of) ?\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?\s*?I)'
     r'(?<!(“|"|,) ?\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?\s*?I)'
     # search for 'TEM 7A.' or 'TEM 8.' string while accounting for numerous spelling variations
-    r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?(7A|7\.A|8)\s*?(\.|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?',
-    re_.I
+    r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?(7A|7\.A|8)\s*?(\.|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?'
 )
-PAT_10K_MDA2 = re_.compile(
+PAT_10K_MDA1 = register('PAT_10K_MDA1', _10K_MDA1[0] + SECTION_BODY + _10K_MDA1[1], re_.I, 'regex')
+PAT_10K_MDA1_ANCHORS = (register('PAT_10K_MDA1_ANCHORS[0]', _10K_MDA1[0], re_.I, 'regex'),
+                        register('PAT_10K_MDA1_ANCHORS[1]', _10K_MDA1[1], re_.I, 'regex'))
+_10K_MDA2 = (
     # search for 'Part 2' string that can optionally precede the 'Item' string and is itself preceded by a line-break (necessary condition)
     r'\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by optional white space characters
@@ -87,9 +270,8 @@ PAT_10K_MDA2 = re_.compile(
     # search for 'TEM 6.' string while accounting for numerous spelling variations
     r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?6\s*?(\.|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?\s*?'
     # search for various string variants that identify the MD&A in older filings
-    r'((M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?.?\s*?((D\n*?I\n*?S\n*?C\n*?U\n*?S\n*?S\n*?I\n*?O\n*?N)|(N\n*?A\n*?R\n*?R\n*?A\n*?T\n*?I\n*?V\n*?E)))|(M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?.?\s*?P\n*?L\n*?A\n*?N)|(PLAN\s*?OF\s*?OPERATION)|(SELECTED\s*?FINANCIAL\s*?DATA;))'
-    # search for an arbitrarily long text block (i.e. the section content)
-    r'(.|\n)*?'
+    r'((M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?.?\s*?((D\n*?I\n*?S\n*?C\n*?U\n*?S\n*?S\n*?I\n*?O\n*?N)|(N\n*?A\n*?R\n*?R\n*?A\n*?T\n*?I\n*?V\n*?E)))|(M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?.?\s*?P\n*?L\n*?A\n*?N)|(PLAN\s*?OF\s*?OPERATION)|(SELECTED\s*?FINANCIAL\s*?DATA;))',
+    # ... section content (see `SECTION_BODY`) ...
     # search for 'Part 2' string that can optionally precede the 'Item' string and is itself preceded by a line-break (necessary condition)
     r'\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by optional white space characters
@@ -98,10 +280,12 @@ PAT_10K_MDA2 = re_.compile(
     r'(?<!(in|to|see|and|under|of) ?\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?\s*?I)'
     r'(?<!(“|"|,) ?\n(PART\s*?(2|II)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?\s*?I)'
     # search for 'TEM 7.' string while accounting for numerous spelling variations
-    r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?7\s*?(\.|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?',
-    re_.I
+    r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?7\s*?(\.|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?'
 )
-PAT_10Q_MDA = re_.compile(
+PAT_10K_MDA2 = register('PAT_10K_MDA2', _10K_MDA2[0] + SECTION_BODY + _10K_MDA2[1], re_.I, 'regex')
+PAT_10K_MDA2_ANCHORS = (register('PAT_10K_MDA2_ANCHORS[0]', _10K_MDA2[0], re_.I, 'regex'),
+                        register('PAT_10K_MDA2_ANCHORS[1]', _10K_MDA2[1], re_.I, 'regex'))
+_10Q_MDA = (
     # search for 'Part 1' string that can optionally precede the 'Item' string and is itself preceded by a line-break (necessary condition)
     r'\n(PART *?(1|I) *?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by optional white space characters
@@ -112,9 +296,8 @@ PAT_10Q_MDA = re_.compile(
     # search for 'TEM 2.' or 'TEM 6.' string while accounting for numerous spelling variations
     r'\n*?T\n*?E\n*?M\.?\s*?((NO\.|NUMBER)\s*?)?(2|II|6)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?\s*?'
     # search for various string variants that identify the MD&A in older filings
-    r'((M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?\s*?((D\n*?I\n*?S\n*?C\n*?U\n*?S\n*?S\n*?I\n*?O\n*?N)|(N\n*?A\n*?R\n*?R\n*?A\n*?T\n*?I\n*?V\n*?E)))|(M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?\s*?P\n*?L\n*?A\n*?N)|(PLAN\s*?OF\s*?OPERATION))'
-    # search for an arbitrarily long text block (i.e. the section content)
-    r'(.|\n)*?'
+    r'((M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?\s*?((D\n*?I\n*?S\n*?C\n*?U\n*?S\n*?S\n*?I\n*?O\n*?N)|(N\n*?A\n*?R\n*?R\n*?A\n*?T\n*?I\n*?V\n*?E)))|(M\n*?A\n*?N\n*?A\n*?G\n*?E\n*?M\n*?E\n*?N\n*?T\n*?.?\n*?S?\s*?P\n*?L\n*?A\n*?N)|(PLAN\s*?OF\s*?OPERATION))',
+    # ... section content (see `SECTION_BODY`) ...
     # search for 'Part 1' or 'Part 2' string that can optionally precede 'I' and is itself preceded by a line-break (necessary condition)
     r'\n(PART\s*?(I|1|II|2)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by optional white space characters
@@ -123,13 +306,15 @@ PAT_10Q_MDA = re_.compile(
     r'(?<!(in|to|see|and|under|of) ?\n(PART\s*?(I|1|II|2)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?\s*?I)'
     r'(?<!(“|"|,) ?\n(PART\s*?(I|1|II|2)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?\s*?I)'
     # search for any other item that may entail the MD&A while accounting for numerous spelling variations
-    r'\n*?T\n*?E\n*?M(\n*?s)?\.?\s*?((NO\.|NUMBER)\s*?)?(?!(1A|i[a-z]))(1|I|3|4|5|6)\s*?(\.|,|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?',
-    re_.I
+    r'\n*?T\n*?E\n*?M(\n*?s)?\.?\s*?((NO\.|NUMBER)\s*?)?(?!(1A|i[a-z]))(1|I|3|4|5|6)\s*?(\.|,|:|-|–|—|--|\||\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?'
 )
+PAT_10Q_MDA = register('PAT_10Q_MDA', _10Q_MDA[0] + SECTION_BODY + _10Q_MDA[1], re_.I, 'regex')
+PAT_10Q_MDA_ANCHORS = (register('PAT_10Q_MDA_ANCHORS[0]', _10Q_MDA[0], re_.I, 'regex'),
+                       register('PAT_10Q_MDA_ANCHORS[1]', _10Q_MDA[1], re_.I, 'regex'))
 
 
 # identification of item1
-PAT_ITEM1 = re_.compile(
+_ITEM1 = (
     # search for 'Part 1' string that can optionally precede the 'Item' string and is itself preceded by a line-break (necessary condition)
     r'\n(PART\s*?(1|I)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?)?'
     # search for 'I' preceded by a line-break and optional white space characters
@@ -140,9 +325,8 @@ PAT_ITEM1 = re_.compile(
     # search for 'TEM 1.' string while accounting for numerous spelling variations
     r'\n*?T\n*?E\n*?M\n*?s?\.?\s*?((NO\.|NUMBER)\s*?)?(1|I|l)\s*?(\.|:|-|–|—|--|\||\.\s-|\.\s–|.\s—|\.\s--)?\s*?(a\s*?n\s*?d\s*?2\s*?)?(\.|:|-|–|—|--|\.\s-|\.\s–|.\s—|\.\s--)?\s*?'
     # search for 'Our Business', 'Business' or 'Description' string
-    r'(((O\n*?U\n*?R\s*?)?B\n*?U\n*?S\n*?I\n*?N\n*?E\n*?S\n*?S)|(D\n*?E\n*?S\n*?C\n*?R\n*?I\n*?P\n*?T\n*?I\n*?O\n*?N))'
-    # search for an arbitrarily long text block (i.e. the section content)
-    r'(.|\n)*?'
+    r'(((O\n*?U\n*?R\s*?)?B\n*?U\n*?S\n*?I\n*?N\n*?E\n*?S\n*?S)|(D\n*?E\n*?S\n*?C\n*?R\n*?I\n*?P\n*?T\n*?I\n*?O\n*?N))',
+    # ... section content (see `SECTION_BODY`) ...
     # search for 'Part 1' string that can optionally precede 'I' and is itself preceded by a line-break (necessary condition)
     r'\n(Part\s*?(I|1)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?\s*?)?'
     # search for 'I' preceded by optional white space characters
@@ -151,6 +335,13 @@ PAT_ITEM1 = re_.compile(
     r'(?<!(in|to|see|and|under) ?\n(Part\s*?(I|1)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?\s*?)?\s*?I)'
     r'(?<!(“|"|,) ?\n(Part\s*?(I|1)\s*?(\.|,|:|-|–|—|--|\.\s*?-|\.\s*?–|\.\s*?—|\.\s*?--)?\s*?)?\s*?I)'
     # search for 'TEM 1A.', 'TEM 2.' or 'TEM 3.' string while accounting for numerous spelling variations
-    r'\n*?T\n*?E\n*?M\n*?s?\.?\s*?((NO\.|NUMBER)\s*?)?(1\s*?A|1\.\s*?A|I\s*?A|I\.\s*?A|2|3)\s*?(\.|:|-|–|—|--|\||\.\s-|\.\s–|.\s—|\.\s--)?',
-    re_.I
+    r'\n*?T\n*?E\n*?M\n*?s?\.?\s*?((NO\.|NUMBER)\s*?)?(1\s*?A|1\.\s*?A|I\s*?A|I\.\s*?A|2|3)\s*?(\.|:|-|–|—|--|\||\.\s-|\.\s–|.\s—|\.\s--)?'
 )
+PAT_ITEM1 = register('PAT_ITEM1', _ITEM1[0] + SECTION_BODY + _ITEM1[1], re_.I, 'regex')
+PAT_ITEM1_ANCHORS = (register('PAT_ITEM1_ANCHORS[0]', _ITEM1[0], re_.I, 'regex'),
+                     register('PAT_ITEM1_ANCHORS[1]', _ITEM1[1], re_.I, 'regex'))
+
+
+# tokenization of sections and queries for the full-text index
+PAT_TERM = register('PAT_TERM', r'[^\W_]+')
+PAT_QUERY = register('PAT_QUERY', r'"([^"]*)"|(\S+)')
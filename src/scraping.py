@@ -4,9 +4,15 @@
 """ Functions for downloading corporate filings from SEC EDGAR.
 
 Usage:
-    edgar_scrape.py download-index [--user-agent=STR] [--start=INT] [--end=INT]
+    edgar_scrape.py download-index [--user-agent=STR] [--start=INT] [--end=INT] [--concurrency=INT] [--refresh]
+    edgar_scrape.py ingest-index [--start=INT] [--end=INT] [--force]
     edgar_scrape.py count-filings [--start=INT] [--end=INT] [--form-type=STR]
-    edgar_scrape.py download-filings [--user-agent=STR] [--start=INT] [--end=INT] [--form-type=STR] [-N=INT | --no-of-filings=INT]
+    edgar_scrape.py select-filings [--start=INT] [--end=INT] [--form-type=STR] [-N=INT | --no-of-filings=INT] [--strata=STR] [--seed=INT] [--ciks=STR] [--sic=STR] [--date-from=DATE] [--date-to=DATE] [--output=PATH]
+    edgar_scrape.py download-filings [--user-agent=STR] [--start=INT] [--end=INT] [--form-type=STR] [-N=INT | --no-of-filings=INT] [--concurrency=INT] [--storage=STR] [--selection=PATH]
+    edgar_scrape.py retry-failed [--user-agent=STR] [--start=INT] [--end=INT] [--form-type=STR] [--concurrency=INT]
+    edgar_scrape.py extract-metadata [--start=INT] [--end=INT] [--form-type=STR] [--workers=INT]
+    edgar_scrape.py run-pipeline [--user-agent=STR] [--start=INT] [--end=INT] [--form-type=STR] [-N=INT | --no-of-filings=INT] [--selection=PATH] [--concurrency=INT] [--workers=INT] [--sections=STR] [--persist=STR] [--queue-size=INT] [--engine=STR] [--storage=STR]
+    edgar_scrape.py sync [--user-agent=STR] [--form-types=STR] [--since=DATE] [--concurrency=INT] [--workers=INT] [--sections=STR]
 
 Options:
     -h, --help
@@ -14,57 +20,168 @@ Options:
     --start=INT                     Start year for scraping [default: 1996].
     --end=INT                       End year for scraping [default: 2020].
     --form-type=STR                 Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a) [default: 10-k].
-    -N INT, --no-of-filings=INT     Number of filings to be sampled per quarter [default: 10].
+    --force                         Re-ingest index files that were ingested before.
+    --refresh                       Revalidate index files of closed quarters (conditional requests).
+    -N INT, --no-of-filings=INT     Number of filings to be sampled per quarter (per stratum for select-filings) [default: 10].
+    --strata=STR                    Comma-separated stratification keys (any of: quarter, sic, size) [default: quarter].
+    --seed=INT                      Random seed for sampling [default: 2020].
+    --ciks=STR                      CIK whitelist (comma-separated CIKs or path to a file with one CIK per line).
+    --sic=STR                       Comma-separated SIC codes or prefixes (e.g. 28,7372) to restrict the selection to.
+    --date-from=DATE                First filing date (YYYY-MM-DD) to select.
+    --date-to=DATE                  Last filing date (YYYY-MM-DD) to select.
+    --output=PATH                   Path to selection; defaults to `output/selection/{form_type}_{start}_{end}.csv`.
+    --selection=PATH                Download the filings of a selection (see select-filings) instead of the first N per quarter.
+    --concurrency=INT               Number of concurrent downloads, rate-limited below 10 requests/s [default: 4].
+    --storage=STR                   Storage backend for filings (one of: plain, zstd); detected from existing filings if omitted.
+    --workers=INT                   Number of worker processes [default: 1].
+    --form-types=STR                Comma-separated form types to sync [default: 10-k].
+    --since=DATE                    First filing date to sync (YYYY-MM-DD); defaults to the day after the last sync.
+    --sections=STR                  Comma-separated section types to extract (any of: mda, item1) [default: mda].
+    --persist=STR                   Comma-separated artifacts to write (any of: raw, clean, sections, metadata) [default: sections,metadata].
+    --queue-size=INT                Maximum number of filings held in memory by the pipeline [default: 32].
+    --engine=STR                    Cleaning engine (one of: regex, tokenizer) [default: regex].
 
 """
 
 
 import csv
 import datetime as dt
+import functools
+import hashlib
+import io
 import itertools
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-from urllib.request import build_opener, install_opener, urlopen, urlretrieve
 
 import pandas as pd
 from docopt import docopt
+from tqdm import tqdm
 
+import indexing
+import journal
+import manifest
+import metrics
+import parsing
+import section_index
+import selection
+import storage
+from http_client import EdgarClient, HTTPStatusError
 from parsing_patterns import (PAT_8K, PAT_10K, PAT_10KA, PAT_10Q, PAT_10QA,
-                              PAT_FNAME, PAT_META, PAT_HEADER_END)
+                              PAT_FNAME, PAT_META, PAT_META_LINE, PAT_HEADER_END, PAT_HEADER_END_BYTES)
 
 
-def download_index(user_agent: str, start: int, end: int):
-    """ Download index files from SEC EDGAR
+EDGAR_URL = 'https://www.sec.gov/Archives/'
+INDEX_FINAL_DAYS = 7
+# SEC headers are a few KB; filings without the end marker (e.g. old or malformed submissions) are not buffered
+HEADER_MAX_BYTES = 256 * 2**10
+ARTIFACTS = ('raw', 'clean', 'sections', 'metadata')
+LOG_LOCK = threading.Lock()
+
+
+def quarter_final(year: int, qtr: int):
+    """ Date from which the full index of a quarter no longer changes (one week after the quarter closed) """
+    return dt.date(year + qtr // 4, qtr % 4 * 3 + 1, 1) + dt.timedelta(days=INDEX_FINAL_DAYS)
+
+
+def index_fetched(con, year: int, qtr: int):
+    """ Time the index file of a quarter was last fetched or revalidated (None if it was never downloaded) """
+    validators = indexing.index_file(con, year, qtr)
+    if validators is not None:
+        return validators[2]
+    path_ind = indexing.index_path(year, qtr)
+    if path_ind.suffix == '.idx' and path_ind.exists():
+        # index file downloaded uncompressed before validators were recorded
+        return dt.datetime.fromtimestamp(path_ind.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+    return None
+
+
+def fetch_index(client: EdgarClient, url: str, validators: tuple = None):
+    """ Fetch index file, conditionally on the validators of the version on disk
+    :param EdgarClient client:
+        Shared, rate-limited HTTP client
+    :param str url:
+        URL of the (gzip-compressed) index file
+    :param tuple validators:
+        (etag, last_modified, fetched) of the version on disk (None for an unconditional request)
+    :return tuple:
+        Status (200 or 304 Not Modified), response headers and body
+    """
+    # index files are gzip-compressed already and kept as such
+    headers = {'Accept-Encoding': 'identity'}
+    if validators is not None:
+        etag, last_modified, _ = validators
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    return client.request(url, headers)
+
+
+def download_index(user_agent: str, start: int, end: int, concurrency: int = 4, refresh: bool = False,
+                   edgar_url: str = EDGAR_URL):
+    """ Download (gzip-compressed) index files from SEC EDGAR
     :param str user_agent:
         Agent to identify with SEC EDGAR (of the form 'ORG_NAME MAIL_ADDRESS')
     :param int start:
         Start year for scraping
     :param int start:
         End year for scraping
+    :param int concurrency:
+        Number of concurrent downloads (shared rate limit)
+    :param bool refresh:
+        Revalidate index files of closed quarters, too (open quarters are always revalidated)
+    :param str edgar_url:
+        Base URL of the EDGAR archives
     """
 
-    edgar_url_index = 'https://www.sec.gov/Archives/edgar/full-index'
     path_ind_dir = Path('output', 'index')
-    if not path_ind_dir.exists():
-        path_ind_dir.mkdir()
+    path_ind_dir.mkdir(parents=True, exist_ok=True)
 
-    opener = build_opener()
-    opener.addheaders = [('User-Agent', user_agent)]
-    install_opener(opener)
+    client = EdgarClient(user_agent)
+    con = indexing.connect()
+    today = dt.date.today()
 
+    tasks = {}
     for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
-        try:
-            url = f'{edgar_url_index}/{year}/QTR{qtr}/master.idx'
-            path_ind = Path(path_ind_dir, f'{year}_q{qtr}.idx')
-            if path_ind.exists():
-                print(f'Index file year_{year}_Q{qtr} exists already!')
-            else:
-                time.sleep(2)
-                urlretrieve(url, path_ind)
-                print(f'Index file year_{year}_Q{qtr} written to {path_ind}')
-        except Exception as e:
-            print(type(e).__name__, e)
-            print(f'Download failed! Index file for year_{year}_Q{qtr} not available via EDGAR...')
+        if dt.date(year, qtr * 3 - 2, 1) > today:
+            print(f'Index file year_{year}_Q{qtr} not available yet!')
+            continue
+        fetched = index_fetched(con, year, qtr)
+        if not refresh and fetched is not None and fetched >= quarter_final(year, qtr).isoformat():
+            print(f'Index file year_{year}_Q{qtr} exists already!')
+            indexing.ingest_quarter(con, year, qtr)
+            continue
+        url = f"{edgar_url.rstrip('/')}/edgar/full-index/{year}/QTR{qtr}/master.gz"
+        tasks[(year, qtr)] = url, indexing.index_file(con, year, qtr)
+
+    # requests run concurrently, files are written and ingested by this thread only
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(fetch_index, client, url, validators): key for key, (url, validators) in tasks.items()}
+        for future in as_completed(futures):
+            year, qtr = futures[future]
+            try:
+                status, headers, body = future.result()
+                if status == 304:
+                    print(f'Index file year_{year}_Q{qtr} unchanged')
+                    indexing.ingest_quarter(con, year, qtr)
+                else:
+                    path_ind = Path(path_ind_dir, f'{year}_q{qtr}.idx.gz')
+                    path_tmp = path_ind.with_suffix('.tmp')
+                    path_tmp.write_bytes(body)
+                    path_tmp.replace(path_ind)
+                    path_ind.with_suffix('').unlink(missing_ok=True)
+                    n_before = indexing.n_rows(con, year, qtr)
+                    # open quarters grow over time, so previously ingested filings are kept and only new rows added
+                    indexing.ingest_quarter(con, year, qtr, force=True, append=n_before is not None)
+                    n_new = indexing.n_rows(con, year, qtr) - (n_before or 0)
+                    print(f'Index file year_{year}_Q{qtr} written to {path_ind} ({n_new} new filings)')
+                indexing.record_index_file(con, year, qtr, headers.get('ETag'), headers.get('Last-Modified'))
+            except Exception as e:
+                print(type(e).__name__, e)
+                print(f'Download failed! Index file for year_{year}_Q{qtr} not available via EDGAR...')
+    con.close()
 
 
 def get_form_pattern(form_type: str):
@@ -89,8 +206,27 @@ def get_form_pattern(form_type: str):
         return False
 
 
+def ingest_index(start: int, end: int, force: bool = False):
+    """ Parse downloaded index files once into the index store (write to `output/index/index.sqlite`)
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param bool force:
+        Re-ingest quarters that were ingested before
+    """
+    con = indexing.connect()
+    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+        if indexing.ingest_quarter(con, year, qtr, force):
+            print(f'Index file year_{year}_Q{qtr} ingested into {indexing.PATH_INDEX_DB}')
+        else:
+            print(f'Error: Download index file for {year}_q{qtr} first!')
+    con.close()
+
+
 def count_filings(start: int, end: int, form_type: str = '10-k'):
-    """ Count number of filings per quarter and write to local CSV file
+    """ Count number of filings per quarter and write to local CSV file (quarters whose index file is missing or
+    was fetched before the quarter's index was final are flagged as incomplete)
     :param int start:
         Start year for scraping
     :param int start:
@@ -98,36 +234,496 @@ def count_filings(start: int, end: int, form_type: str = '10-k'):
     :param str form_type:
         Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
     """
-    path_ind_dir = Path('output', 'index')
     path_counts = Path('output', f'counts_{form_type}.csv')
 
-    if not get_form_pattern(form_type):
+    form_pattern = get_form_pattern(form_type)
+    if not form_pattern:
         return
-    else:
-        form_pattern = get_form_pattern(form_type)
 
+    con = indexing.connect()
+    missing = []
+    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+        if not indexing.ingest_quarter(con, year, qtr):
+            print(f'Error: Download index file for {year}_q{qtr} first!')
+            missing.append((year, qtr))
     counts = []
+    for year, qtr, n in indexing.count_by_quarter(con, form_pattern, start, end):
+        # an index file fetched while its quarter was still open lacks the filings published since
+        fetched = index_fetched(con, year, qtr)
+        counts.append((year, qtr, n, fetched is not None and fetched >= quarter_final(year, qtr).isoformat()))
+    con.close()
+
+    partial = sorted({year for year, _ in missing} | {year for year, _, _, complete in counts if not complete})
+    for year in partial:
+        quarters = [f'q{qtr}' for y, qtr in missing if y == year]
+        quarters += [f'q{qtr} (not final)' for y, qtr, _, complete in counts if y == year and not complete]
+        print(f'Warning: counts for {year} are partial, index incomplete for {", ".join(quarters)}!')
+
+    pd.DataFrame(counts, columns=['year', 'quarter', 'no_of_filings', 'complete']).to_csv(path_counts, sep=';')
+
+
+def select_filings(start: int, end: int, form_type: str = '10-k', n: int = 10, strata: tuple = ('quarter',),
+                   seed: int = 2020, ciks: str = None, sics: list = None, date_from: str = None, date_to: str = None,
+                   path_selection: Path = None):
+    """ Select filings from the index store by seeded stratified sampling and write their accession numbers to a
+    CSV file for `download_filings`
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int n:
+        Number of filings to be sampled per stratum
+    :param tuple strata:
+        Stratification keys (any of: quarter, sic, size)
+    :param int seed:
+        Random seed
+    :param str ciks:
+        Optional CIK whitelist (comma-separated CIKs or path to a file with one CIK per line)
+    :param list sics:
+        Optional SIC codes or prefixes to restrict the selection to
+    :param str date_from:
+        Optional first filing date (YYYY-MM-DD)
+    :param str date_to:
+        Optional last filing date (YYYY-MM-DD)
+    :param Path path_selection:
+        Path to selection (default: `output/selection/{form_type}_{start}_{end}.csv`)
+    """
+    form_pattern = get_form_pattern(form_type)
+    if not form_pattern:
+        return
+    unknown = set(strata) - set(selection.STRATA)
+    if unknown:
+        print(f'Strata not implemented: {", ".join(sorted(unknown))}! Choose from: {", ".join(selection.STRATA)}.')
+        return
+
+    con = indexing.connect()
     for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
-        path_ind = Path(path_ind_dir, f'{year}_q{qtr}.idx')
-        try:
-            with path_ind.open('r', encoding='utf-8') as f:
-                ctr = 1
-                for line in f:
-                    form_ind = form_pattern.search(line)
-                    if form_ind:
-                        ctr += 1
-            counts.append([year, qtr, ctr])
-        except Exception as e:
-            print(type(e).__name__, e)
+        if not indexing.ingest_quarter(con, year, qtr):
             print(f'Error: Download index file for {year}_q{qtr} first!')
+            end = year - 1 if qtr == 1 else year
             break
+    # SIC codes are parsed from the SEC headers of downloaded filings, the index files do not list them
+    n_sic = len(indexing.sic_by_cik(con)) if sics or 'sic' in strata else None
+    if n_sic == 0:
+        print('Error: No SIC codes known! SIC filters and strata require metadata of downloaded filings '
+              '(see download-filings or extract-metadata).')
+        con.close()
+        return
+    rows = selection.candidates(con, form_pattern, start, end, selection.parse_ciks(ciks) if ciks else None, sics,
+                                date_from, date_to)
+    con.close()
+    if sics:
+        print(f'Warning: SIC codes are only known for the {n_sic} CIKs with downloaded filings, filings of other '
+              f'CIKs are not selected by --sic.')
+    if 'sic' in strata:
+        unknown = sum(not row['sic'] for row in rows)
+        if unknown:
+            print(f'Warning: {unknown} of {len(rows)} filings have no known SIC code (stratum sic=unknown).')
+
+    selected = selection.sample(rows, strata, n, seed)
+    path_selection = path_selection or selection.selection_path(form_type, start, end)
+    selection.write_selection(path_selection, selected)
+    n_strata = len({row['stratum'] for row in selected})
+    print(f'Selected {len(selected)} of {len(rows)} filings from {n_strata} strata, written to {path_selection}')
+
+
+def parse_header(lines, edgar_url: str = EDGAR_URL):
+    """ Parse metadata from the SEC header of a filing
+    :param Iterable[str] lines:
+        Lines of the raw filing (only consumed up to the end of the SEC header)
+    :param str edgar_url:
+        Base URL of the EDGAR archives (used to build the filing index hyperlink)
+    :return dict:
+        Metadata with one entry per key in `PAT_META`
+    """
+    meta = dict.fromkeys(PAT_META)
+    for line in lines:
+        # one tokenizer pass per line; lines it identifies are parsed with the `PAT_META` pattern of that key
+        # first (falling back to the remaining keys in order if it does not apply, e.g. as it is already set)
+        line_match = PAT_META_LINE.match(line)
+        if line_match:
+            for k in itertools.chain([line_match.lastgroup], PAT_META.keys()):
+                if meta[k] is not None or k == 'hlink':
+                    continue
+                meta_match = PAT_META[k].search(line)
+                if meta_match:
+                    if k in ['street', 'zip', 'city', 'state']:
+                        meta[k] = f'{meta_match.group(1).lstrip()}'
+                    elif k == 'phone':
+                        meta[k] = meta_match.group(3)
+                    else:
+                        meta[k] = meta_match.group(1)
+                    break
+        if PAT_HEADER_END.search(line):
+            break
+    if meta['fname'] is not None:
+        f_match = PAT_META['hlink'].search(meta['fname'])
+        if f_match:
+            meta['hlink'] = f"{edgar_url}/{meta['cik']}/{f_match.group(3)}/{f_match.group(5)}/{f_match.group(6)}/{f_match.group(2)}-index.htm"
+    return meta
+
+
+def extract_metadata(path_file: Path, edgar_url: str = EDGAR_URL):
+    """ Extract metadata from the SEC header of a downloaded filing
+    :param Path path_file:
+        Path to raw filing
+    :param str edgar_url:
+        Base URL of the EDGAR archives (used to build the filing index hyperlink)
+    :return dict:
+        Metadata with one entry per key in `PAT_META`
+    """
+    with storage.store_for(path_file).open(path_file) as f:
+        return parse_header(f, edgar_url)
+
+
+def header_lines(txt: str):
+    """ Split the SEC header off an in-memory filing into lines (with universal newlines, as if read from disk) """
+    m = PAT_HEADER_END.search(txt)
+    return io.StringIO(txt[:m.end()] if m else txt, newline=None)
+
+
+def metadata_row(meta: dict, path_file: Path):
+    """ Key filing metadata by accession number and path for the `metadata` table of the index store """
+    return {**meta, 'accession': path_file.stem, 'path': str(path_file)}
+
+
+def write_metadata(con, path_meta: Path, rows: list, fnames: set = None):
+    """ Write a batch of metadata rows to the `metadata` table of the index store and append them to `metadata.csv`
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param Path path_meta:
+        Path to `metadata.csv`
+    :param list rows:
+        Metadata rows (see `metadata_row`)
+    :param set fnames:
+        Optional file names already listed in `metadata.csv` (only missing rows are appended, updated in place)
+    :return int:
+        Number of rows appended to `metadata.csv`
+    """
+    indexing.upsert_metadata(con, rows)
+    if fnames is not None:
+        rows = [row for row in rows if row['fname'] not in fnames and not fnames.add(row['fname'])]
+    if rows:
+        with path_meta.open('a', encoding='utf-8') as f:
+            w = csv.DictWriter(f, PAT_META.keys(), delimiter=';', lineterminator='\n', extrasaction='ignore')
+            w.writerows(rows)
+    return len(rows)
+
+
+def write_log(path_log: Path, msg: str):
+    """ Append timestamped message to log file (safe to call from worker threads) """
+    with LOG_LOCK, path_log.open('a', encoding='utf-8') as f:
+        f.write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {msg}\n')
+
+
+def log_retry(path_log: Path, url: str, stats: dict, attempt: int, e: Exception, delay: float):
+    """ Count and log a retry of a download (see `EdgarClient.request`) """
+    stats['attempts'] += 1
+    write_log(path_log, f'{e}\nRestart in {delay:.1f}s (attempt {attempt + 1})!')
+    print(f'{type(e).__name__} {e}: {url}\n'
+          f'Restart\n')
+
+
+def fetch_filing(client: EdgarClient, url: str, path_file: Path, path_log: Path,
+                 edgar_url: str = EDGAR_URL, stats: dict = None):
+    """ Download a single filing, stream it to disk and extract its metadata
+    :param EdgarClient client:
+        Shared rate-limited HTTP client
+    :param str url:
+        URL of the filing
+    :param Path path_file:
+        Target path of the raw filing
+    :param Path path_log:
+        Path to download log
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :param dict stats:
+        Optional dict that receives the number of `attempts`, the downloaded (decoded) `bytes`, the `wire_bytes`
+        received and the `latency` in seconds
+    :return dict:
+        Filing metadata
+    """
+    stats = {} if stats is None else stats
+    stats['attempts'] = 1
+    # the SEC header is collected from the first chunks of the response, the filing itself never is held in memory
+    head = bytearray()
+    head_end = None
+
+    def on_chunk(data):
+        nonlocal head_end
+        if head_end is None:
+            start = max(0, len(head) - 16)
+            head.extend(data[:HEADER_MAX_BYTES - len(head)])
+            m = PAT_HEADER_END_BYTES.search(head, start)
+            if m:
+                head_end = m.end()
+            elif len(head) >= HEADER_MAX_BYTES:
+                # no end of the SEC header within the buffer, metadata is parsed from what was buffered
+                head_end = len(head)
+
+    def on_retry(attempt, e, delay):
+        nonlocal head_end
+        head.clear()
+        head_end = None
+        log_retry(path_log, url, stats, attempt, e, delay)
+
+    # partial downloads never show up under the target path (nor in listings of `*.txt` files)
+    path_part = path_file.with_name(f'{path_file.name}.part')
+    t0 = time.monotonic()
+    try:
+        _, stats['wire_bytes'], stats['bytes'] = client.download(url, path_part, on_retry=on_retry,
+                                                                 on_chunk=on_chunk)
+        stats['latency'] = time.monotonic() - t0
+        storage.store_for(path_file).write_file(path_file, path_part)
+    finally:
+        path_part.unlink(missing_ok=True)
+    txt = head[:head_end].decode('utf-8', errors='ignore')
+    return parse_header(header_lines(txt), edgar_url)
+
+
+def fetch_filing_body(client: EdgarClient, url: str, path_log: Path, stats: dict = None):
+    """ Download a single filing into memory (see `run_pipeline`)
+    :param EdgarClient client:
+        Shared rate-limited HTTP client
+    :param str url:
+        URL of the filing
+    :param Path path_log:
+        Path to download log
+    :param dict stats:
+        Optional dict that receives the number of `attempts`, the downloaded `bytes` and the `latency` in seconds
+    :return bytes:
+        Raw filing
+    """
+    stats = {} if stats is None else stats
+    stats['attempts'] = 1
+    t0 = time.monotonic()
+    body = client.get(url, on_retry=functools.partial(log_retry, path_log, url, stats))
+    stats['latency'], stats['bytes'] = time.monotonic() - t0, len(body)
+    return body
+
+
+def body_metadata(body: bytes, edgar_url: str = EDGAR_URL):
+    """ Parse metadata from the SEC header of a raw filing in memory (decoding only the header) """
+    m = PAT_HEADER_END_BYTES.search(body)
+    return parse_header(header_lines(body[:m.end() if m else None].decode('utf-8', errors='ignore')), edgar_url)
+
+
+def metadata_fnames(path_meta: Path):
+    """ File names listed in `metadata.csv` (the file is created with its header if it does not exist) """
+    if not path_meta.exists():
+        path_meta.parent.mkdir(parents=True, exist_ok=True)
+        with path_meta.open('w', encoding='utf-8') as f:
+            w = csv.DictWriter(f, PAT_META.keys(), delimiter=';', lineterminator='\n')
+            w.writeheader()
+        return set()
+    return set(pd.read_csv(path_meta, sep=';', usecols=['fname'], dtype=str)['fname'].dropna())
+
+
+def enqueue_quarter(jcon, con, store, form_pattern, year: int, qtr: int, n: int, fnames: set,
+                    edgar_url: str = EDGAR_URL):
+    """ Record the first `n` filings of a quarter (in index file order) as download jobs in the journal
+    :param sqlite3.Connection jcon:
+        Connection to download journal
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param storage.PlainStore store:
+        Store of the form type
+    :param re.Pattern form_pattern:
+        Regex pattern for matching form types in index lines
+    :param int year:
+        Year of quarter
+    :param int qtr:
+        Quarter
+    :param int n:
+        Number of filings to be downloaded per quarter
+    :param set fnames:
+        File names already listed in `metadata.csv`
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    """
+    Path(store.root, str(year), f'q{str(qtr)}').mkdir(parents=True, exist_ok=True)
+    jobs = []
+    ctr = 1
+    for filing in indexing.select_filings(con, form_pattern, year, year, qtr=qtr):
+        if ctr > n:
+            break
+        job = filing_job(store, filing[4], year, qtr, ctr, fnames, edgar_url)
+        if job:
+            jobs.append(job)
+            ctr += 1
+    journal.enqueue(jcon, jobs, year, qtr, n)
+
+
+def enqueue_selection(jcon, store, rows: list, year: int, qtr: int, fnames: set, edgar_url: str = EDGAR_URL):
+    """ Record the selected filings of a quarter as download jobs in the journal (after the jobs enqueued before)
+    :param sqlite3.Connection jcon:
+        Connection to download journal
+    :param storage.PlainStore store:
+        Store of the form type
+    :param list rows:
+        Selected filings of the quarter (see `selection.read_selection`)
+    :param int year:
+        Year of quarter
+    :param int qtr:
+        Quarter
+    :param set fnames:
+        File names already listed in `metadata.csv`
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :return int:
+        Number of new jobs
+    """
+    known = {job['accession'] for job in journal.jobs(jcon, [row['accession'] for row in rows])}
+    rows = [row for row in rows if row['accession'] not in known]
+    if not rows:
+        return 0
+    Path(store.root, str(year), f'q{str(qtr)}').mkdir(parents=True, exist_ok=True)
+    seq = journal.next_seq(jcon, year, qtr)
+    jobs = []
+    for row in rows:
+        job = filing_job(store, row['fname'], year, qtr, seq, fnames, edgar_url)
+        if job:
+            jobs.append(job)
+            seq += 1
+    journal.enqueue(jcon, jobs)
+    return len(jobs)
+
+
+def filing_job(store, fname: str, year: int, qtr: int, seq: int, fnames: set, edgar_url: str = EDGAR_URL):
+    """ Download job of a filing listed in an index file
+    :param storage.PlainStore store:
+        Store of the form type
+    :param str fname:
+        File name of the filing as listed in the index file (e.g. `edgar/data/{cik}/{accession}.txt`)
+    :param int year:
+        Year of quarter
+    :param int qtr:
+        Quarter
+    :param int seq:
+        Position of the job within its quarter
+    :param set fnames:
+        File names already listed in `metadata.csv`
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :return tuple:
+        (accession, url, path, year, qtr, seq, state) or None if the file name does not match
+    """
+    file_ind = PAT_FNAME.search(f'|{fname}')
+    if not file_ind:
+        return None
+    url = f'{edgar_url}/{file_ind.group(1)}'
+    path_file = Path(store.root, str(year), f'q{str(qtr)}', str(file_ind.group(2)))
+    # filings downloaded before the journal existed are only looked up once, when they are enqueued
+    state = journal.QUEUED
+    if store.exists(path_file):
+        state = journal.METADATA_DONE if path_file.name in fnames else journal.WRITTEN
+    return path_file.stem, url, str(path_file), year, qtr, seq, state
+
+
+def process_quarter(jcon, con, client: EdgarClient, store, year: int, qtr: int, path_log: Path, path_meta: Path,
+                    concurrency: int = 4, edgar_url: str = EDGAR_URL, mcon=None, fnames: set = None):
+    """ Download all queued filings of a quarter and write metadata of all written filings
+    :param sqlite3.Connection jcon:
+        Connection to download journal
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param EdgarClient client:
+        Shared rate-limited HTTP client
+    :param storage.PlainStore store:
+        Store of the form type
+    :param int year:
+        Year of quarter
+    :param int qtr:
+        Quarter
+    :param Path path_log:
+        Path to download log
+    :param Path path_meta:
+        Path to `metadata.csv`
+    :param int concurrency:
+        Number of concurrent downloads
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :param sqlite3.Connection mcon:
+        Connection to metrics store that receives latency, bytes and retries per download (optional)
+    :param set fnames:
+        File names already listed in `metadata.csv` (optional; only rows of other filings are appended)
+    """
+    # filings written before an interruption still lack their metadata (or have to be downloaded again if missing)
+    resumed, rows, done = [], [], []
+    for job in journal.pending(jcon, journal.WRITTEN, year, qtr):
+        path_file = Path(job['path'])
+        if not store.exists(path_file):
+            with jcon:
+                journal.set_state(jcon, [job['accession']], journal.QUEUED)
+            continue
+        meta = metadata_task(path_file)
+        if meta is None:
+            write_log(path_log, f'No SEC header found (already cleaned):\t{path_file}')
+        else:
+            resumed.append(metadata_row(meta, path_file))
+        done.append(job['accession'])
+
+    jobs = journal.pending(jcon, journal.QUEUED, year, qtr)
+    with jcon:
+        journal.set_state(jcon, [job['accession'] for job in jobs], journal.DOWNLOADING)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {}
+        for job in jobs:
+            stats = {}
+            future = pool.submit(fetch_filing, client, job['url'], Path(job['path']), path_log, edgar_url, stats)
+            futures[future] = (job, stats)
+        for future in as_completed(futures):
+            job, stats = futures[future]
+            url, path_file = job['url'], Path(job['path'])
+            attempts = job['attempts'] + stats.get('attempts', 0)
+            retries = stats.get('attempts', 1) - 1
+            try:
+                rows.append(metadata_row(future.result(), path_file))
+                if mcon is not None:
+                    metrics.record(mcon, 'download', path_file, {'seconds': stats['latency'], 'bytes': stats['bytes'],
+                                                                 'wire_bytes': stats['wire_bytes'], 'retries': retries})
+                with jcon:
+                    journal.set_state(jcon, [job['accession']], journal.WRITTEN, attempts=attempts,
+                                      bytes=stats['bytes'], latency=stats['latency'])
+                done.append(job['accession'])
+                log = f'Download from:\t{url}\nWriting to:\t{path_file}'
+            except Exception as e:
+                print(type(e).__name__, e)
+                with jcon:
+                    journal.set_state(jcon, [job['accession']], journal.FAILED, attempts=attempts,
+                                      error=f'{type(e).__name__} {e}')
+                if mcon is not None:
+                    metrics.record(mcon, 'download', path_file, {'retries': retries, 'failed': 1})
+                log = f'Download failed:\t{url}\n{type(e).__name__} {e}'
+            print(log, '\n')
+            write_log(path_log, log)
 
-    pd.DataFrame(counts, columns=['year', 'quarter', 'no_of_filings']).to_csv(path_counts, sep=';')
+    # an interruption after the rows were appended but before the jobs were marked leaves them written, hence
+    # resumed rows are only appended if `metadata.csv` does not list them yet
+    if resumed and fnames is None:
+        fnames = metadata_fnames(path_meta)
+    write_metadata(con, path_meta, resumed + rows, fnames)
+    with jcon:
+        journal.set_state(jcon, done, journal.METADATA_DONE)
+    if mcon is not None:
+        mcon.commit()
+
+
+def print_journal(jcon, start: int, end: int, form_type: str = '10-k'):
+    """ Print number of download jobs per state """
+    counts = journal.counts(jcon, start, end)
+    print(f'\nDownload journal {start}-{end}: ' + ', '.join(f'{v} {k}' for k, v in sorted(counts.items())))
+    if counts.get(journal.FAILED):
+        print(f'Run `retry-failed --form-type {form_type}` to download failed filings again.')
 
 
 def download_filings(user_agent: str, start: int, end: int,
-                     form_type: str = '10-k', n: int = 10):
-    """ Download filings from SEC EDGAR
+                     form_type: str = '10-k', n: int = 10,
+                     concurrency: int = 4, edgar_url: str = EDGAR_URL, backend: str = None,
+                     path_selection: Path = None):
+    """ Download filings from SEC EDGAR (resuming from the download journal `output/filings/{form_type}/journal.sqlite`)
     :param str user_agent:
         Agent to identify with SEC EDGAR (of the form 'ORG_NAME MAIL_ADDRESS')
     :param int start:
@@ -138,100 +734,538 @@ def download_filings(user_agent: str, start: int, end: int,
         Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
     :param int n:
         Number of filings to be downloaded per quarter
+    :param int concurrency:
+        Number of concurrent downloads (all share one rate limiter below SEC's 10 requests/s)
+    :param str edgar_url:
+        Base URL of the EDGAR archives (override to test against a local server)
+    :param str backend:
+        Storage backend for filings (one of: plain, zstd); detected from existing filings if not specified
+    :param Path path_selection:
+        Optional selection (see `select_filings`) whose filings are downloaded instead of the first `n` per quarter
+        (`start`, `end` and `n` are ignored)
     """
 
-    edgar_url = 'https://www.sec.gov/Archives/'
     path_log = Path('output', 'filings', form_type, 'log_download.txt')
     path_meta = Path('output', 'filings', form_type, 'metadata.csv')
 
-    opener = build_opener()
-    opener.addheaders = [('User-Agent', user_agent)]  # Form: 'code mail-address'
-    install_opener(opener)
+    form_pattern = get_form_pattern(form_type)
+    if not form_pattern:
+        return
+
+    client = EdgarClient(user_agent)
+    con = indexing.connect()
+    store = storage.get_store(Path('output', 'filings', form_type), backend)
+    jcon = journal.connect(form_type)
+    mcon = metrics.connect(form_type)
+
+    interrupted = journal.reset_interrupted(jcon)
+    if interrupted:
+        print(f'Resuming {interrupted} interrupted downloads.')
+
+    quarters = []
+    for year, qtr in enqueue_quarters(jcon, con, store, form_pattern, start, end, n, path_meta, edgar_url,
+                                      path_selection):
+        # filings the pipeline processed without keeping them are downloaded now (their metadata is listed already)
+        fnames = metadata_fnames(path_meta) if journal.requeue_processed(jcon, year, qtr) else None
+        process_quarter(jcon, con, client, store, year, qtr, path_log, path_meta, concurrency, edgar_url, mcon,
+                        fnames)
+        quarters.append((year, qtr))
+    if path_selection is not None and quarters:
+        start, end = quarters[0][0], quarters[-1][0]
 
-    if not get_form_pattern(form_type):
+    print_journal(jcon, start, end, form_type)
+    jcon.close()
+    mcon.close()
+    con.close()
+
+
+def enqueue_quarters(jcon, con, store, form_pattern, start: int, end: int, n: int, path_meta: Path,
+                     edgar_url: str = EDGAR_URL, path_selection: Path = None):
+    """ Enqueue the filings to be downloaded quarter by quarter, i.e. the first `n` filings of each quarter in the
+    start-end period or the filings of a selection
+    :param sqlite3.Connection jcon:
+        Connection to download journal
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param storage.PlainStore store:
+        Store of the form type
+    :param re.Pattern form_pattern:
+        Regex pattern for matching form types in index lines
+    :param int start:
+        Start year for scraping
+    :param int end:
+        End year for scraping
+    :param int n:
+        Number of filings to be downloaded per quarter
+    :param Path path_meta:
+        Path to `metadata.csv`
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :param Path path_selection:
+        Optional selection (see `select_filings`) whose filings are enqueued instead (`start`, `end` and `n` are
+        ignored)
+    :return Iterator[tuple]:
+        (year, qtr) of each quarter once its jobs are in the journal
+    """
+    # file names listed in `metadata.csv` are only read if a quarter has to be enqueued
+    fnames = None if path_meta.exists() else metadata_fnames(path_meta)
+
+    if path_selection is not None:
+        quarters = {}
+        for row in selection.read_selection(path_selection):
+            if form_pattern.search(f'|{row["form_type"]}|'):
+                quarters.setdefault((row['year'], row['qtr']), []).append(row)
+        if not quarters:
+            print(f'No matching filings selected in {path_selection}!')
+        for (year, qtr), rows in sorted(quarters.items()):
+            if fnames is None:
+                fnames = metadata_fnames(path_meta)
+            enqueue_selection(jcon, store, rows, year, qtr, fnames, edgar_url)
+            yield year, qtr
         return
 
+    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+        # quarters are selected from the index once; afterwards only their remaining jobs are visited
+        if journal.enqueued(jcon, year, qtr) < n:
+            if not indexing.ingest_quarter(con, year, qtr):
+                print(f'Error: Download index file for {year}_q{qtr} first!')
+                return
+            if fnames is None:
+                fnames = metadata_fnames(path_meta)
+            enqueue_quarter(jcon, con, store, form_pattern, year, qtr, n, fnames, edgar_url)
+        yield year, qtr
+
+
+def retry_failed(user_agent: str, start: int, end: int, form_type: str = '10-k',
+                 concurrency: int = 4, edgar_url: str = EDGAR_URL):
+    """ Download filings again that failed in previous runs of `download_filings`
+    :param str user_agent:
+        Agent to identify with SEC EDGAR (of the form 'ORG_NAME MAIL_ADDRESS')
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int concurrency:
+        Number of concurrent downloads (all share one rate limiter below SEC's 10 requests/s)
+    :param str edgar_url:
+        Base URL of the EDGAR archives (only used for metadata hyperlinks, jobs keep the URL they were enqueued with)
+    """
+    path_log = Path('output', 'filings', form_type, 'log_download.txt')
+    path_meta = Path('output', 'filings', form_type, 'metadata.csv')
+
+    client = EdgarClient(user_agent)
+    con = indexing.connect()
+    store = storage.get_store(Path('output', 'filings', form_type))
+    jcon = journal.connect(form_type)
+    mcon = metrics.connect(form_type)
     if not path_meta.exists():
-        with path_meta.open('w', encoding='utf-8') as f:
-            w = csv.DictWriter(f, PAT_META.keys(), delimiter=';', lineterminator='\n')
-            w.writeheader()
+        metadata_fnames(path_meta)
 
+    journal.reset_interrupted(jcon)
+    print(f'Retrying {journal.requeue_failed(jcon, start, end)} failed downloads.')
     for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
-        path_filings_dir = Path('output', 'filings', form_type, str(year), f'q{str(qtr)}')
-        if not path_filings_dir.exists():
-            path_filings_dir.mkdir(parents=True)
-        try:
-            with Path('output', 'index', f'{year}_q{qtr}.idx').open('r', encoding='utf-8') as f:
-                ctr = 1
-                for line in f:
-                    if ctr <= n:
-                        form_ind = get_form_pattern(form_type).search(line)
-                        if form_ind:
-                            file_ind = PAT_FNAME.search(line)
-                            if file_ind:
-                                url = f'{edgar_url}/{file_ind.group(1)}'
-                                path_file = Path(path_filings_dir, str(file_ind.group(2)))
-                                if path_file.exists():
-                                    log = f'Already downloaded from: {url}\nWas written to {path_file}'
-                                    ctr += 1
-                                else:
-                                    log = f'Download from:\t{url}\nWriting to:\t{path_file}'
-                                    i = 0
-                                    while True:
-                                        try:
-                                            txt = urlopen(url, timeout=20).read().decode('utf-8', errors='ignore')
-                                            path_file.open('w', encoding='utf-8').write(txt)
-
-                                            meta = {}
-                                            for k in PAT_META.keys():
-                                                meta[k] = None
-                                            with path_file.open('r', encoding='utf-8') as f:
-                                                for line in f:
-                                                    for k, v in PAT_META.items():
-                                                        meta_match = v.search(line)
-                                                        if meta_match and meta[k] is None and k != 'hlink':
-                                                            meta[k] = meta_match.group(1)
-                                                            if k in ['street', 'zip', 'city', 'state']:
-                                                                meta[k] = f'{meta_match.group(1).lstrip()}'
-                                                            elif k == 'phone':
-                                                                meta[k] = meta_match.group(3)
-                                                            else:
-                                                                meta[k] = meta_match.group(1)
-                                                            break
-                                                    if PAT_HEADER_END.search(line):
-                                                        break
-                                                if meta['fname'] is not None:
-                                                    f_match = PAT_META['hlink'].search(meta['fname'])
-                                                    if f_match:
-                                                        meta['hlink'] = f"{edgar_url}/{meta['cik']}/{f_match.group(3)}/{f_match.group(5)}/{f_match.group(6)}/{f_match.group(2)}-index.htm"
-                                                with path_meta.open('a', encoding='utf-8') as f:
-                                                    w = csv.DictWriter(f, PAT_META.keys(), delimiter=';', lineterminator='\n')
-                                                    w.writerow(meta)
-
-                                        except Exception as e:
-                                            path_log.open('a', encoding='utf-8').write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {e}\n'
-                                                                     f'Restart!\n')
-                                            print(f'{type(e).__name__} {e}: {url}\n'
-                                                  f'Restart\n')
-                                            time.sleep(5)
-                                            i += 1
-                                            if i < 10:
-                                                continue
-                                        break
-                                    ctr += 1
-                                print(log, '\n')
-                                path_log.open('a', encoding='utf-8').write(f'\n[{dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {log}\n')
-        except Exception as e:
-            print(type(e).__name__, e)
-            print(f'Error: Download index file for {year}_q{qtr} first!')
-            break
+        process_quarter(jcon, con, client, store, year, qtr, path_log, path_meta, concurrency, edgar_url, mcon)
+
+    print_journal(jcon, start, end, form_type)
+    jcon.close()
+    mcon.close()
+    con.close()
+
+
+def fetch_daily_index(client: EdgarClient, day: dt.date, edgar_url: str = EDGAR_URL):
+    """ Download and parse the daily index file of a single day
+    :param EdgarClient client:
+        Shared rate-limited HTTP client
+    :param dt.date day:
+        Filing date
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :return list:
+        Rows of (cik, comp_name, form_type, date_filed, fname, accession, year, qtr) or None if no index file
+        was published for the day (yet)
+    """
+    qtr = (day.month - 1) // 3 + 1
+    url = f"{edgar_url.rstrip('/')}/edgar/daily-index/{day.year}/QTR{qtr}/master.{day:%Y%m%d}.idx"
+    try:
+        body = client.get(url)
+    except HTTPStatusError as e:
+        # weekends and holidays have no index file, the current day's file is published in the evening
+        if e.status in (403, 404):
+            return None
+        raise
+    lines = body.decode('utf-8', errors='ignore').splitlines()
+    return [row + (day.year, qtr) for row in map(indexing.parse_index_line, lines) if row is not None]
+
+
+def sync(user_agent: str, form_types: list, since: dt.date = None, concurrency: int = 4, workers: int = 1,
+         sections: tuple = ('mda',), edgar_url: str = EDGAR_URL):
+    """ Download, clean and extract the filings published since the last sync (according to the daily index files)
+    :param str user_agent:
+        Agent to identify with SEC EDGAR (of the form 'ORG_NAME MAIL_ADDRESS')
+    :param list form_types:
+        Form types (any of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param dt.date since:
+        First filing date to sync (defaults to the day after the watermark of each form type, or one week ago)
+    :param int concurrency:
+        Number of concurrent downloads (all share one rate limiter below SEC's 10 requests/s)
+    :param int workers:
+        Number of worker processes for cleaning and extraction
+    :param tuple sections:
+        Section types to be extracted (any of: mda, item1)
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    """
+    form_patterns = {form_type: get_form_pattern(form_type) for form_type in form_types}
+    if not all(form_patterns.values()):
+        return
+
+    client = EdgarClient(user_agent)
+    con = indexing.connect()
+    jcons = {form_type: journal.connect(form_type) for form_type in form_types}
+    today = dt.date.today()
+
+    # the watermark is the last filing date whose filings were all downloaded, cleaned and extracted
+    marks = {}
+    for form_type, jcon in jcons.items():
+        mark = journal.watermark(jcon)
+        if since is not None:
+            marks[form_type] = since - dt.timedelta(days=1)
+        elif mark is not None:
+            marks[form_type] = dt.date.fromisoformat(mark)
+        else:
+            marks[form_type] = today - dt.timedelta(days=8)
+    first = min(marks.values()) + dt.timedelta(days=1)
+    days = [first + dt.timedelta(days=i) for i in range((today - first).days + 1)]
+
+    # days after a failed download stay unsynced, so that the watermark never passes a missing day
+    published = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(fetch_daily_index, client, day, edgar_url) for day in days]
+        for day, future in zip(days, futures):
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(type(e).__name__, e)
+                print(f'Download failed! Daily index file for {day} not available via EDGAR...')
+                for future_ in futures:
+                    future_.cancel()
+                break
+            if rows is not None:
+                published[day] = rows
+    new = indexing.append_filings(con, [row for rows in published.values() for row in rows])
+    print(f'{len(published)} daily index files since {first} ({new} new filings in {indexing.PATH_INDEX_DB})')
+
+    for form_type, jcon in jcons.items():
+        days_new = [day for day in published if day > marks[form_type]]
+        if not days_new:
+            print(f'No new daily index files for {form_type} since {marks[form_type]}.')
+            continue
+        path_log = Path('output', 'filings', form_type, 'log_download.txt')
+        path_meta = Path('output', 'filings', form_type, 'metadata.csv')
+        store = storage.get_store(Path('output', 'filings', form_type))
+        mcon = metrics.connect(form_type)
+        fnames = metadata_fnames(path_meta)
+
+        # jobs of earlier, interrupted syncs of the same days exist already and keep their state
+        jobs, seqs, job_days = [], {}, {}
+        for day in days_new:
+            for row in published[day]:
+                if not form_patterns[form_type].search(f'|{row[2]}|'):
+                    continue
+                year, qtr = row[6], row[7]
+                if (year, qtr) not in seqs:
+                    seqs[(year, qtr)] = journal.next_seq(jcon, year, qtr)
+                job = filing_job(store, row[4], year, qtr, seqs[(year, qtr)], fnames, edgar_url)
+                if job:
+                    jobs.append(job)
+                    job_days.setdefault(job[0], day)
+                    seqs[(year, qtr)] += 1
+        journal.enqueue(jcon, jobs)
+        journal.reset_interrupted(jcon)
+        for year, qtr in sorted(seqs):
+            Path(store.root, str(year), f'q{qtr}').mkdir(parents=True, exist_ok=True)
+            process_quarter(jcon, con, client, store, year, qtr, path_log, path_meta, concurrency, edgar_url, mcon)
+        mcon.close()
+
+        synced = journal.jobs(jcon, list(dict.fromkeys(job[0] for job in jobs)))
+        filings = [Path(job['path']) for job in synced if job['state'] == journal.METADATA_DONE]
+        failed = [job_days[job['accession']] for job in synced if job['state'] == journal.FAILED]
+        year = days_new[-1].year
+        if filings:
+            parsing.clean_filings(year, year, form_type, workers, filings=filings)
+            form_sections = tuple(s for s in sections if parsing.section_patterns(s, form_type))
+            if form_sections:
+                parsing.extract_sections(year, year, form_type, form_sections, workers, filings=filings)
+        # the watermark stops before the first day with failed downloads, so that the next sync after
+        # `retry-failed` revisits the day and cleans and extracts its filings (processed filings are skipped)
+        mark = min(failed) - dt.timedelta(days=1) if failed else days_new[-1]
+        if mark > marks[form_type]:
+            journal.set_watermark(jcon, mark.isoformat())
+        print(f'\nSynced {form_type} up to {mark}: {len(filings)} filings processed, {len(failed)} failed '
+              f'(run `retry-failed --form-type {form_type}` to download them again).')
+        jcon.close()
+    con.close()
+
+
+def run_pipeline(user_agent: str, start: int, end: int, form_type: str = '10-k', n: int = 10,
+                 concurrency: int = 4, workers: int = 1, sections: tuple = ('mda',),
+                 persist: tuple = ('sections', 'metadata'), queue_size: int = 32, engine: str = 'regex',
+                 edgar_url: str = EDGAR_URL, backend: str = None, path_selection: Path = None):
+    """ Download, clean and extract filings in a single pass, i.e. each filing flows from the network to the
+    cleaner and section extractors in memory and only the requested artifacts are written
+    :param str user_agent:
+        Agent to identify with SEC EDGAR (of the form 'ORG_NAME MAIL_ADDRESS')
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int n:
+        Number of filings to be downloaded per quarter
+    :param int concurrency:
+        Number of concurrent downloads (all share one rate limiter below SEC's 10 requests/s)
+    :param int workers:
+        Number of worker processes for cleaning and extraction
+    :param tuple sections:
+        Section types to be extracted (any of: mda, item1)
+    :param tuple persist:
+        Artifacts to be written (any of: raw, clean, sections, metadata); the offsets of the sections are indexed
+        along with cleaned filings (see `section_index`), `sections` writes each section next to its filing (and
+        indexes the written section if the cleaned filing is not kept)
+    :param int queue_size:
+        Maximum number of filings in memory at once (downloading, waiting for a worker or processed by one)
+    :param str engine:
+        Cleaning engine (one of: regex, tokenizer)
+    :param str edgar_url:
+        Base URL of the EDGAR archives
+    :param str backend:
+        Storage backend for filings (one of: plain, zstd); detected from existing filings if not specified
+    :param Path path_selection:
+        Optional selection (see `select_filings`) whose filings are processed instead of the first `n` per quarter
+    """
+    unknown = set(persist) - set(ARTIFACTS)
+    if unknown:
+        print(f'Artifacts not implemented: {", ".join(sorted(unknown))}! Choose from: {", ".join(ARTIFACTS)}.')
+        return
+    if 'raw' in persist and 'clean' in persist:
+        print('Raw and cleaned filings share their path, persist either raw or clean!')
+        return
+    if engine not in parsing.ENGINES:
+        raise ValueError(f'Engine not implemented! Choose from: {", ".join(parsing.ENGINES)}.')
+    form_pattern = get_form_pattern(form_type)
+    if not form_pattern:
+        return
+    sections = tuple(s for s in sections if parsing.section_patterns(s, form_type))
+
+    path_log = Path('output', 'filings', form_type, 'log_download.txt')
+    path_meta = Path('output', 'filings', form_type, 'metadata.csv')
+    client = EdgarClient(user_agent)
+    con = indexing.connect()
+    store = storage.get_store(Path('output', 'filings', form_type), backend)
+    jcon = journal.connect(form_type)
+    mcon = metrics.connect(form_type)
+    mancon = manifest.connect(form_type)
+    scon = section_index.connect(form_type)
+    version_clean = parsing.stage_version('clean', form_type, engine=engine)
+    versions = {s: parsing.stage_version(s, form_type) for s in sections}
+    task = functools.partial(parsing.pipeline_task, sections=sections, form_type=form_type, engine=engine)
+
+    # the journal is only written by this thread; jobs stay queued until their artifacts are written
+    journal.reset_interrupted(jcon)
+    jobs = (job for year, qtr in enqueue_quarters(jcon, con, store, form_pattern, start, end, n, path_meta, edgar_url,
+                                                  path_selection)
+            for job in journal.pending(jcon, journal.QUEUED, year, qtr))
+    years, rows, done, failed = set(), [], [], 0
+    # jobs interrupted after their metadata was appended are processed again, their rows are not appended twice
+    fnames = metadata_fnames(path_meta) if 'metadata' in persist else None
+    # only jobs whose filing was kept are done for `download-filings` (written ones still lack metadata)
+    if 'raw' in persist or 'clean' in persist:
+        state = journal.METADATA_DONE if 'metadata' in persist else journal.WRITTEN
+    else:
+        state = journal.PROCESSED
+
+    def flush():
+        if 'metadata' in persist:
+            write_metadata(con, path_meta, rows, fnames)
+        with jcon:
+            for accession, fields in done:
+                journal.set_state(jcon, [accession], state, **fields)
+        mancon.commit()
+        mcon.commit()
+        scon.commit()
+        rows.clear()
+        done.clear()
+
+    def fail(job, e, attempts):
+        years.add(job['year'])
+        print(type(e).__name__, e)
+        write_log(path_log, f'Pipeline failed:\t{job["url"]}\n{type(e).__name__} {e}')
+        with jcon:
+            journal.set_state(jcon, [job['accession']], journal.FAILED, attempts=attempts,
+                              error=f'{type(e).__name__} {e}')
+
+    fetching, processing = {}, {}
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=workers) as cpu_pool, tqdm(unit=' filings') as progress:
+        while True:
+            # backpressure: downloads only start while fewer than `queue_size` filings are held in memory
+            while jobs is not None and len(fetching) + len(processing) < queue_size:
+                job = next(jobs, None)
+                if job is None:
+                    jobs = None
+                    break
+                stats = {}
+                fetching[fetch_pool.submit(fetch_filing_body, client, job['url'], path_log, stats)] = job, stats
+            if not fetching and not processing:
+                break
+            for future in wait([*fetching, *processing], return_when=FIRST_COMPLETED)[0]:
+                if future in fetching:
+                    job, stats = fetching.pop(future)
+                    path_file = Path(job['path'])
+                    attempts = job['attempts'] + stats.get('attempts', 0)
+                    retries = stats.get('attempts', 1) - 1
+                    try:
+                        body = future.result()
+                    except Exception as e:
+                        fail(job, e, attempts)
+                        metrics.record(mcon, 'download', path_file, {'retries': retries, 'failed': 1})
+                        failed += 1
+                        continue
+                    metrics.record(mcon, 'download', path_file, {'seconds': stats['latency'], 'bytes': stats['bytes'],
+                                                                 'retries': retries})
+                    if 'raw' in persist:
+                        store.write_bytes(path_file, body)
+                    h = hashlib.sha256(body).hexdigest() if 'clean' in persist else None
+                    fields = {'attempts': attempts, 'bytes': stats['bytes'], 'latency': stats['latency']}
+                    processing[cpu_pool.submit(task, body)] = job, fields, body_metadata(body, edgar_url), h
+                    continue
+
+                job, fields, meta, h = processing.pop(future)
+                path_file = Path(job['path'])
+                try:
+                    txt, stats, extracted, section_stats, spans = future.result()
+                except Exception as e:
+                    fail(job, e, fields['attempts'])
+                    failed += 1
+                    continue
+                metrics.record(mcon, 'clean', path_file, {**stats, 'chars': len(txt)})
+                if 'clean' in persist:
+                    store.write_text(path_file, txt)
+                    h_clean = hashlib.sha256(txt.encode('utf-8', errors='ignore')).hexdigest()
+                    manifest.record(mancon, path_file, 'clean', version_clean, h, output_hash=h_clean)
+                for s, section in extracted.items():
+                    path_section = Path(path_file.parent, f'{path_file.stem}_{s}.txt')
+                    if section is None:
+                        section = ''
+                        section_stats[s]['timed_out'] = 1
+                    metrics.record(mcon, s, path_file, {**section_stats[s], 'chars': len(section)})
+                    if 'sections' in persist:
+                        store.write_text(path_section, section)
+                    if 'clean' in persist:
+                        # offsets refer to the cleaned filing, hence sections are only indexed along with it
+                        section_index.record(scon, path_file, s, spans[s], len(section))
+                        if 'sections' in persist:
+                            manifest.record(mancon, path_file, s, versions[s], h_clean, path_section,
+                                            hashlib.sha256(section.encode('utf-8')).hexdigest())
+                        else:
+                            manifest.record(mancon, path_file, s, versions[s], h_clean)
+                    elif 'sections' in persist:
+                        # without the cleaned filing, the section is read from its materialized copy
+                        section_index.record(scon, path_file, s, spans[s], len(section), path_section)
+                rows.append(metadata_row(meta, path_file))
+                done.append((job['accession'], fields))
+                years.add(job['year'])
+                progress.update()
+                if len(done) >= 100:
+                    flush()
+    flush()
+
+    print(f'\nPipeline completed: {progress.n} filings processed, {failed} failed '
+          f'(persisted: {", ".join(persist) or "nothing"}).')
+    if years:
+        print_journal(jcon, min(years), max(years), form_type)
+    jcon.close()
+    mcon.close()
+    mancon.close()
+    scon.close()
+    con.close()
+
+
+def metadata_task(filing: Path):
+    """ Worker function extracting metadata of a raw filing (None if the SEC header was removed by cleaning) """
+    if not parsing.is_raw_filing(filing):
+        return None
+    return extract_metadata(filing)
+
+
+def extract_metadata_filings(start: int, end: int, form_type: str = '10-k', workers: int = 1):
+    """ Rebuild metadata of downloaded raw filings (write to `metadata` table of `output/index/index.sqlite` and
+    append filings missing from `output/filings/{form_type}/metadata.csv`)
+    :param int start:
+        Start year for scraping
+    :param int start:
+        End year for scraping
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int workers:
+        Number of worker processes
+    """
+    path_meta = Path('output', 'filings', form_type, 'metadata.csv')
+    fnames = metadata_fnames(path_meta)
+
+    con = indexing.connect()
+    filings = parsing.list_filings(start, end, form_type)
+    rows, skipped, new = [], 0, 0
+    for filing, meta in tqdm(parsing.map_filings(metadata_task, filings, workers), total=len(filings)):
+        if meta is None:
+            skipped += 1
+            continue
+        rows.append(metadata_row(meta, filing))
+        if len(rows) >= 1000:
+            new += write_metadata(con, path_meta, rows, fnames)
+            rows = []
+    new += write_metadata(con, path_meta, rows, fnames)
+    con.close()
+
+    print(f'\nMetadata of {len(filings) - skipped} filings written to {indexing.PATH_INDEX_DB} '
+          f'({new} rows appended to {path_meta}).')
+    if skipped:
+        print(f'{skipped} filings were skipped as their SEC header was removed by cleaning.')
 
 
 if __name__ == '__main__':
     args = docopt(__doc__)
     if args['download-index']:
-        download_index(args['--user-agent'], int(args['--start']), int(args['--end']))
+        download_index(args['--user-agent'], int(args['--start']), int(args['--end']), int(args['--concurrency']),
+                       args['--refresh'])
+    elif args['ingest-index']:
+        ingest_index(int(args['--start']), int(args['--end']), args['--force'])
     elif args['count-filings']:
         count_filings(int(args['--start']), int(args['--end']), args['--form-type'])
     elif args['download-filings']:
-        download_filings(args['--user-agent'], int(args['--start']), int(args['--end']), args['--form-type'], int(args['--no-of-filings']))
+        download_filings(args['--user-agent'], int(args['--start']), int(args['--end']), args['--form-type'], int(args['--no-of-filings']),
+                         int(args['--concurrency']), backend=args['--storage'],
+                         path_selection=Path(args['--selection']) if args['--selection'] else None)
+    elif args['select-filings']:
+        select_filings(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--no-of-filings']),
+                       tuple(args['--strata'].split(',')) if args['--strata'] else (), int(args['--seed']),
+                       args['--ciks'], args['--sic'].split(',') if args['--sic'] else None, args['--date-from'],
+                       args['--date-to'], Path(args['--output']) if args['--output'] else None)
+    elif args['retry-failed']:
+        retry_failed(args['--user-agent'], int(args['--start']), int(args['--end']), args['--form-type'],
+                     int(args['--concurrency']))
+    elif args['extract-metadata']:
+        extract_metadata_filings(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--workers']))
+    elif args['run-pipeline']:
+        run_pipeline(args['--user-agent'], int(args['--start']), int(args['--end']), args['--form-type'],
+                     int(args['--no-of-filings']), int(args['--concurrency']), int(args['--workers']),
+                     tuple(args['--sections'].split(',')), tuple(p for p in args['--persist'].split(',') if p),
+                     int(args['--queue-size']), args['--engine'], backend=args['--storage'],
+                     path_selection=Path(args['--selection']) if args['--selection'] else None)
+    elif args['sync']:
+        sync(args['--user-agent'], args['--form-types'].split(','),
+             dt.date.fromisoformat(args['--since']) if args['--since'] else None, int(args['--concurrency']),
+             int(args['--workers']), tuple(args['--sections'].split(',')))
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Inverted full-text index over extracted sections for term and phrase queries.
+
+Usage:
+    edgar_search.py index-sections [--form-type=STR] [--sections=STR] [--segment-size=INT]
+    edgar_search.py search <query> [--form-type=STR] [--section-type=STR] [--start=INT] [--end=INT] [--date-from=STR] [--date-to=STR] [--ciks=STR] [--sic=STR] [--limit=INT] [--output=PATH]
+
+Options:
+    -h, --help
+    --form-type=STR                 Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a) [default: 10-k].
+    --sections=STR                  Comma-separated section types to be indexed (any of: mda, item1) [default: mda,item1].
+    --section-type=STR              Section type to be searched (one of: mda, item1) [default: mda].
+    --segment-size=INT              Maximum number of term-section pairs held in memory before a segment is written [default: 1000000].
+    --start=INT                     Optional first year of the quarterly index.
+    --end=INT                       Optional last year of the quarterly index.
+    --date-from=STR                 Optional first filing date (YYYY-MM-DD).
+    --date-to=STR                   Optional last filing date (YYYY-MM-DD).
+    --ciks=STR                      Optional CIK whitelist, comma-separated or path to a file with one CIK per line.
+    --sic=STR                       Optional comma-separated SIC codes or prefixes (e.g. 28,7372).
+    --limit=INT                     Number of matching sections printed [default: 20].
+    --output=PATH                   Optional CSV file receiving all matching sections.
+
+Each indexed section is a document keyed by accession number and section type, with CIK, SIC code and
+filing date joined from the metadata of the index store (falling back to the index files for filings
+without metadata). Sections are tokenized into lowercase words; for each word, a posting list holds
+the documents containing it and the positions of the word in each document, so that phrases are
+matched by their positions. Posting lists are written in segments of bounded size and compressed by
+delta and variable-byte encoding:
+
+    n, doc id deltas (n), byte lengths of the position blocks (n), position blocks (position deltas)
+
+so that document ids are decoded without decoding any positions. `index-sections` only indexes sections
+that are new or were re-extracted since the last run (documents of re-extracted sections are replaced)
+and merges the segments once there are more than `MAX_SEGMENTS`, dropping replaced documents.
+Queries are words and quoted phrases that all have to occur in a section, e.g. `"going concern" doubt`.
+"""
+
+
+import csv
+import datetime as dt
+import sqlite3
+import time
+from pathlib import Path
+
+from docopt import docopt
+
+import indexing
+import section_index
+import selection
+import storage
+from parsing_patterns import PAT_QUERY, PAT_TERM
+
+
+MAX_SEGMENTS = 8
+SEGMENT_SIZE = 1_000_000
+# bytes starting a new value of a variable-byte encoded sequence are below 0x80 (deleted to count the values)
+VARINT_CONTINUATION = bytes(range(0x80, 0x100))
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    section TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    cik INTEGER,
+    sic TEXT,
+    date_filing TEXT,
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    terms INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL, -- offsets and extraction time of the indexed section (see `section_index`)
+    live INTEGER NOT NULL DEFAULT 1 -- 0 if the section was re-extracted or is empty now
+);
+CREATE INDEX IF NOT EXISTS ix_docs_path ON docs (path, section, live);
+CREATE INDEX IF NOT EXISTS ix_docs_filter ON docs (section, date_filing);
+CREATE TABLE IF NOT EXISTS segments (
+    segment INTEGER PRIMARY KEY,
+    docs INTEGER NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    df INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+"""
+
+
+def connect(form_type: str = '10-k'):
+    """ Open (and if necessary create) the full-text index of a form type
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return sqlite3.Connection:
+        Connection to full-text index (write to `output/filings/{form_type}/search.sqlite`)
+    """
+    path_db = Path('output', 'filings', form_type, 'search.sqlite')
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    return con
+
+
+def encode_varints(values):
+    """ Variable-byte encoding of non-negative integers (7 bits per byte, high bit set on all but the last byte) """
+    out = bytearray()
+    for v in values:
+        while v >= 0x80:
+            out.append(v & 0x7f | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def decode_varints(data, pos: int = 0, n: int = None):
+    """ Decode `n` variable-byte encoded integers (all if None) starting at byte `pos`
+    :return tuple:
+        Decoded integers and byte offset after the last one
+    """
+    values, end = [], len(data)
+    while pos < end and (n is None or len(values) < n):
+        v = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            v |= (b & 0x7f) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        values.append(v)
+    return values, pos
+
+
+def deltas(values):
+    """ Differences between consecutive integers (the first integer as is) """
+    return [v - u for u, v in zip([0] + values, values)]
+
+
+def encode_postings(doc_ids: list, blocks: list):
+    """ Encode the posting list of a term (see module docstring)
+    :param list doc_ids:
+        Ascending document ids
+    :param list blocks:
+        Encoded positions of the term per document (see `encode_varints`)
+    :return bytes:
+        Posting list
+    """
+    return encode_varints([len(doc_ids), *deltas(doc_ids), *map(len, blocks)]) + b''.join(blocks)
+
+
+def decode_postings(data):
+    """ Decode the document ids of a posting list, leaving the positions encoded
+    :return dict:
+        Encoded positions (memoryview into `data`) per document id
+    """
+    (n,), pos = decode_varints(data, 0, 1)
+    header, pos = decode_varints(data, pos, 2 * n)
+    view, doc_id, postings = memoryview(data), 0, {}
+    for delta, length in zip(header[:n], header[n:]):
+        doc_id += delta
+        postings[doc_id] = view[pos:pos + length]
+        pos += length
+    return postings
+
+
+def positions(block):
+    """ Decode the positions of a term in a document """
+    values = decode_varints(block)[0]
+    for i in range(1, len(values)):
+        values[i] += values[i - 1]
+    return values
+
+
+def tokenize(txt: str):
+    """ Lowercase words of a text """
+    return PAT_TERM.findall(txt.lower())
+
+
+def filing_metadata(con: sqlite3.Connection, accession: str):
+    """ CIK, SIC code and filing date (YYYY-MM-DD) of a filing from the index store (None if unknown) """
+    row = con.execute('SELECT cik, sic, date_filing FROM metadata WHERE accession = ?', (accession,)).fetchone()
+    if row is not None and row[0]:
+        cik, sic, date = row
+        date = f'{date[:4]}-{date[4:6]}-{date[6:]}' if date and len(date) == 8 and date.isdigit() else date
+        return int(cik), sic or None, date or None
+    row = con.execute('SELECT cik, date_filed FROM filings WHERE accession = ?', (accession,)).fetchone()
+    return (row[0], None, row[1]) if row is not None else (None, None, None)
+
+
+def flush_segment(con: sqlite3.Connection, postings: dict, n_docs: int):
+    """ Write in-memory posting lists as a new segment (committed by the caller)
+    :param sqlite3.Connection con:
+        Connection to full-text index
+    :param dict postings:
+        Document ids and encoded positions per term
+    :param int n_docs:
+        Number of documents in the segment
+    """
+    segment = con.execute('INSERT INTO segments (docs, created) VALUES (?, ?)',
+                          (n_docs, dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+    con.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)',
+                    ((term, segment, len(doc_ids), encode_postings(doc_ids, blocks))
+                     for term, (doc_ids, blocks) in sorted(postings.items())))
+    postings.clear()
+
+
+def merge_segments(con: sqlite3.Connection):
+    """ Merge all segments into one, dropping documents that were replaced or emptied since they were indexed """
+    segments = [r[0] for r in con.execute('SELECT segment FROM segments ORDER BY segment')]
+    live = {r[0] for r in con.execute('SELECT doc_id FROM docs WHERE live = 1')}
+    with con:
+        segment = con.execute('INSERT INTO segments (docs, created) VALUES (?, ?)',
+                              (len(live), dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+        con.execute('CREATE TEMP TABLE merged (term TEXT, df INTEGER, data BLOB)')
+        term, doc_ids, blocks = None, [], []
+
+        def write():
+            if doc_ids:
+                con.execute('INSERT INTO merged VALUES (?, ?, ?)', (term, len(doc_ids), encode_postings(doc_ids, blocks)))
+
+        # segments hold ascending document ids, hence posting lists are concatenated in segment order
+        for row in con.execute('SELECT term, data FROM postings ORDER BY term, segment'):
+            if row['term'] != term:
+                write()
+                term, doc_ids, blocks = row['term'], [], []
+            for doc_id, block in decode_postings(row['data']).items():
+                if doc_id in live:
+                    doc_ids.append(doc_id)
+                    blocks.append(bytes(block))
+        write()
+        con.execute(f'DELETE FROM postings WHERE segment IN ({",".join("?" * len(segments))})', segments)
+        con.execute(f'DELETE FROM segments WHERE segment IN ({",".join("?" * len(segments))})', segments)
+        con.execute('INSERT INTO postings SELECT term, ?, df, data FROM merged', (segment,))
+        con.execute('DELETE FROM docs WHERE live = 0')
+        con.execute('DROP TABLE merged')
+
+
+def index_sections(form_type: str = '10-k', sections: tuple = ('mda', 'item1'), segment_size: int = SEGMENT_SIZE):
+    """ Add sections that are new or were re-extracted since the last run to the full-text index (see module
+    docstring)
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param tuple sections:
+        Section types (any of: mda, item1)
+    :param int segment_size:
+        Maximum number of term-section pairs held in memory before a segment is written
+    """
+    con = connect(form_type)
+    scon = section_index.connect(form_type)
+    icon = indexing.connect()
+
+    # a section is (re-)indexed if it is not indexed with its current offsets and extraction time
+    rows = sorted((r for s in sections for r in section_index.select(scon, s)), key=lambda r: r['path'])
+    scon.close()
+    indexed = {(r['path'], r['section']): (r['doc_id'], r['fingerprint'])
+               for r in con.execute('SELECT doc_id, path, section, fingerprint FROM docs WHERE live = 1')}
+    pending, dropped = [], []
+    for row in rows:
+        fingerprint = f'{row["start"]}:{row["end"]}:{row["updated"]}'
+        doc_id, indexed_fingerprint = indexed.get((row['path'], row['section']), (None, None))
+        if indexed_fingerprint == fingerprint:
+            continue
+        if doc_id is not None:
+            dropped.append(doc_id)
+        if row['length'] > 0:
+            pending.append((row, fingerprint))
+    with con:
+        con.executemany('UPDATE docs SET live = 0 WHERE doc_id = ?', ((d,) for d in dropped))
+
+    postings, n_pairs, n_docs, n_terms, txt, path = {}, 0, 0, 0, '', None
+    t0 = time.perf_counter()
+    for i, (row, fingerprint) in enumerate(pending):
+        # filings with several sections are read once (sections of filings that were not kept are read on their own)
+        if row['path'] != path and row['section_path'] is None:
+            path = row['path']
+            txt = storage.store_for(Path(path)).read_text(Path(path))
+        terms = tokenize(section_index.read_section(row, txt if row['path'] == path else None))
+        cik, sic, date = filing_metadata(icon, row['accession'])
+        doc_id = con.execute('INSERT INTO docs (path, section, accession, cik, sic, date_filing, year, qtr, length, '
+                             'terms, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (row['path'], row['section'], row['accession'], cik, sic, date, row['year'], row['qtr'],
+                              row['length'], len(terms), fingerprint)).lastrowid
+        term_positions = {}
+        for pos, term in enumerate(terms):
+            term_positions.setdefault(term, []).append(pos)
+        for term, pos in term_positions.items():
+            doc_ids, blocks = postings.setdefault(term, ([], []))
+            doc_ids.append(doc_id)
+            blocks.append(encode_varints(deltas(pos)))
+        n_pairs += len(term_positions)
+        n_docs += 1
+        n_terms += len(terms)
+        if n_pairs >= segment_size or i == len(pending) - 1:
+            with con:
+                flush_segment(con, postings, n_docs)
+            n_pairs, n_docs = 0, 0
+            print(f'{i + 1}/{len(pending)} sections indexed')
+
+    # metadata downloaded after a section was indexed is joined on later runs
+    with con:
+        for r in con.execute('SELECT doc_id, accession FROM docs WHERE cik IS NULL OR sic IS NULL').fetchall():
+            cik, sic, date = filing_metadata(icon, r['accession'])
+            if cik is not None:
+                con.execute('UPDATE docs SET cik = ?, sic = ?, date_filing = ? WHERE doc_id = ?',
+                            (cik, sic, date, r['doc_id']))
+    icon.close()
+    n_segments = con.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+    if n_segments > MAX_SEGMENTS:
+        merge_segments(con)
+    n_live = con.execute('SELECT COUNT(*) FROM docs WHERE live = 1').fetchone()[0]
+    con.close()
+
+    print(f'\n{len(pending)} sections ({n_terms / 1e6:.1f} M words) indexed in {time.perf_counter() - t0:.1f}s, '
+          f'{len(dropped)} outdated sections replaced or removed. '
+          f'The index of {form_type} holds {n_live} sections.')
+
+
+def parse_query(query: str):
+    """ Phrases of a query, i.e. the words of each quoted phrase and each single unquoted word """
+    phrases = [tokenize(phrase or word) for phrase, word in PAT_QUERY.findall(query)]
+    return [p for p in phrases if p]
+
+
+def term_postings(con: sqlite3.Connection, term: str, candidates: set = None):
+    """ Encoded positions per document id of a term across all segments (restricted to `candidates` if given) """
+    postings = {}
+    for (data,) in con.execute('SELECT data FROM postings WHERE term = ? ORDER BY segment', (term,)):
+        segment = decode_postings(data)
+        if candidates is not None:
+            segment = {d: segment[d] for d in candidates & segment.keys()}
+        postings.update(segment)
+    return postings
+
+
+def match_phrase(con: sqlite3.Connection, phrase: list, candidates: set = None):
+    """ Number of occurrences of a phrase per document
+    :param sqlite3.Connection con:
+        Connection to full-text index
+    :param list phrase:
+        Words of the phrase
+    :param set candidates:
+        Optional document ids the search is restricted to
+    :return dict:
+        Number of occurrences per document id (documents without occurrences are omitted)
+    """
+    postings = []
+    for term in phrase:
+        postings.append(term_postings(con, term, candidates))
+        # documents missing a term cannot match, later terms are only kept for the remaining ones
+        candidates = set(postings[-1])
+        if not candidates:
+            return {}
+    docs = set(postings[0])
+    for p in postings[1:]:
+        docs &= p.keys()
+    if len(phrase) == 1:
+        return {d: len(bytes(postings[0][d]).translate(None, VARINT_CONTINUATION)) for d in docs}
+    hits = {}
+    for d in docs:
+        following = [set(positions(p[d])) for p in postings[1:]]
+        n = sum(all(pos + i in f for i, f in enumerate(following, 1)) for pos in positions(postings[0][d]))
+        if n:
+            hits[d] = n
+    return hits
+
+
+def search(query: str, form_type: str = '10-k', section_type: str = 'mda', start: int = None, end: int = None,
+           date_from: str = None, date_to: str = None, ciks: str = None, sics: list = None, limit: int = 20,
+           path_output: Path = None):
+    """ Search sections containing all words and phrases of a query
+    :param str query:
+        Words and quoted phrases, e.g. `"going concern" doubt`
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param str section_type:
+        Section type (one of: mda, item1)
+    :param int start:
+        Optional first year of the quarterly index
+    :param int end:
+        Optional last year of the quarterly index
+    :param str date_from:
+        Optional first filing date (YYYY-MM-DD)
+    :param str date_to:
+        Optional last filing date (YYYY-MM-DD)
+    :param str ciks:
+        Optional CIK whitelist, comma-separated or path to a file with one CIK per line
+    :param list sics:
+        Optional SIC codes or prefixes
+    :param int limit:
+        Number of matching sections printed
+    :param Path path_output:
+        Optional CSV file receiving all matching sections
+    :return list:
+        Matching sections (accession, CIK, SIC code, filing date, year, quarter, section, length and number of
+        occurrences of the query phrases) in order of filing date
+    """
+    phrases = parse_query(query)
+    if not phrases:
+        print('Query contains no words!')
+        return []
+    t0 = time.perf_counter()
+    con = connect(form_type)
+
+    query_filter, params = 'd.live = 1 AND d.section = ?', [section_type]
+    for clause, value in (('d.year >= ?', start), ('d.year <= ?', end), ('d.date_filing >= ?', date_from),
+                          ('d.date_filing <= ?', date_to)):
+        if value is not None:
+            query_filter += f' AND {clause}'
+            params.append(value)
+    if ciks:
+        cik_list = sorted(selection.parse_ciks(ciks))
+        query_filter += f' AND d.cik IN ({",".join("?" * len(cik_list))})'
+        params += cik_list
+    if sics:
+        query_filter += ' AND (' + ' OR '.join('d.sic LIKE ?' for _ in sics) + ')'
+        params += [f'{s}%' for s in sics]
+    # postings are only decoded for sections passing the filters
+    candidates = {d for (d,) in con.execute(f'SELECT doc_id FROM docs d WHERE {query_filter}', params)}
+
+    # rarest phrases first, later phrases are only matched in documents that contain the previous ones
+    hits = None
+    for phrase in sorted(phrases, key=lambda p: min(con.execute('SELECT COALESCE(SUM(df), 0) FROM postings '
+                                                                'WHERE term = ?', (t,)).fetchone()[0] for t in p)):
+        matched = match_phrase(con, phrase, candidates if hits is None else set(hits))
+        hits = matched if hits is None else {d: hits[d] + n for d, n in matched.items()}
+        if not hits:
+            break
+
+    con.execute('CREATE TEMP TABLE IF NOT EXISTS hits (doc_id INTEGER PRIMARY KEY, hits INTEGER NOT NULL)')
+    con.execute('DELETE FROM hits')
+    con.executemany('INSERT INTO hits VALUES (?, ?)', hits.items())
+    rows = [dict(r) for r in con.execute(
+        'SELECT d.accession, d.cik, d.sic, d.date_filing, d.year, d.qtr, d.section, d.length, h.hits '
+        f'FROM hits h JOIN docs d USING (doc_id) WHERE {query_filter} ORDER BY d.date_filing, d.accession', params)]
+    con.close()
+    seconds = time.perf_counter() - t0
+
+    print(f'{len(rows)} sections match {query} ({seconds:.3f}s):')
+    for row in rows[:limit]:
+        print(';'.join(str(row[c]) for c in row))
+    if len(rows) > limit:
+        print(f'... and {len(rows) - limit} more')
+    if path_output is not None and rows:
+        path_output.parent.mkdir(parents=True, exist_ok=True)
+        with path_output.open('w', encoding='utf-8', newline='') as f:
+            w = csv.DictWriter(f, list(rows[0]), delimiter=';', lineterminator='\n')
+            w.writeheader()
+            w.writerows(rows)
+        print(f'Matching sections written to {path_output}')
+    return rows
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['index-sections']:
+        index_sections(args['--form-type'], tuple(args['--sections'].split(',')), int(args['--segment-size']))
+    elif args['search']:
+        search(args['<query>'], args['--form-type'], args['--section-type'],
+               int(args['--start']) if args['--start'] else None, int(args['--end']) if args['--end'] else None,
+               args['--date-from'], args['--date-to'], args['--ciks'],
+               args['--sic'].split(',') if args['--sic'] else None, int(args['--limit']),
+               Path(args['--output']) if args['--output'] else None)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Offset index of the sections extracted from cleaned filings.
+
+Instead of writing a copy of every section next to its filing (`{accession}_{section}.txt`), extraction
+records where the section is located in the cleaned filing: its character offsets, the pair of anchor
+patterns that matched, and its raw and normalized length. The index is kept per form type in
+`output/filings/{form_type}/sections.sqlite` with the year and quarter of each filing, so that length
+filters, sampling and corpus building are queries. Section texts are materialized on demand by
+`read_section`, which slices the cleaned filing and normalizes the slice exactly like the extraction did.
+Sections of filings that were not kept (e.g. by `run-pipeline` without persisting cleaned filings) are
+indexed with the path of their materialized copy, which `read_section` reads instead.
+"""
+
+
+import datetime as dt
+import sqlite3
+from pathlib import Path
+
+import storage
+from parsing_patterns import (PAT_COMMENT_END, PAT_PUNCT_SPACE, PAT_SEPARATOR, PAT_TAB2, PAT_TOC1, PAT_TOC2,
+                              PAT_WHITESPACE)
+
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS sections (
+    path TEXT NOT NULL,
+    section TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    qtr INTEGER NOT NULL,
+    start INTEGER NOT NULL, -- character offsets in the cleaned filing (both 0 if the section was not found)
+    end INTEGER NOT NULL,
+    pattern INTEGER, -- position of the matching pair of anchor patterns (NULL if not found or timed out)
+    raw_length INTEGER NOT NULL,
+    length INTEGER NOT NULL, -- length of the normalized section
+    updated TEXT NOT NULL,
+    section_path TEXT, -- materialized section, read instead of the cleaned filing (NULL if the filing is kept)
+    PRIMARY KEY (path, section)
+);
+CREATE INDEX IF NOT EXISTS ix_sections_quarter ON sections (section, year, qtr, length);
+"""
+
+
+def index_path(form_type: str = '10-k'):
+    """ Path to the section index of a form type """
+    return Path('output', 'filings', form_type, 'sections.sqlite')
+
+
+def connect(form_type: str = '10-k'):
+    """ Open (and if necessary create) the section index of a form type
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :return sqlite3.Connection:
+        Connection to section index (write to `output/filings/{form_type}/sections.sqlite`)
+    """
+    path_db = index_path(form_type)
+    path_db.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path_db)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    if 'section_path' not in {r['name'] for r in con.execute('PRAGMA table_info(sections)')}:
+        # indexes created before sections could be indexed without their filing
+        con.execute('ALTER TABLE sections ADD COLUMN section_path TEXT')
+    return con
+
+
+def postprocess_section(section: str):
+    """ Remove table of contents references, separator lines and redundant white space from section """
+    section = PAT_TOC1.sub(' ', section)
+    section = PAT_TOC2.sub(' ', section)
+    section = PAT_SEPARATOR.sub(' ', section)
+    section = PAT_WHITESPACE.sub(' ', section)
+    section = PAT_PUNCT_SPACE.sub(r'\1 ', section)
+    section = PAT_COMMENT_END.sub('', section)
+    return section
+
+
+def quarter_of(filing: Path):
+    """ Year and quarter of a filing (addressed as `output/filings/{form_type}/{year}/q{qtr}/{accession}.txt`) """
+    return int(filing.parent.parent.name), int(filing.parent.name[1:])
+
+
+def record(con: sqlite3.Connection, filing: Path, section: str, span: tuple, length: int,
+           section_path: Path = None):
+    """ Record the location of a section (committed by the caller, e.g. in batches)
+    :param sqlite3.Connection con:
+        Connection to section index
+    :param Path filing:
+        Path to cleaned filing
+    :param str section:
+        Section type (one of: mda, item1)
+    :param tuple span:
+        Start and end offset in the cleaned filing and position of the matching pair of anchor patterns
+        (None if the search timed out)
+    :param int length:
+        Length of the normalized section
+    :param Path section_path:
+        Path to the materialized section if the cleaned filing is not kept (optional)
+    """
+    start, end, pattern = span or (0, 0, None)
+    year, qtr = quarter_of(filing)
+    con.execute('INSERT OR REPLACE INTO sections (path, section, accession, year, qtr, start, end, pattern, '
+                'raw_length, length, updated, section_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (str(filing), section, filing.stem, year, qtr, start, end, pattern, end - start, length,
+                 dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), None if section_path is None else str(section_path)))
+
+
+def entry(con: sqlite3.Connection, filing: Path, section: str):
+    """ Index entry of a section (None if not recorded) """
+    return con.execute('SELECT * FROM sections WHERE path = ? AND section = ?', (str(filing), section)).fetchone()
+
+
+def select(con: sqlite3.Connection, section: str, start: int = None, end: int = None, qtr: int = None,
+           min_length: int = None):
+    """ Select indexed sections
+    :param sqlite3.Connection con:
+        Connection to section index
+    :param str section:
+        Section type (one of: mda, item1)
+    :param int start:
+        Optional start year
+    :param int end:
+        Optional end year
+    :param int qtr:
+        Optional quarter
+    :param int min_length:
+        Optionally select only sections whose normalized length exceeds `min_length` characters
+    :return list:
+        Index entries (in path order)
+    """
+    query, params = 'SELECT * FROM sections WHERE section = ?', [section]
+    if start is not None:
+        query += ' AND year >= ?'
+        params.append(start)
+    if end is not None:
+        query += ' AND year <= ?'
+        params.append(end)
+    if qtr is not None:
+        query += ' AND qtr = ?'
+        params.append(qtr)
+    if min_length is not None:
+        query += ' AND length > ?'
+        params.append(min_length)
+    return con.execute(query + ' ORDER BY path', params).fetchall()
+
+
+def slice_section(txt: str, row):
+    """ Materialize an indexed section from the text of its cleaned filing """
+    if row['end'] <= row['start']:
+        return ''
+    return postprocess_section(PAT_TAB2.sub('', txt[row['start']:row['end']]))
+
+
+def read_section(row, txt: str = None):
+    """ Materialize an indexed section from its cleaned filing or read its materialized copy (from the store of the
+    form type)
+    :param sqlite3.Row row:
+        Index entry (see `entry` and `select`)
+    :param str txt:
+        Text of the cleaned filing if read already, e.g. for several sections of a filing (optional)
+    :return str:
+        Normalized section text (empty if not found)
+    """
+    if row['end'] <= row['start']:
+        return ''
+    if row['section_path'] is not None:
+        path_section = Path(row['section_path'])
+        return storage.store_for(path_section).read_text(path_section)
+    if txt is None:
+        filing = Path(row['path'])
+        txt = storage.store_for(filing).read_text(filing)
+    return slice_section(txt, row)
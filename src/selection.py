@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Selection of filings from the index store by seeded stratified sampling.
+
+Candidates are the filings of a form type in the index store (`indexing.select_filings`), optionally
+restricted to a CIK whitelist, SIC codes and a range of filing dates. They are grouped into strata by
+any combination of
+
+- `quarter`: year and quarter of the index file,
+- `sic`: SIC major group (first two digits) as parsed from the SEC header of the latest downloaded filing
+  of the CIK (`unknown` for CIKs without downloaded filings),
+- `size`: filer size quartile (1-4), approximated by the number of filings of any form type the CIK
+  submitted in the period (the index lists neither file nor firm sizes),
+
+and up to `n` filings are drawn from each stratum. The index files do not list SIC codes, so SIC filters and
+strata only know the CIKs whose filings were downloaded before (or whose metadata was extracted); on a fresh
+index store they cannot be applied at all. Each stratum is sampled with its own generator
+(seeded with the seed and the stratum), so changing the filters only changes the samples of the
+affected strata. The selection is written as a CSV file of accession numbers that `download-filings
+--selection` enqueues as is.
+"""
+
+
+import csv
+import random
+from bisect import bisect_left
+from pathlib import Path
+
+import indexing
+
+
+STRATA = ('quarter', 'sic', 'size')
+SIZE_BUCKETS = 4
+COLUMNS = ['accession', 'cik', 'comp_name', 'form_type', 'date_filed', 'fname', 'year', 'qtr', 'sic', 'size',
+           'stratum']
+
+
+def selection_path(form_type: str, start: int, end: int):
+    """ Default path of the selection of a form type (`output/selection/{form_type}_{start}_{end}.csv`) """
+    return Path('output', 'selection', f'{form_type}_{start}_{end}.csv')
+
+
+def parse_ciks(ciks: str):
+    """ CIKs of a whitelist, given as path to a file with one CIK per line or as comma-separated CIKs """
+    path = Path(ciks)
+    values = path.read_text(encoding='utf-8').split() if path.is_file() else ciks.split(',')
+    return {int(c) for c in (v.strip() for v in values) if c.isdigit()}
+
+
+def size_buckets(counts: dict, n: int = SIZE_BUCKETS):
+    """ Assign CIKs to `n` buckets of (about) equal size by their number of filings (CIKs with equal counts share
+    the lower bucket) """
+    ranked = sorted(counts.values())
+    return {cik: 1 + bisect_left(ranked, c) * n // len(ranked) for cik, c in counts.items()}
+
+
+def candidates(con, form_pattern, start: int, end: int, ciks: set = None, sics: list = None,
+               date_from: str = None, date_to: str = None):
+    """ Filings of a form type that pass all filters, with their SIC code and size bucket
+    :param sqlite3.Connection con:
+        Connection to index store
+    :param re.Pattern form_pattern:
+        Regex pattern for matching form types in index lines
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :param set ciks:
+        Optional whitelist of CIKs
+    :param list sics:
+        Optional SIC codes or prefixes, e.g. `['28', '7372']` (CIKs without known SIC code are dropped)
+    :param str date_from:
+        Optional first filing date (YYYY-MM-DD)
+    :param str date_to:
+        Optional last filing date (YYYY-MM-DD)
+    :return list:
+        Filings as dicts of `COLUMNS` (without `stratum`), in index file order
+    """
+    sic = indexing.sic_by_cik(con)
+    size = size_buckets(indexing.filings_by_cik(con, start, end))
+    rows = []
+    for cik, comp_name, form_type, date_filed, fname, accession, year, qtr in indexing.select_filings(
+            con, form_pattern, start, end, ciks=ciks, date_from=date_from, date_to=date_to):
+        if sics and not sic.get(cik, '').startswith(tuple(sics)):
+            continue
+        rows.append({'accession': accession, 'cik': cik, 'comp_name': comp_name, 'form_type': form_type,
+                     'date_filed': date_filed, 'fname': fname, 'year': year, 'qtr': qtr,
+                     'sic': sic.get(cik, ''), 'size': size[cik]})
+    return rows
+
+
+def stratum(row: dict, strata: tuple):
+    """ Stratum of a filing, e.g. `2012q1/sic=28/size=4` """
+    keys = []
+    if 'quarter' in strata:
+        keys.append(f'{row["year"]}q{row["qtr"]}')
+    if 'sic' in strata:
+        keys.append(f'sic={row["sic"][:2] or "unknown"}')
+    if 'size' in strata:
+        keys.append(f'size={row["size"]}')
+    return '/'.join(keys) or 'all'
+
+
+def sample(rows: list, strata: tuple, n: int, seed: int = 2020):
+    """ Draw up to `n` filings from each stratum
+    :param list rows:
+        Candidate filings (see `candidates`)
+    :param tuple strata:
+        Stratification keys (any of: quarter, sic, size); a single stratum if empty
+    :param int n:
+        Number of filings per stratum (all filings of smaller strata)
+    :param int seed:
+        Random seed
+    :return list:
+        Selected filings (with their `stratum`) in index file order
+    """
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(stratum(row, strata), []).append(i)
+    selected = []
+    for key, members in groups.items():
+        selected += random.Random(f'{seed}/{key}').sample(members, min(n, len(members)))
+    return [{**rows[i], 'stratum': stratum(rows[i], strata)} for i in sorted(selected)]
+
+
+def write_selection(path: Path, rows: list):
+    """ Write selected filings to a CSV file (replacing an existing selection) """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_tmp = path.with_suffix('.tmp')
+    with path_tmp.open('w', encoding='utf-8', newline='') as f:
+        w = csv.DictWriter(f, COLUMNS, delimiter=';', lineterminator='\n')
+        w.writeheader()
+        w.writerows(rows)
+    path_tmp.replace(path)
+
+
+def read_selection(path: Path):
+    """ Selected filings of a CSV file written by `write_selection` (year and quarter as integers) """
+    with Path(path).open('r', encoding='utf-8', newline='') as f:
+        return [{**row, 'year': int(row['year']), 'qtr': int(row['qtr'])} for row in csv.DictReader(f, delimiter=';')]
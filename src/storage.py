@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Storage backends for filings and extracted sections.
+
+Usage:
+    edgar_storage.py pack-filings [--start=INT] [--end=INT] [--form-type=STR] [--level=INT] [--keep-files]
+    edgar_storage.py compact-filings [--start=INT] [--end=INT] [--form-type=STR]
+
+Options:
+    -h, --help
+    --start=INT                     Start year [default: 1996].
+    --end=INT                       End year [default: 2020].
+    --form-type=STR                 Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a) [default: 10-k].
+    --level=INT                     Zstandard compression level [default: 10].
+    --keep-files                    Keep plain text files after packing them.
+
+Filings are addressed by their plain path (e.g. `output/filings/10-k/2020/q1/{accession}.txt`)
+regardless of the backend. The `zstd` backend appends each file as an independent zstd frame to a
+per-quarter pack (`output/filings/10-k/2020/q1.pack`, `q1.{generation}.pack` once compacted) and keeps
+the offset of every frame in `output/filings/10-k/store.sqlite`, so that any single filing can be read without decompressing
+the quarter. The backend is detected from the presence of `store.sqlite`; plain files that were
+not packed yet remain readable through the `zstd` backend.
+"""
+
+
+import contextlib
+import fnmatch
+import hashlib
+import io
+import itertools
+import mmap
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from docopt import docopt
+
+try:
+    import zstandard as zstd
+except ImportError:  # optional dependency, only required for the zstd backend
+    zstd = None
+
+
+STORE_DB = 'store.sqlite'
+STORES = {}
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS members (
+    path TEXT PRIMARY KEY,
+    pack TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_members_pack ON members (pack);
+CREATE TABLE IF NOT EXISTS packs (
+    quarter TEXT PRIMARY KEY,
+    pack TEXT NOT NULL -- current pack of the quarter directory (a new generation is written by each compaction)
+);
+"""
+
+
+class PlainStore:
+    """ Filings stored as plain UTF-8 text files """
+
+    backend = 'plain'
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def list(self, directory: Path, pattern: str = '*.txt'):
+        """ List files matching `pattern` below `directory` """
+        return list(directory.rglob(pattern))
+
+    def exists(self, path: Path):
+        return path.exists()
+
+    def open(self, path: Path):
+        """ Open file for streaming reads in text mode """
+        return path.open('r', encoding='utf-8', errors='ignore')
+
+    def read_text(self, path: Path):
+        with self.open(path) as f:
+            return f.read()
+
+    @contextlib.contextmanager
+    def open_buffer(self, path: Path):
+        """ Memory-map file for reading its (UTF-8 encoded) bytes without copying them """
+        with path.open('rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b''
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield buf
+
+    def write_text(self, path: Path, txt: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open('w', encoding='utf-8', errors='ignore') as f:
+            f.write(txt)
+
+    def write_bytes(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def write_file(self, path: Path, src: Path):
+        """ Move a completely written file (e.g. a download) to `path` by an atomic rename, so that `path` never
+        holds a partial file """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, path)
+
+    def fingerprint(self, path: Path):
+        """ Cheap (size, version) fingerprint that changes whenever the file is rewritten """
+        st = path.stat()
+        return st.st_size, st.st_mtime_ns
+
+    def hash(self, path: Path):
+        """ SHA-256 hash of the (uncompressed) file content """
+        h = hashlib.sha256()
+        with path.open('rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def close(self):
+        pass
+
+
+class ZstdStore(PlainStore):
+    """ Filings stored as zstd frames in per-quarter packs with an offset index """
+
+    backend = 'zstd'
+
+    def __init__(self, root: Path, level: int = 10):
+        if zstd is None:
+            raise ImportError('The zstd storage backend requires the `zstandard` package.')
+        super().__init__(root)
+        self.level = level
+        self.lock = threading.Lock()
+        root.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(Path(root, STORE_DB), check_same_thread=False)
+        self.con.executescript(SCHEMA)
+
+    def pack_of(self, path: Path):
+        """ Pack collecting all files of the quarter directory of `path` """
+        return self.quarter_pack(path.parent)
+
+    def quarter_pack(self, quarter: Path):
+        """ Current pack of a quarter directory """
+        row = self.con.execute('SELECT pack FROM packs WHERE quarter = ?', (str(quarter),)).fetchone()
+        return quarter.with_suffix('.pack') if row is None else Path(row[0])
+
+    def member(self, path: Path):
+        with self.lock:
+            return self.con.execute('SELECT pack, offset, length, size FROM members WHERE path = ?',
+                                    (str(path),)).fetchone()
+
+    def list(self, directory: Path, pattern: str = '*.txt'):
+        with self.lock:
+            packed = [Path(p) for (p,) in self.con.execute(
+                "SELECT path FROM members WHERE path LIKE ? ESCAPE '\\' ORDER BY rowid",
+                (str(directory).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + os.sep + '%',))]
+        packed = [p for p in packed if fnmatch.fnmatch(p.name, pattern)]
+        names = set(packed)
+        return packed + [p for p in super().list(directory, pattern) if p not in names]
+
+    def exists(self, path: Path):
+        return self.member(path) is not None or path.exists()
+
+    def read_frame(self, path: Path):
+        """ Read compressed frame of a packed file (None if not packed) """
+        member = self.member(path)
+        if member is None:
+            return None
+        pack, offset, length, _ = member
+        with open(pack, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def open(self, path: Path):
+        frame = self.read_frame(path)
+        if frame is None:
+            return super().open(path)
+        reader = zstd.ZstdDecompressor().stream_reader(io.BytesIO(frame))
+        return io.TextIOWrapper(reader, encoding='utf-8', errors='ignore')
+
+    def read_text(self, path: Path):
+        frame = self.read_frame(path)
+        if frame is None:
+            return super().read_text(path)
+        return zstd.ZstdDecompressor().decompress(frame).decode('utf-8', errors='ignore')
+
+    @contextlib.contextmanager
+    def open_buffer(self, path: Path):
+        frame = self.read_frame(path)
+        if frame is None:
+            with super().open_buffer(path) as buf:
+                yield buf
+            return
+        # frames cannot be mapped, hence packed files are decompressed into a single bytes buffer
+        yield zstd.ZstdDecompressor().decompress(frame)
+
+    def write_bytes(self, path: Path, data: bytes):
+        """ Append file as new zstd frame to the quarter pack (superseding earlier versions and plain files) """
+        frame = zstd.ZstdCompressor(level=self.level).compress(data)
+        with self.lock:
+            pack = self.pack_of(path)
+            pack.parent.mkdir(parents=True, exist_ok=True)
+            with open(pack, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(frame)
+            with self.con:
+                self.con.execute('INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?)',
+                                 (str(path), str(pack), offset, len(frame), len(data)))
+        if path.exists():
+            path.unlink()
+
+    def write_text(self, path: Path, txt: str):
+        self.write_bytes(path, txt.encode('utf-8', errors='ignore'))
+
+    def write_file(self, path: Path, src: Path):
+        """ Append a completely written file as new zstd frame (streamed from `src`, which is removed) """
+        frame = io.BytesIO()
+        with open(src, 'rb') as f:
+            size, _ = zstd.ZstdCompressor(level=self.level).copy_stream(f, frame, size=os.fstat(f.fileno()).st_size)
+        with self.lock:
+            pack = self.pack_of(path)
+            pack.parent.mkdir(parents=True, exist_ok=True)
+            with open(pack, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(frame.getbuffer())
+            with self.con:
+                self.con.execute('INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?, ?)',
+                                 (str(path), str(pack), offset, frame.tell(), size))
+        src.unlink()
+        if path.exists():
+            path.unlink()
+
+    def fingerprint(self, path: Path):
+        member = self.member(path)
+        if member is None:
+            return super().fingerprint(path)
+        # packs are append-only, hence the offset changes with every rewrite
+        return member[3], member[1]
+
+    def hash(self, path: Path):
+        frame = self.read_frame(path)
+        if frame is None:
+            return super().hash(path)
+        h = hashlib.sha256()
+        reader = zstd.ZstdDecompressor().stream_reader(io.BytesIO(frame))
+        for chunk in iter(lambda: reader.read(1 << 20), b''):
+            h.update(chunk)
+        return h.hexdigest()
+
+    def compact(self, pack: Path):
+        """ Rewrite pack without superseded frames into the next generation of the quarter pack
+        :param Path pack:
+            Path to current quarter pack
+        :return int:
+            Number of bytes reclaimed
+        """
+        # the new offsets and pack are committed at once and the old pack is only removed afterwards, hence an
+        # interruption leaves at most an unreferenced pack behind (removed by `remove_stale_packs`)
+        quarter = Path(pack.parent, pack.name.split('.')[0])
+        generation = int(pack.suffixes[0][1:]) + 1 if len(pack.suffixes) > 1 else 1
+        path_new = Path(pack.parent, f'{quarter.name}.{generation}.pack')
+        with self.lock:
+            members = self.con.execute('SELECT path, offset, length FROM members WHERE pack = ? ORDER BY offset',
+                                       (str(pack),)).fetchall()
+            size_before = pack.stat().st_size
+            updates = []
+            with open(pack, 'rb') as src, open(path_new, 'wb') as dst:
+                for path, offset, length in members:
+                    src.seek(offset)
+                    updates.append((dst.tell(), str(path_new), path))
+                    dst.write(src.read(length))
+                dst.flush()
+                os.fsync(dst.fileno())
+            with self.con:
+                self.con.executemany('UPDATE members SET offset = ?, pack = ? WHERE path = ?', updates)
+                self.con.execute('INSERT OR REPLACE INTO packs VALUES (?, ?)', (str(quarter), str(path_new)))
+            pack.unlink()
+        return size_before - path_new.stat().st_size
+
+    def remove_stale_packs(self, quarter: Path):
+        """ Remove packs of a quarter directory that are not current (left behind by an interrupted compaction) """
+        with self.lock:
+            current = self.quarter_pack(quarter)
+            for pack in quarter.parent.glob(f'{quarter.name}.*pack'):
+                if pack != current:
+                    pack.unlink()
+
+    def close(self):
+        self.con.close()
+
+
+def get_store(root: Path, backend: str = None):
+    """ Get (cached) store of a form type directory
+    :param Path root:
+        Form type directory (e.g. `output/filings/10-k`)
+    :param str backend:
+        Storage backend (one of: plain, zstd); detected from `root` if not specified
+    :return PlainStore:
+        Store instance
+    """
+    # connections must not be shared with forked worker processes
+    key = (str(root), os.getpid())
+    store = STORES.get(key)
+    if backend is None:
+        if store is not None:
+            return store
+        backend = 'zstd' if Path(root, STORE_DB).exists() else 'plain'
+    if store is None or store.backend != backend:
+        if store is not None:
+            store.close()
+        store = ZstdStore(root) if backend == 'zstd' else PlainStore(root)
+        STORES[key] = store
+    return store
+
+
+def store_for(path: Path):
+    """ Get store holding a filing (addressed as `output/filings/{form_type}/{year}/q{qtr}/{name}`) """
+    return get_store(path.parents[2])
+
+
+def pack_filings(start: int, end: int, form_type: str = '10-k', level: int = 10, keep_files: bool = False):
+    """ Move plain filings and sections into per-quarter zstd packs
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param int level:
+        Zstandard compression level
+    :param bool keep_files:
+        Keep plain text files after packing them
+    """
+    root = Path('output', 'filings', form_type)
+    store = get_store(root, 'zstd')
+    store.level = level
+    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+        path_filings_dir = Path(root, str(year), f'q{qtr}')
+        files = [f for f in path_filings_dir.rglob('*.txt')]
+        size_plain = size_packed = 0
+        for f in files:
+            data = f.read_bytes()
+            store.write_bytes(f, data)
+            if keep_files:
+                f.write_bytes(data)
+            size_plain += len(data)
+            size_packed += store.member(f)[2]
+        if files:
+            print(f'Packed {len(files)} files of {year}_q{qtr} into {store.pack_of(files[0])}'
+                  f'\t {size_plain / 2**20:.1f} MB -> {size_packed / 2**20:.1f} MB')
+
+
+def compact_filings(start: int, end: int, form_type: str = '10-k'):
+    """ Reclaim space of superseded frames (e.g. raw filings replaced by cleaned filings) in quarter packs
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    """
+    root = Path('output', 'filings', form_type)
+    store = get_store(root)
+    if store.backend != 'zstd':
+        print(f'No packed filings found in {root}!')
+        return
+    for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
+        quarter = Path(root, str(year), f'q{qtr}')
+        store.remove_stale_packs(quarter)
+        pack = store.quarter_pack(quarter)
+        if pack.exists():
+            print(f'Compacted {pack}\t {store.compact(pack) / 2**20:.1f} MB reclaimed')
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    if args['pack-filings']:
+        pack_filings(int(args['--start']), int(args['--end']), args['--form-type'], int(args['--level']),
+                     args['--keep-files'])
+    elif args['compact-filings']:
+        compact_filings(int(args['--start']), int(args['--end']), args['--form-type'])
@@ -5,7 +5,8 @@
 
 Usage:
     edgar_utils.py sample-filings [--start=INT] [--end=INT] [--form-type=STR] [--section-type=STR] [-N=INT | --no-of-filings=INT] [--seed=INT]
-    edgar_utils.py gather-sections [--form-type=STR] [--section-type=STR] [--min-sec-length=INT]
+    edgar_utils.py gather-sections [--form-type=STR] [--section-type=STR] [--min-sec-length=INT] [--dedup]
+    edgar_utils.py gather-shards [--start=INT] [--end=INT] [--form-type=STR] [--section-type=STR] [--min-sec-length=INT] [--shard-size=INT] [--compression=STR] [--workers=INT] [--dedup]
 
 Options:
     -h, --help
@@ -16,20 +17,33 @@ Options:
     -N=INT, --no-of-filings=INT     Number of filings to be sampled per quarter [default: 10].
     --seed=INT                      Random seed for sampling [default: 2020].
     --min-sec-length=INT            Minimum length of section in characters [default: 2500].
+    --shard-size=INT                Maximum (uncompressed) size of a shard in MB [default: 256].
+    --compression=STR               Shard compression (one of: zstd, none) [default: zstd].
+    --workers=INT                   Number of worker processes [default: 1].
+    --dedup                         Skip near-duplicate sections (see `edgar_dedup.py dedup-sections`).
 
 """
 
 
 # standard libraries
 import csv
+import functools
 import itertools
-import shutil
+import json
 import random
+import sqlite3
 from pathlib import Path
 
 # third libraries
 from docopt import docopt
 
+# local modules
+import dedup
+import indexing
+import parsing
+import section_index
+import storage
+
 
 def sample_filings(start: int, end: int,
                    form_type: str = '10-k',
@@ -61,33 +75,36 @@ def sample_filings(start: int, end: int,
             w = csv.DictWriter(f, ['id', 'year', 'quarter', 'file_name'], delimiter=';', lineterminator='\n')
             w.writeheader()
 
+    store = storage.get_store(Path('output', 'filings', form_type))
+    scon = section_index.connect(form_type)
     for year, qtr in itertools.product(range(start, end + 1), range(1, 4 + 1)):
-        path_filings_dir = Path('output', 'filings', form_type, str(year), f'q{qtr}')
-        filings = [f.name for f in path_filings_dir.rglob('*.txt') if '_' not in f.stem]
+        rows = section_index.select(scon, section_type, year, year, qtr)
         try:
-            f_samples = random.sample(filings, n)
+            f_samples = random.sample(rows, n)
 
             with path_sample_csv.open('a', encoding='utf-8') as f:
                 w = csv.DictWriter(f, ['id', 'year', 'quarter', 'file_name'], delimiter=';', lineterminator='\n')
 
-                for s in f_samples:
-                    w.writerow({'year': year, 'quarter': qtr, 'file_name': s})
-                    shutil.copy(
-                        Path('output', 'filings', form_type, str(year), f'q{qtr}', s),
-                        Path(path_sample, s)
-                    )
-                    shutil.copy(
-                        Path('output', 'filings', form_type, str(year), f'q{qtr}', s.replace('.txt', f'_{section_type}.txt')),
-                        Path(path_sample, s.replace('.txt', f'_{section_type}.txt'))
-                    )
+                for row in f_samples:
+                    path_filing = Path(row['path'])
+                    w.writerow({'year': year, 'quarter': qtr, 'file_name': path_filing.name})
+                    # samples are written as plain text files for manual validation (with their filing if kept)
+                    txt = None
+                    if row['section_path'] is None:
+                        txt = store.read_text(path_filing)
+                        Path(path_sample, path_filing.name).write_text(txt, encoding='utf-8')
+                    Path(path_sample, f'{path_filing.stem}_{section_type}.txt').write_text(
+                        section_index.read_section(row, txt), encoding='utf-8')
         except Exception as e:
             print(type(e).__name__, e)
             break
+    scon.close()
 
 
 def gather_sections(form_type: str = '10-k',
                     section_type: str = 'mda',
-                    min_sec_length: int = 2_500):
+                    min_sec_length: int = 2_500,
+                    skip_duplicates: bool = False):
     """ Gather all filings in one large `.txt` file as corpus with each filing delimited by a new-line
     :param str form_type:
         Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
@@ -95,16 +112,166 @@ def gather_sections(form_type: str = '10-k',
         Section type (one of: mda, item1)
     :param int min_sec_length:
         Minimum length of section in characters
+    :param bool skip_duplicates:
+        Only gather the representative of each cluster of near-duplicate sections (see `dedup.dedup_sections`)
     """
 
-    path_filings_dir = Path('output', 'filings', form_type)
     path_filings_pooled = Path('output', 'filings', form_type, f'all_{section_type}.txt')
 
-    for path in path_filings_dir.rglob(f'*_{section_type}.txt'):
-        txt = path.read_text(encoding='utf-8', errors='ignore')
-        if len(txt) > min_sec_length:
-            with path_filings_pooled.open('a', encoding='utf-8', errors='ignore') as f:
-                f.write(txt + '\n')
+    # the corpus is rewritten on every run (sections in path order), hence reruns do not duplicate documents
+    scon = section_index.connect(form_type)
+    rows = section_index.select(scon, section_type, min_length=min_sec_length)
+    scon.close()
+    if skip_duplicates:
+        rows = skip_duplicate_rows(rows, section_type, form_type)
+    with path_filings_pooled.open('w', encoding='utf-8', errors='ignore') as f:
+        for row in rows:
+            f.write(section_index.read_section(row) + '\n')
+
+
+class ShardWriter:
+    """ Write JSON lines into size-bounded, optionally zstd-compressed shards """
+
+    def __init__(self, path_dir: Path, prefix: str, shard_size: int, compression: str = 'zstd'):
+        if compression == 'zstd' and storage.zstd is None:
+            raise ImportError('Compressed shards require the `zstandard` package.')
+        self.path_dir = path_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.compression = compression
+        self.suffix = '.jsonl.zst' if compression == 'zstd' else '.jsonl'
+        self.paths = []
+        self.f = None
+        self.size = 0
+
+    def write(self, record: dict):
+        data = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        if self.f is None or (self.size and self.size + len(data) > self.shard_size):
+            self.next_shard()
+        self.f.write(data)
+        self.size += len(data)
+
+    def next_shard(self):
+        self.close()
+        # shards are written under a temporary name and only replace the previous shards once complete
+        path = Path(self.path_dir, f'{self.prefix}-{len(self.paths):05d}{self.suffix}.tmp')
+        self.paths.append(path)
+        f = path.open('wb')
+        self.f = storage.zstd.ZstdCompressor(level=10).stream_writer(f) if self.compression == 'zstd' else f
+        self.size = 0
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def commit(self):
+        """ Replace previous shards of the prefix with the written shards
+        :return list:
+            Paths to shards
+        """
+        self.close()
+        # new shards replace old ones of the same name atomically, then only stale shards are removed
+        paths = [path.replace(path.with_suffix('')) for path in self.paths]
+        for suffix in ('.jsonl', '.jsonl.zst'):
+            for path in self.path_dir.glob(f'{self.prefix}-*{suffix}'):
+                if path not in paths:
+                    path.unlink()
+        return paths
+
+
+def skip_duplicate_rows(rows: list, section_type: str, form_type: str, year: int = None, qtr: int = None):
+    """ Drop section index rows of near-duplicates (sections not yet deduplicated are kept) """
+    dcon = dedup.connect()
+    duplicates = dedup.duplicate_paths(dcon, section_type, form_type, year, qtr)
+    dcon.close()
+    return [row for row in rows if row['path'] not in duplicates]
+
+
+def gather_quarter(quarter: tuple, form_type: str = '10-k', section_type: str = 'mda', min_sec_length: int = 2_500,
+                   shard_size: int = 256 * 2**20, compression: str = 'zstd', skip_duplicates: bool = False):
+    """ Write sections of a single quarter into shards (in accession order)
+    :param tuple quarter:
+        Pair of year and quarter
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param str section_type:
+        Section type (one of: mda, item1)
+    :param int min_sec_length:
+        Minimum length of section in characters
+    :param int shard_size:
+        Maximum (uncompressed) size of a shard in bytes
+    :param str compression:
+        Shard compression (one of: zstd, none)
+    :param bool skip_duplicates:
+        Only gather the representative of each cluster of near-duplicate sections
+    :return tuple:
+        Number of documents, number of characters and shard paths
+    """
+    year, qtr = quarter
+    path_shards_dir = Path('output', 'corpus', form_type, section_type)
+    path_shards_dir.mkdir(parents=True, exist_ok=True)
+
+    scon = section_index.connect(form_type)
+    rows = section_index.select(scon, section_type, year, year, qtr, min_sec_length)
+    scon.close()
+    if rows and skip_duplicates:
+        rows = skip_duplicate_rows(rows, section_type, form_type, year, qtr)
+    ciks = {}
+    if rows and indexing.PATH_INDEX_DB.exists():
+        con = sqlite3.connect(indexing.PATH_INDEX_DB)
+        ciks = dict(con.execute('SELECT accession, cik FROM filings WHERE year = ? AND qtr = ?', (year, qtr)))
+        con.close()
+
+    writer = ShardWriter(path_shards_dir, f'{year}_q{qtr}', shard_size, compression)
+    n_docs = n_chars = 0
+    for row in rows:
+        txt = section_index.read_section(row)
+        accession = row['accession']
+        writer.write({'accession': accession, 'cik': ciks.get(accession), 'year': year, 'qtr': qtr,
+                      'form_type': form_type, 'section': section_type, 'length': len(txt), 'text': txt})
+        n_docs += 1
+        n_chars += len(txt)
+    return n_docs, n_chars, writer.commit()
+
+
+def gather_shards(start: int, end: int,
+                  form_type: str = '10-k',
+                  section_type: str = 'mda',
+                  min_sec_length: int = 2_500,
+                  shard_size: int = 256,
+                  compression: str = 'zstd',
+                  workers: int = 1,
+                  skip_duplicates: bool = False):
+    """ Gather sections as JSON lines (with accession number, CIK, year, quarter and length) into size-bounded
+    shards per quarter (write to `output/corpus/{form_type}/{section_type}/{year}_q{qtr}-{i}.jsonl.zst`)
+    :param int start:
+        Start year
+    :param int end:
+        End year
+    :param str form_type:
+        Form type (one of: 8-k, 10-k, 10-k/a, 10-q, 10-q/a)
+    :param str section_type:
+        Section type (one of: mda, item1)
+    :param int min_sec_length:
+        Minimum length of section in characters
+    :param int shard_size:
+        Maximum (uncompressed) size of a shard in MB
+    :param str compression:
+        Shard compression (one of: zstd, none)
+    :param int workers:
+        Number of worker processes (quarters are gathered in parallel)
+    :param bool skip_duplicates:
+        Only gather the representative of each cluster of near-duplicate sections
+    """
+    quarters = list(itertools.product(range(start, end + 1), range(1, 4 + 1)))
+    func = functools.partial(gather_quarter, form_type=form_type, section_type=section_type,
+                             min_sec_length=min_sec_length, shard_size=shard_size * 2**20, compression=compression,
+                             skip_duplicates=skip_duplicates)
+    for (year, qtr), (n_docs, n_chars, shards) in parsing.map_filings(func, quarters, workers):
+        if shards:
+            print(f'{year}_q{qtr}: {n_docs} sections ({n_chars / 2**20:.1f} M chars) written to {len(shards)} shard(s) '
+                  f'in {shards[0].parent}')
 
 
 if __name__ == '__main__':
@@ -112,4 +279,8 @@ if __name__ == '__main__':
     if args['sample-filings']:
         sample_filings(int(args['--start']), int(args['--end']), args['--form-type'], args['--section-type'], int(args['--no-of-filings']))
     elif args['gather-sections']:
-        gather_sections(args['--form-type'], args['--section-type'], int(args['--min-sec-length']))
+        gather_sections(args['--form-type'], args['--section-type'], int(args['--min-sec-length']), args['--dedup'])
+    elif args['gather-shards']:
+        gather_shards(int(args['--start']), int(args['--end']), args['--form-type'], args['--section-type'],
+                      int(args['--min-sec-length']), int(args['--shard-size']), args['--compression'],
+                      int(args['--workers']), args['--dedup'])
@@ -0,0 +1,59 @@
+import http.server
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """ Local HTTP server replaying scripted responses per path (the last response of a path is repeated) """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.routes = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def route(self, path: str, *responses):
+        """ Script responses `(status, headers, body)` of `path` """
+        self.routes[path] = list(responses)
+
+    def hits(self, path: str):
+        return [r for r in self.requests if r['path'] == path]
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append({'path': self.path, 'headers': dict(self.headers), 'time': time.monotonic()})
+        responses = self.server.routes.get(self.path, [(404, {}, b'')])
+        status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,70 @@
+import random
+from pathlib import Path
+
+import pytest
+
+import benchmark
+import parsing
+
+
+def raw_filing(html, *exhibits):
+    docs = ''.join(f'<DOCUMENT>\n<TYPE>{t}\n<SEQUENCE>{i}\n<TEXT>\n{body}\n</TEXT>\n</DOCUMENT>\n'
+                   for i, (t, body) in enumerate(exhibits, start=2))
+    return ('<SEC-DOCUMENT>0001000000-20-000001.txt : 20200214\n<SEC-HEADER>0001000000-20-000001.hdr.sgml : 20200214\n'
+            'ACCESSION NUMBER:\t\t0001000000-20-000001\nCONFORMED SUBMISSION TYPE:\t10-K\n</SEC-HEADER>\n'
+            f'<DOCUMENT>\n<TYPE>10-K\n<SEQUENCE>1\n<TEXT>\n{html}\n</TEXT>\n</DOCUMENT>\n{docs}</SEC-DOCUMENT>\n')
+
+
+FIXTURES = {
+    'paragraphs': '<html><body><p>Item 7. Management&#8217;s Discussion</p><p>Sales rose.</p></body></html>',
+    'entities': '<p>Smith &amp; Sons&nbsp;Inc. &#x2014; AT&amp;T &quot;quoted&quot; &lt;3 &copy; 2020</p>',
+    'inline_markup': '<P ALIGN="center"><B>ITEM 1.</B> <FONT SIZE=2><I>Business</I></FONT></P><BR><DIV>text</DIV>',
+    'number_table': '<p>Before</p><table><tr><td>2020</td><td>1,234</td></tr><tr><td>2019</td><td>987</td></tr>'
+                    '</table><p>After</p>',
+    'text_table': '<p>Before</p><TABLE><TR><TD>Our segments are described below in words only.</TD></TR></TABLE>'
+                  '<p>After</p>',
+    'whitespace': '<p>one</p>\n\n\n\n<p>two</p>\xa0\xa0<p>three​four</p>\n \n \n<p>five</p>',
+    'comments': '<!-- generated by a tool --><p>visible</p><!--\nmultiline\n-->\n<p>also visible</p>',
+    'plain_text': 'ITEM 7. MANAGEMENT\'S DISCUSSION AND ANALYSIS\n\nRevenue increased by 5%.\n\n\n\nITEM 8.',
+    # a stray `<` swallows the [TABLE] tag of a retained table or runs on after dropped tables
+    'stray_lt_retained_table': 'hdr<<TABLE>\nabc text words\n</TABLE> end',
+    'stray_lt_dropped_tables': '<p>x <!--<TABLE><tr><td>1</td></TABLE><TABLE></TABLE></b> after</p>',
+    'stray_lt_nested_table': '<TABLE><!--<p><TABLE border=1>x&amp;</TABLE> words',
+}
+
+
+@pytest.mark.parametrize('name', FIXTURES)
+def test_engines_clean_fixtures_identically(tmp_path, name):
+    filing = tmp_path / f'{name}.txt'
+    filing.write_text(raw_filing(FIXTURES[name], ('GRAPHIC', 'begin 644 logo.jpg\nM_]C_X``02D9)\nend'),
+                                 ('EX-31.1', '<p>Certification</p>')), encoding='utf-8')
+    results = parsing.compare_task(filing)
+    assert results['regex'][0] == results['tokenizer'][0]
+    # non-text documents are dropped by both engines
+    assert 'logo.jpg' not in results['tokenizer'][0]
+
+
+def test_engines_clean_synthetic_filings_identically(tmp_path):
+    for seed in range(8):
+        filing = tmp_path / f'{seed}.txt'
+        filing.write_text(benchmark.synthetic_filing(random.Random(seed), f'000100000{seed}-20-000001', 1000000 + seed,
+                                                     'SYNTHETIC CORP', '20200214', scale=0.2), encoding='utf-8')
+        results = parsing.compare_task(filing)
+        assert results['regex'][0] == results['tokenizer'][0], seed
+
+
+def test_clean_filings_does_not_clean_changed_cleaned_filings(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    filing = Path('output', 'filings', '10-k', '2020', 'q1', '0001000000-20-000001.txt')
+    filing.parent.mkdir(parents=True)
+    filing.write_text(raw_filing(FIXTURES['text_table']), encoding='utf-8')
+    parsing.clean_filings(2020, 2020)
+    cleaned = filing.read_text(encoding='utf-8')
+    assert '[TABLE]' in cleaned
+
+    # an edited cleaned filing is reported instead of being cleaned a second time
+    filing.write_text(cleaned + '\nEdited.', encoding='utf-8')
+    capsys.readouterr()
+    parsing.clean_filings(2020, 2020)
+    assert filing.read_text(encoding='utf-8') == cleaned + '\nEdited.'
+    assert '1 filings were cleaned with an outdated version or changed' in capsys.readouterr().out
@@ -0,0 +1,52 @@
+import random
+from pathlib import Path
+
+import dedup
+import section_index
+import storage
+
+
+def record_sections(sections):
+    """ Write cleaned filings of `(accession, mda text)` and index their MD&As """
+    store = storage.get_store(Path('output', 'filings', '10-k'), 'plain')
+    scon = section_index.connect('10-k')
+    paths = []
+    for accession, text in sections:
+        path_file = Path(store.root, '2020', 'q1', f'{accession}.txt')
+        store.write_text(path_file, text)
+        section_index.record(scon, path_file, 'mda', (0, len(text), 0), len(text))
+        paths.append(str(path_file))
+    scon.commit()
+    scon.close()
+    return paths
+
+
+def test_rerun_skips_wordless_and_removes_stale_documents(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(0)
+    text = ' '.join(rng.choice(['revenue', 'increased', 'decreased', 'net', 'sales', 'costs', 'due', 'to'])
+                    for _ in range(500))
+    paths = record_sections([('0001000000-20-000001', text), ('0001000000-20-000002', text),
+                             ('0001000000-20-000003', '%% ;; %%')])
+    dedup.dedup_sections(2020, 2020, min_sec_length=0)
+    con = dedup.connect()
+    assert con.execute('SELECT signature FROM docs WHERE path = ?', (paths[2],)).fetchone()[0] == b''
+    assert dedup.duplicate_paths(con, 'mda') == {paths[1]}
+    con.close()
+
+    # word-less documents are not re-read on reruns
+    capsys.readouterr()
+    dedup.dedup_sections(2020, 2020, min_sec_length=0)
+    assert '\n0 documents processed (0 changed and 0 removed' in capsys.readouterr().out
+
+    # documents that are no longer indexed are removed from the store
+    scon = section_index.connect('10-k')
+    with scon:
+        scon.execute('DELETE FROM sections WHERE path = ?', (paths[1],))
+    scon.close()
+    dedup.dedup_sections(2020, 2020, min_sec_length=0)
+    con = dedup.connect()
+    assert dedup.duplicate_paths(con, 'mda') == set()
+    assert {r[0] for r in con.execute('SELECT path FROM docs')} == {paths[0], paths[2]}
+    assert con.execute('SELECT COUNT(*) FROM bands WHERE doc_id NOT IN (SELECT doc_id FROM docs)').fetchone()[0] == 0
+    con.close()
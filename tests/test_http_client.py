@@ -0,0 +1,79 @@
+import gzip
+import time
+
+import pytest
+
+import http_client
+
+
+def test_rate_limiter_throttles_to_rate():
+    limiter = http_client.RateLimiter(rate=10)
+    t0 = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    # the first token is available at once, each further one after 1 / rate seconds
+    assert time.monotonic() - t0 == pytest.approx(0.5, abs=0.1)
+
+
+def test_rate_limiter_rejects_rate_above_sec_limit():
+    with pytest.raises(ValueError):
+        http_client.RateLimiter(rate=http_client.SEC_MAX_RATE + 1)
+
+
+def test_retry_after():
+    assert http_client.retry_after('2') == 2.0
+    assert http_client.retry_after('') is None
+    assert http_client.retry_after('soon') is None
+    assert http_client.retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_client_respects_rate_limit(stub_server):
+    stub_server.route('/index', (200, {}, b'ok'))
+    client = http_client.EdgarClient('test test@example.com', rate=5)
+    for _ in range(4):
+        assert client.get(stub_server.url + '/index') == b'ok'
+    times = [r['time'] for r in stub_server.hits('/index')]
+    assert times[-1] - times[0] >= 3 / 5 - 0.05
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_client_retries_with_retry_after(stub_server, status):
+    stub_server.route('/filing', (status, {'Retry-After': '0.3'}, b''), (status, {'Retry-After': '0.3'}, b''),
+                      (200, {}, b'filing'))
+    retries = []
+    client = http_client.EdgarClient('test test@example.com', backoff=0.01)
+    body = client.get(stub_server.url + '/filing', on_retry=lambda attempt, error, delay: retries.append(delay))
+    assert body == b'filing'
+    assert len(stub_server.hits('/filing')) == 3
+    # the server hint floors the (jittered) exponential backoff
+    assert retries == [pytest.approx(0.3), pytest.approx(0.3)]
+    times = [r['time'] for r in stub_server.hits('/filing')]
+    assert times[1] - times[0] >= 0.29 and times[2] - times[1] >= 0.29
+
+
+def test_client_gives_up_after_max_retries(stub_server):
+    stub_server.route('/filing', (503, {}, b''))
+    client = http_client.EdgarClient('test test@example.com', max_retries=2, backoff=0.01)
+    with pytest.raises(http_client.HTTPStatusError) as e:
+        client.get(stub_server.url + '/filing')
+    assert e.value.status == 503
+    assert len(stub_server.hits('/filing')) == 3
+
+
+def test_client_does_not_retry_client_errors(stub_server):
+    stub_server.route('/missing', (404, {}, b''))
+    client = http_client.EdgarClient('test test@example.com', backoff=0.01)
+    with pytest.raises(http_client.HTTPStatusError):
+        client.get(stub_server.url + '/missing')
+    assert len(stub_server.hits('/missing')) == 1
+
+
+def test_client_sends_user_agent_and_decodes_gzip(stub_server, tmp_path):
+    stub_server.route('/filing', (200, {'Content-Encoding': 'gzip'}, gzip.compress(b'x' * 100_000)))
+    client = http_client.EdgarClient('test test@example.com')
+    assert client.get(stub_server.url + '/filing') == b'x' * 100_000
+    headers, received, written = client.download(stub_server.url + '/filing', tmp_path / 'filing.txt',
+                                                  chunk_size=1024)
+    assert written == 100_000 and received < written
+    assert (tmp_path / 'filing.txt').read_bytes() == b'x' * 100_000
+    assert stub_server.hits('/filing')[0]['headers']['User-Agent'] == 'test test@example.com'
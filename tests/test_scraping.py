@@ -0,0 +1,197 @@
+import datetime as dt
+import gzip
+import random
+from pathlib import Path
+
+import pandas as pd
+
+import benchmark
+import dedup
+import http_client
+import indexing
+import journal
+import parsing
+import scraping
+import search
+import storage
+import utils
+
+
+def write_index(year, qtr, lines):
+    path = indexing.index_path(year, qtr)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(gzip.compress('\n'.join(lines).encode('utf-8')))
+
+
+def test_count_filings_flags_partial_years(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_index(2019, 1, ['1000|A|10-K|2019-02-01|edgar/data/1000/0001000-19-000001.txt'])
+    write_index(2019, 2, ['1001|B|10-K|2019-05-01|edgar/data/1001/0001001-19-000001.txt',
+                          '1002|C|10-Q|2019-05-01|edgar/data/1002/0001002-19-000001.txt'])
+    con = indexing.connect()
+    # q1 was fetched after its index was final, q2 while the quarter was still open
+    indexing.ingest_quarter(con, 2019, 1)
+    indexing.ingest_quarter(con, 2019, 2)
+    con.execute("INSERT INTO index_files VALUES (2019, 1, NULL, NULL, '2019-06-01 00:00:00')")
+    con.execute("INSERT INTO index_files VALUES (2019, 2, NULL, NULL, '2019-05-02 00:00:00')")
+    con.commit()
+    con.close()
+
+    scraping.count_filings(2019, 2019, '10-k')
+    counts = pd.read_csv(tmp_path / 'output' / 'counts_10-k.csv', sep=';', index_col=0)
+    assert counts[['year', 'quarter', 'no_of_filings']].values.tolist() == [[2019, 1, 1], [2019, 2, 1]]
+    assert counts['complete'].tolist() == [True, False]
+
+
+def test_process_quarter_resume_does_not_duplicate_metadata(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = storage.get_store(Path('output', 'filings', '10-k'), 'plain')
+    path_file = Path(store.root, '2020', 'q1', '0001000000-20-000001.txt')
+    store.write_text(path_file, benchmark.synthetic_filing(random.Random(0), '0001000000-20-000001', 1000000,
+                                                           'ACME CORP', '20200214', scale=0.05))
+    path_meta = Path('output', 'filings', '10-k', 'metadata.csv')
+    path_log = Path('output', 'filings', '10-k', 'log_download.txt')
+    con = indexing.connect()
+    jcon = journal.connect('10-k')
+    journal.enqueue(jcon, [('0001000000-20-000001', 'url', str(path_file), 2020, 1, 1, journal.WRITTEN)])
+
+    # interrupted after the metadata row was appended but before the job was marked as done
+    scraping.metadata_fnames(path_meta)
+    scraping.write_metadata(con, path_meta, [scraping.metadata_row(scraping.metadata_task(path_file), path_file)])
+    scraping.process_quarter(jcon, con, None, store, 2020, 1, path_log, path_meta)
+
+    assert scraping.metadata_fnames(path_meta) == {path_file.name}
+    assert len(pd.read_csv(path_meta, sep=';')) == 1
+    assert journal.jobs(jcon, ['0001000000-20-000001'])[0]['state'] == journal.METADATA_DONE
+
+
+def test_download_index_revalidates_with_conditional_requests(tmp_path, monkeypatch, stub_server):
+    monkeypatch.chdir(tmp_path)
+    body = gzip.compress(b'1000|A|10-K|2020-02-01|edgar/data/1000/0001000-20-000001.txt\n')
+    validators = {'ETag': '"v1"', 'Last-Modified': 'Sat, 04 Apr 2020 00:00:00 GMT'}
+    stub_server.route('/edgar/full-index/2020/QTR1/master.gz', (200, validators, body), (304, validators, b''))
+
+    scraping.download_index('test test@example.com', 2020, 2020, edgar_url=stub_server.url)
+    path_ind = indexing.index_path(2020, 1)
+    assert path_ind.read_bytes() == body
+    con = indexing.connect()
+    etag, last_modified, fetched = indexing.index_file(con, 2020, 1)
+    assert (etag, last_modified) == ('"v1"', 'Sat, 04 Apr 2020 00:00:00 GMT')
+    assert indexing.n_rows(con, 2020, 1) == 1
+
+    # closed quarters fetched after their index was final are not requested again unless refreshed
+    scraping.download_index('test test@example.com', 2020, 2020, edgar_url=stub_server.url)
+    assert len(stub_server.hits('/edgar/full-index/2020/QTR1/master.gz')) == 1
+
+    mtime = path_ind.stat().st_mtime_ns
+    scraping.download_index('test test@example.com', 2020, 2020, refresh=True, edgar_url=stub_server.url)
+    request = stub_server.hits('/edgar/full-index/2020/QTR1/master.gz')[-1]
+    assert request['headers']['If-None-Match'] == '"v1"'
+    assert request['headers']['If-Modified-Since'] == 'Sat, 04 Apr 2020 00:00:00 GMT'
+    # 304 Not Modified leaves the index file and the store untouched
+    assert path_ind.read_bytes() == body and path_ind.stat().st_mtime_ns == mtime
+    assert indexing.n_rows(con, 2020, 1) == 1
+    assert indexing.index_file(con, 2020, 1)[:2] == ('"v1"', 'Sat, 04 Apr 2020 00:00:00 GMT')
+    assert indexing.index_file(con, 2020, 1)[2] >= fetched
+    con.close()
+
+
+def test_sync_keeps_watermark_before_failed_downloads(tmp_path, monkeypatch, stub_server):
+    monkeypatch.chdir(tmp_path)
+    today = dt.date.today()
+    qtr = (today.month - 1) // 3 + 1
+    accessions = [f'000100000{i}-{today:%y}-000001' for i in range(2)]
+    stub_server.route(f'/edgar/daily-index/{today.year}/QTR{qtr}/master.{today:%Y%m%d}.idx',
+                      (200, {}, ''.join(f'100000{i}|CORP {i}|10-K|{today:%Y%m%d}|edgar/data/100000{i}/{a}.txt\n'
+                                        for i, a in enumerate(accessions)).encode('utf-8')))
+    filings = [benchmark.synthetic_filing(random.Random(i), a, 1000000 + i, f'CORP {i}', f'{today:%Y%m%d}',
+                                          scale=0.05).encode('utf-8') for i, a in enumerate(accessions)]
+    stub_server.route(f'/edgar/data/1000000/{accessions[0]}.txt', (200, {}, filings[0]))
+    stub_server.route(f'/edgar/data/1000001/{accessions[1]}.txt', (404, {}, b''))
+
+    scraping.sync('test test@example.com', ['10-k'], since=today, edgar_url=stub_server.url)
+    jcon = journal.connect('10-k')
+    assert journal.watermark(jcon) is None
+
+    stub_server.route(f'/edgar/data/1000001/{accessions[1]}.txt', (200, {}, filings[1]))
+    scraping.retry_failed('test test@example.com', today.year, today.year, '10-k', edgar_url=stub_server.url)
+    scraping.sync('test test@example.com', ['10-k'], edgar_url=stub_server.url)
+    assert journal.watermark(jcon) == today.isoformat()
+    # the filing downloaded by `retry-failed` was cleaned by the next sync
+    path_file = Path(journal.jobs(jcon, [accessions[1]])[0]['path'])
+    assert not parsing.is_raw_filing(path_file)
+    jcon.close()
+
+
+def test_fetch_filing_bounds_header_buffer(tmp_path, monkeypatch, stub_server):
+    body = b'<SEC-DOCUMENT>\nCONFORMED SUBMISSION TYPE:\t10-K\n' + b'x' * (4 * 2**20)
+    stub_server.route('/edgar/data/1000/0001000000-20-000001.txt', (200, {}, body))
+    buffered = []
+    header_lines = scraping.header_lines
+    monkeypatch.setattr(scraping, 'header_lines', lambda txt: buffered.append(len(txt)) or header_lines(txt))
+    client = http_client.EdgarClient('test test@example.com')
+    path_file = tmp_path / 'output' / 'filings' / '10-k' / '2020' / 'q1' / '0001000000-20-000001.txt'
+    path_file.parent.mkdir(parents=True)
+
+    meta = scraping.fetch_filing(client, stub_server.url + '/edgar/data/1000/0001000000-20-000001.txt', path_file,
+                                 tmp_path / 'log.txt', stub_server.url)
+    # the filing is written as a whole, while only the beginning is buffered to parse the (missing) header end
+    assert path_file.read_bytes() == body
+    assert buffered == [scraping.HEADER_MAX_BYTES]
+    assert meta['form_type'] == '10-K'
+
+
+def serve_filings(stub_server, n=3, year=2020, qtr=1):
+    """ Write an index file of `n` synthetic 10-K filings and serve the filings """
+    lines, accessions = [], []
+    for i in range(n):
+        cik, accession = 1000000 + i, f'{1000000 + i:010d}-{year % 100}-000001'
+        lines.append(f'{cik}|CORP {i}|10-K|{year}-0{qtr * 3 - 2}-15|edgar/data/{cik}/{accession}.txt')
+        body = benchmark.synthetic_filing(random.Random(i), accession, cik, f'CORP {i}', f'{year}0{qtr * 3 - 2}15',
+                                          scale=0.2)
+        stub_server.route(f'/edgar/data/{cik}/{accession}.txt', (200, {}, body.encode('utf-8')))
+        accessions.append(accession)
+    write_index(year, qtr, lines)
+    return accessions
+
+
+def test_pipeline_without_filings_keeps_jobs_for_download(tmp_path, monkeypatch, stub_server):
+    monkeypatch.chdir(tmp_path)
+    accessions = serve_filings(stub_server)
+    scraping.run_pipeline('test test@example.com', 2020, 2020, n=3, edgar_url=stub_server.url)
+    jcon = journal.connect('10-k')
+    jobs = journal.jobs(jcon, accessions)
+    assert {job['state'] for job in jobs} == {journal.PROCESSED}
+    assert not any(Path(job['path']).exists() for job in jobs)
+    assert len(pd.read_csv(Path('output', 'filings', '10-k', 'metadata.csv'), sep=';')) == 3
+
+    scraping.download_filings('test test@example.com', 2020, 2020, n=3, edgar_url=stub_server.url)
+    jobs = journal.jobs(jcon, accessions)
+    assert {job['state'] for job in jobs} == {journal.METADATA_DONE}
+    assert all(Path(job['path']).exists() for job in jobs)
+    # metadata of the pipeline run is not appended again
+    assert len(pd.read_csv(Path('output', 'filings', '10-k', 'metadata.csv'), sep=';')) == 3
+    jcon.close()
+
+
+def test_pipeline_sections_are_gathered_without_cleaned_filings(tmp_path, monkeypatch, stub_server):
+    monkeypatch.chdir(tmp_path)
+    accessions = serve_filings(stub_server)
+    scraping.run_pipeline('test test@example.com', 2020, 2020, n=3, sections=('mda',), edgar_url=stub_server.url)
+
+    paths = sorted(Path('output', 'filings', '10-k', '2020', 'q1').glob('*_mda.txt'))
+    assert [p.stem for p in paths] == [f'{a}_mda' for a in accessions]
+    sections = [p.read_text(encoding='utf-8') for p in paths]
+    assert all(sections)
+    utils.gather_sections('10-k', 'mda', min_sec_length=0)
+    assert Path('output', 'filings', '10-k', 'all_mda.txt').read_text(encoding='utf-8') == \
+        ''.join(section + '\n' for section in sections)
+
+    search.index_sections('10-k', ('mda',))
+    scon = search.connect('10-k')
+    assert scon.execute('SELECT COUNT(*) FROM docs WHERE live = 1').fetchone()[0] == 3
+    scon.close()
+    dedup.dedup_sections(2020, 2020, min_sec_length=0)
+    dcon = dedup.connect()
+    assert dcon.execute("SELECT COUNT(*) FROM docs WHERE section = 'mda'").fetchone()[0] == 3
+    dcon.close()
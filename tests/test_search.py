@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import search
+import section_index
+import storage
+
+
+def index_filings(filings):
+    """ Write cleaned filings of `(accession, year, {section: text})` and index their sections """
+    store = storage.get_store(Path('output', 'filings', '10-k'), 'plain')
+    scon = section_index.connect('10-k')
+    for accession, year, sections in filings:
+        path_file = Path(store.root, str(year), 'q1', f'{accession}.txt')
+        txt, spans = '', {}
+        for section, text in sections.items():
+            spans[section] = (len(txt), len(txt) + len(text), 0)
+            txt += text + '\n'
+        store.write_text(path_file, txt)
+        for section, span in spans.items():
+            section_index.record(scon, path_file, section, span, span[1] - span[0])
+    scon.commit()
+    scon.close()
+    search.index_sections('10-k', ('mda', 'item1'))
+
+
+def test_search_only_decodes_postings_of_filtered_sections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    text = 'substantial doubt about the going concern of the company'
+    index_filings([('0001000000-19-000001', 2019, {'mda': text, 'item1': text}),
+                   ('0001000000-20-000001', 2020, {'mda': text, 'item1': text}),
+                   ('0001000000-20-000002', 2020, {'mda': 'the company is a going concern'})])
+    con = search.connect('10-k')
+    allowed = {r[0] for r in con.execute("SELECT doc_id FROM docs WHERE section = 'mda' AND year = 2020")}
+    con.close()
+
+    decoded = set()
+    term_postings = search.term_postings
+
+    def recording_term_postings(*args):
+        postings = term_postings(*args)
+        decoded.update(postings)
+        return postings
+
+    monkeypatch.setattr(search, 'term_postings', recording_term_postings)
+    rows = search.search('"going concern" doubt', start=2020, end=2020)
+    assert [r['accession'] for r in rows] == ['0001000000-20-000001']
+    assert rows[0]['hits'] == 2
+    assert decoded and decoded <= allowed
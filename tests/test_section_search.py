@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+import parsing
+from parsing_patterns import (PAT_10K_MDA1, PAT_10K_MDA1_ANCHORS, PAT_10K_MDA2, PAT_10K_MDA2_ANCHORS,
+                              PAT_10Q_MDA, PAT_10Q_MDA_ANCHORS, PAT_ITEM1, PAT_ITEM1_ANCHORS)
+
+PATTERNS = {
+    '10k_mda1': (PAT_10K_MDA1, PAT_10K_MDA1_ANCHORS),
+    '10k_mda2': (PAT_10K_MDA2, PAT_10K_MDA2_ANCHORS),
+    '10q_mda': (PAT_10Q_MDA, PAT_10Q_MDA_ANCHORS),
+    'item1': (PAT_ITEM1, PAT_ITEM1_ANCHORS),
+}
+
+# headings and referrals that start or end (or look like they start or end) one of the sections
+HEADINGS = [
+    '\nItem 1. Business', '\nITEM 1 - DESCRIPTION OF BUSINESS', '\nPART I\nItem 1. Our Business', '\nItem 1A. Risk Factors',
+    '\nItem 2. Properties', '\nItem 3. Legal Proceedings', '\nItem 6. Selected Financial Data',
+    "\nItem 6. Management's Discussion and Analysis", '\nITEM 6. PLAN OF OPERATION',
+    "\nItem 7. Management's Discussion and Analysis", "\nPART II\nITEM 7. MANAGEMENT'S DISCUSSION",
+    "\nI\nT\nE\nM 7. M\nA\nN\nA\nG\nE\nM\nE\nN\nT'S DISCUSSION", '\nItem 7A. Quantitative and Qualitative',
+    '\nItem 8. Financial Statements', '\nItem 2. Management\'s Discussion and Analysis',
+    '\nPart I\nItem 4. Controls', '\nPART II\nItem 1. Legal Proceedings', '\nsee\nItem 7. Management\'s Discussion',
+    '\n"Item 7. Management\'s Discussion', '\nin\nItem 8.', '\nItem 5. Other Information',
+]
+FILLER = ['\nThe Company sells widgets.', '\nRevenue increased by 5%.', ' and', '\n', '\n\n', ' item 7 management']
+
+
+def random_filing(rng):
+    return ''.join(rng.choice(HEADINGS) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(rng.randint(1, 25)))
+
+
+@pytest.mark.parametrize('name', PATTERNS)
+def test_anchor_search_matches_full_pattern(name):
+    pattern, anchors = PATTERNS[name]
+    rng = random.Random(name)
+    n_found = 0
+    for _ in range(300):
+        txt = random_filing(rng)
+        expected = [m.span() for m in pattern.finditer(txt)]
+        assert list(parsing.iter_section_spans(txt, anchors)) == expected, txt
+        n_found += bool(expected)
+    # the fixtures exercise matches, not only their absence
+    assert n_found > 10
+
+
+def test_find_section_keeps_longest_match():
+    txt = ("\nTable of Contents\nItem 7. Management's Discussion and Analysis\nItem 8. Financial Statements"
+           "\nItem 7. Management's Discussion and Analysis\nRevenue increased by 5%.\nItem 8. Financial Statements")
+    start, end, i = parsing.find_section(txt, [PAT_10K_MDA1_ANCHORS, PAT_10K_MDA2_ANCHORS])
+    assert i == 1
+    assert txt[start:end] == max((m.group() for m in PAT_10K_MDA1.finditer(txt)), key=len)
+    assert 'Revenue increased' in txt[start:end]
+    assert parsing.find_section('\nno sections here', [PAT_10K_MDA1_ANCHORS]) == (0, 0, None)
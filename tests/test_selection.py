@@ -0,0 +1,50 @@
+import re
+
+import indexing
+import scraping
+import selection
+
+PAT_10K = re.compile(r'\|10-K\|')
+
+
+def ingest(con, n_ciks=6):
+    rows = [(1000 + i, f'CORP {i}', '10-K', f'2020-0{qtr * 3 - 2}-15', f'edgar/data/{1000 + i}/{1000 + i}-20-{qtr}.txt',
+             f'{1000 + i}-20-{qtr}', 2020, qtr) for qtr in range(1, 5) for i in range(n_ciks)]
+    indexing.append_filings(con, rows)
+    for qtr in range(1, 5):
+        con.execute('INSERT INTO ingested VALUES (2020, ?, ?)', (qtr, n_ciks))
+    con.commit()
+
+
+def test_candidates_filter_ciks_in_sql(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    con = indexing.connect()
+    ingest(con)
+    rows = selection.candidates(con, PAT_10K, 2020, 2020, ciks={1001, 1003, 9999})
+    assert {row['cik'] for row in rows} == {1001, 1003} and len(rows) == 8
+    assert selection.candidates(con, PAT_10K, 2020, 2020, ciks=set()) == []
+    # whitelists beyond the maximum number of query parameters
+    assert len(selection.candidates(con, PAT_10K, 2020, 2020, ciks=set(range(100_000)))) == 24
+    con.close()
+
+
+def test_select_filings_requires_sic_metadata(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    con = indexing.connect()
+    ingest(con)
+    scraping.select_filings(2020, 2020, strata=('quarter', 'sic'))
+    assert 'No SIC codes known' in capsys.readouterr().out
+    assert not selection.selection_path('10-k', 2020, 2020).exists()
+
+    meta = dict.fromkeys(indexing.METADATA_COLUMNS, '')
+    indexing.upsert_metadata(con, [{**meta, 'accession': '1000-20-1', 'cik': '0000001000', 'sic': '2834',
+                                    'date_filing': '20200115'}])
+    scraping.select_filings(2020, 2020, n=100, strata=('sic',))
+    assert '20 of 24 filings have no known SIC code' in capsys.readouterr().out
+    strata = {row['stratum'] for row in selection.read_selection(selection.selection_path('10-k', 2020, 2020))}
+    assert strata == {'sic=28', 'sic=unknown'}
+
+    scraping.select_filings(2020, 2020, n=100, sics=['28'])
+    assert 'only known for the 1 CIKs' in capsys.readouterr().out
+    assert {row['cik'] for row in selection.read_selection(selection.selection_path('10-k', 2020, 2020))} == {'1000'}
+    con.close()
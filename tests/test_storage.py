@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import storage
+
+
+def test_zstd_store_compacts_superseded_frames(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, 'STORES', {})
+    root = Path('output', 'filings', '10-k')
+    store = storage.get_store(root, 'zstd')
+    paths = [Path(root, '2020', 'q1', f'0001000000-20-00000{i}.txt') for i in range(3)]
+    for i, path in enumerate(paths):
+        store.write_text(path, f'raw filing {i} ' * 1000)
+    store.write_text(paths[1], 'cleaned filing 1 ' * 500)
+    pack = store.pack_of(paths[0])
+    assert pack == Path(root, '2020', 'q1.pack')
+
+    # an interrupted compaction leaves an unreferenced pack behind
+    Path(root, '2020', 'q1.1.pack').write_bytes(b'partial')
+    storage.compact_filings(2020, 2020)
+    compacted = store.pack_of(paths[0])
+    assert compacted == Path(root, '2020', 'q1.1.pack') and not pack.exists()
+    assert compacted.stat().st_size == sum(store.member(p)[2] for p in paths)
+    assert store.read_text(paths[0]) == 'raw filing 0 ' * 1000
+    assert store.read_text(paths[1]) == 'cleaned filing 1 ' * 500
+    assert store.read_text(paths[2]) == 'raw filing 2 ' * 1000
+
+    # later writes are appended to the current pack and survive the next compaction
+    store.write_text(paths[2], 'cleaned filing 2 ' * 500)
+    assert store.pack_of(paths[2]) == compacted
+    storage.compact_filings(2020, 2020)
+    assert [p.name for p in Path(root, '2020').glob('*.pack')] == ['q1.2.pack']
+    assert store.read_text(paths[2]) == 'cleaned filing 2 ' * 500
+    assert store.read_text(paths[0]) == 'raw filing 0 ' * 1000
+
+    # the store is detected from the offset index of a fresh process
+    store.close()
+    storage.STORES.clear()
+    store = storage.get_store(root)
+    assert store.backend == 'zstd' and store.read_text(paths[1]) == 'cleaned filing 1 ' * 500
+    store.close()
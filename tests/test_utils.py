@@ -0,0 +1,25 @@
+import json
+from pathlib import Path
+
+import utils
+
+
+def write_shards(path_dir, prefix, records, shard_size, compression='none'):
+    writer = utils.ShardWriter(path_dir, prefix, shard_size, compression)
+    for record in records:
+        writer.write(record)
+    return writer
+
+
+def test_shard_writer_replaces_previous_shards(tmp_path):
+    records = [{'accession': str(i), 'text': 'x' * 100} for i in range(10)]
+    first = write_shards(tmp_path, '2020_q1', records, 300).commit()
+    assert len(first) == 5
+
+    writer = write_shards(tmp_path, '2020_q1', records[:3], 10_000)
+    # previous shards stay in place until the new shards are complete
+    assert sorted(tmp_path.glob('2020_q1-*.jsonl')) == first
+    second = writer.commit()
+    assert second == [Path(tmp_path, '2020_q1-00000.jsonl')]
+    assert sorted(tmp_path.glob('2020_q1-*')) == second
+    assert [json.loads(line) for line in second[0].read_text().splitlines()] == records[:3]